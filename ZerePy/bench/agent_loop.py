@@ -0,0 +1,123 @@
+"""
+Loop iterations per second for the blocking and the asyncio agent runtimes.
+
+Every iteration is a full ReAct episode: two generate-text calls on a stub provider
+and one `bench-io` action, each with a configurable sleep standing in for network time.
+The asyncio runtime only pays off with several lanes (max_concurrent_actions) per agent,
+with --lanes 1 both runtimes run one iteration at a time and the threads come out ahead.
+
+    poetry run python -m bench.agent_loop --agents 20 --duration 10
+"""
+import argparse
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.action_handler import register_action
+from src.agent import ZerePyAgent
+from bench.stubs import make_agent_dir, agent_definition, attach_stub_llm
+
+IO_LATENCY = 0.05
+
+
+def register_bench_action(async_handler: bool) -> None:
+    if async_handler:
+        @register_action("bench-io")
+        async def bench_io(agent, **kwargs):
+            await asyncio.sleep(IO_LATENCY)
+            return "ok"
+    else:
+        @register_action("bench-io")
+        def bench_io(agent, **kwargs):
+            time.sleep(IO_LATENCY)
+            return "ok"
+
+
+def build_agents(count: int, llm_latency: float, lanes: int):
+    names = [f"bench_agent_{i}" for i in range(count)]
+    make_agent_dir({
+        name: agent_definition(f"BenchAgent{i}", max_concurrent_actions=lanes)
+        for i, name in enumerate(names)
+    })
+    agents = []
+    for name in names:
+        agent = ZerePyAgent(name)
+        attach_stub_llm(agent, llm_latency)
+        agent._setup_llm_provider()
+        agents.append(agent)
+    return agents
+
+
+def run_threads(agents, duration: float) -> int:
+    """Baseline: one blocking thread per agent, like one main.py process each"""
+    stop = threading.Event()
+    counts = [0] * len(agents)
+
+    def worker(index, agent):
+        system_prompt = agent._loop_system_prompt()
+        while not stop.is_set():
+            agent._run_iteration(system_prompt)
+            counts[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(i, a), daemon=True) for i, a in enumerate(agents)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts)
+
+
+async def run_async(agents, duration: float, executor_threads: int) -> int:
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=executor_threads))
+    counts = [0] * len(agents)
+
+    async def lane(index, agent):
+        system_prompt = agent._loop_system_prompt()
+        while True:
+            await agent._arun_iteration(system_prompt)
+            counts[index] += 1
+
+    tasks = []
+    for index, agent in enumerate(agents):
+        tasks.extend(asyncio.create_task(lane(index, agent)) for _ in range(agent.max_concurrent_actions))
+    await asyncio.sleep(duration)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return sum(counts)
+
+
+def main():
+    global IO_LATENCY
+    parser = argparse.ArgumentParser(description="Benchmark agent loop iterations per second")
+    parser.add_argument("--agents", type=int, default=10)
+    parser.add_argument("--lanes", type=int, default=4, help="max_concurrent_actions per agent")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--io-latency", type=float, default=0.05)
+    parser.add_argument("--executor-threads", type=int, default=64)
+    parser.add_argument("--async-handlers", action="store_true",
+                        help="Register bench-io as an async handler instead of a sync one")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    IO_LATENCY = args.io_latency
+    register_bench_action(args.async_handlers)
+    agents = build_agents(args.agents, args.llm_latency, args.lanes)
+
+    threaded = run_threads(agents, args.duration)
+    asynced = asyncio.run(run_async(agents, args.duration, args.executor_threads))
+
+    print(f"agents={args.agents} lanes={args.lanes} llm={args.llm_latency}s io={args.io_latency}s")
+    print(f"thread-per-agent : {threaded / args.duration:8.2f} iterations/s ({args.agents} threads)")
+    print(f"asyncio runtime  : {asynced / args.duration:8.2f} iterations/s (1 event loop, "
+          f"{args.executor_threads} executor threads)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,938 @@
+"""
+Local stand-ins for the external services ZerePy talks to, for offline benchmarks.
+
+Every service is a small threaded HTTP server on 127.0.0.1 with a configurable latency,
+jitter and error rate. redirect_hosts() sends requests, httpx and urllib3 traffic for the
+real hostnames to the fakes, so connections with hard-coded URLs need no changes, and
+FakeServices.env() points the rest (OpenAI, Supabase, the deploy API) at them.
+
+Run them on their own to try an agent against them by hand:
+
+    poetry run python -m bench.fakes --latency openai=0.3 --error-rate twitter=0.05
+"""
+import argparse
+import hashlib
+import inspect
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit, urlunsplit
+from urllib.request import Request, urlopen
+
+BOT_ID = "1100000000000000001"
+BOT_USERNAME = "zerepy-bench"
+TWITTER_USER_ID = "1200000000000000001"
+TOKEN_ADDRESS = "0x" + "ab" * 20
+ROUTER_ADDRESS = "0x6131B5fae19EA4f9D964eAc0408E4408b66337b5"
+# First Hardhat development account, never holds real funds
+EVM_PRIVATE_KEY = "0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80"
+
+
+@dataclass
+class Faults:
+    """Latency and errors a fake injects into every request.
+
+    latency is the median in seconds, jitter the sigma of a log-normal around it.
+    error_rate requests fail with error_status, 429s carry a Retry-After header.
+    """
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 500
+    seed: int = 0
+
+
+@dataclass
+class FakeRequest:
+    method: str
+    path: str
+    query: Dict[str, List[str]]
+    headers: Dict[str, str]
+    body: bytes
+
+    def arg(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        values = self.query.get(name)
+        return values[0] if values else default
+
+    def json(self) -> Any:
+        return json.loads(self.body or b"null")
+
+
+Route = Tuple[str, str, Callable[..., Any]]
+
+
+class FakeService:
+    """One fake API. Subclasses list their routes as (method, path regex, handler), named
+    groups of the regex are passed to the handler as keyword arguments. Handlers return a
+    JSON payload, (status, payload), or a generator of server-sent events."""
+
+    name = "fake"
+    # Real hostnames redirect_hosts() sends to this service
+    hosts: Tuple[str, ...] = ()
+
+    def __init__(self, faults: Optional[Faults] = None):
+        self.faults = faults or Faults()
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(self.faults.seed)
+        self._routes = [(method, re.compile(pattern), handler) for method, pattern, handler in self.routes()]
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def routes(self) -> List[Route]:
+        return []
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self, port: int = 0) -> str:
+        handler = type(f"{type(self).__name__}Handler", (_Handler,), {"service": self})
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name=f"fake-{self.name}", daemon=True).start()
+        return self.url
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"requests": self.requests, "errors": self.errors, "faults": asdict(self.faults)}
+
+    def set_faults(self, faults: Faults) -> None:
+        with self._lock:
+            self.faults = faults
+            self._rng = random.Random(faults.seed)
+
+    def _sample_faults(self) -> Tuple[float, bool]:
+        with self._lock:
+            self.requests += 1
+            faults = self.faults
+            delay = faults.latency
+            if delay and faults.jitter:
+                delay *= self._rng.lognormvariate(0, faults.jitter)
+            failed = self._rng.random() < faults.error_rate
+            if failed:
+                self.errors += 1
+            return delay, failed
+
+    def handle(self, request: FakeRequest) -> Tuple[int, Dict[str, str], Any]:
+        if request.path == "/__fake__/stats":
+            return 200, {}, self.stats()
+        if request.path == "/__fake__/faults" and request.method == "POST":
+            self.set_faults(Faults(**request.json()))
+            return 200, {}, self.stats()
+
+        delay, failed = self._sample_faults()
+        if delay:
+            time.sleep(delay)
+        if failed:
+            status = self.faults.error_status
+            headers = {"Retry-After": "1"} if status == 429 else {}
+            return status, headers, {"error": {"message": f"{self.name}: injected fault", "code": status}}
+
+        for method, pattern, handler in self._routes:
+            match = pattern.fullmatch(request.path)
+            if match and method == request.method:
+                result = handler(request, **match.groupdict())
+                if isinstance(result, tuple):
+                    return result[0], {}, result[1]
+                return 200, {}, result
+        return 404, {}, {"error": {"message": f"{self.name}: no route for {request.method} {request.path}"}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes, without this kept-alive clients wait on delayed ACKs
+    disable_nagle_algorithm = True
+    service: FakeService = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _dispatch(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        url = urlsplit(self.path)
+        request = FakeRequest(self.command, url.path, parse_qs(url.query), dict(self.headers), body)
+        try:
+            status, headers, payload = self.service.handle(request)
+        except Exception as e:
+            status, headers, payload = 500, {}, {"error": {"message": f"{type(e).__name__}: {e}"}}
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if inspect.isgenerator(payload):
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for event in payload:
+                data = f"data: {event}\n\n".encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        data = b"" if payload is None else json.dumps(payload).encode()
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _dispatch
+
+
+def _digest(*parts: Any, length: int = 40) -> str:
+    return hashlib.sha256("/".join(map(str, parts)).encode()).hexdigest()[:length]
+
+
+class OpenAIService(FakeService):
+    """OpenAI compatible chat completions, streamed or not, with token usage.
+
+    ReAct prompts ending in "Thought N:" get a scripted episode: the first step calls
+    the first tool named in the system prompt, the next one finishes. Anything else
+    gets a canned analysis long enough to look like a rug-detect report.
+    """
+
+    name = "openai"
+    hosts = ("api.openai.com",)
+
+    ANSWER = "gm, markets look calm and liquidity is healthy today"
+    ANALYSIS = (
+        "## 1. Token overview\nThe contract has a fixed supply and ownership is renounced. "
+        "## 2. Holder distribution\nThe top ten holders own 38% of the supply, the largest "
+        "wallet is the liquidity pool. ## 3. Transfers\nRecent transfers are small and spread "
+        "over many wallets, there are no large dumps. ## 8. Final verdict\nNo red flags found, "
+        "keep monitoring the top holders. <SCORE>72</SCORE>"
+    )
+
+    def routes(self) -> List[Route]:
+        return [
+            ("GET", r"/v1/models", self.list_models),
+            ("GET", r"/v1/models/(?P<model>.+)", self.get_model),
+            ("POST", r"/v1/chat/completions", self.chat_completion),
+        ]
+
+    def list_models(self, request):
+        return {"object": "list", "data": [self.get_model(request, model) for model in ("gpt-4o-mini", "gpt-4o")]}
+
+    def get_model(self, request, model):
+        return {"id": model, "object": "model", "created": 0, "owned_by": "system"}
+
+    def reply(self, messages: List[Dict[str, Any]]) -> str:
+        system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+        prompt = messages[-1].get("content") or "" if messages else ""
+        step = re.search(r"Thought (\d+):\s*$", prompt)
+        if step:
+            n = int(step.group(1))
+            tool = re.search(r"'name': '([^']+)'", system)
+            if n == 1 and tool:
+                return f" I should use a tool first.\nAction 1: Call[{tool.group(1)}]\nObservation 1:"
+            return f" I have what I need.\nAction {n}: Finish[{self.ANSWER}]"
+        return self.ANALYSIS
+
+    def chat_completion(self, request):
+        body = request.json()
+        messages = body.get("messages") or []
+        text = self.reply(messages)
+        stop = body.get("stop") or []
+        for sequence in [stop] if isinstance(stop, str) else stop:
+            if sequence in text:
+                text = text[:text.index(sequence)]
+        prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(text) // 4,
+                 "total_tokens": prompt_tokens + len(text) // 4, "prompt_tokens_details": {"cached_tokens": 0}}
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()), "model": body.get("model")}
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage")
+            return self._stream(base, text, usage if include_usage else None)
+        return dict(base, object="chat.completion", usage=usage, choices=[{
+            "index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}])
+
+    def _stream(self, base, text: str, usage):
+        chunk = dict(base, object="chat.completion.chunk")
+        for piece in re.findall(r"\s*\S+", text) or [""]:
+            yield json.dumps(dict(chunk, choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}]))
+        yield json.dumps(dict(chunk, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        if usage:
+            yield json.dumps(dict(chunk, choices=[], usage=usage))
+        yield "[DONE]"
+
+
+class TwitterService(FakeService):
+    """Twitter API v2: the authenticated user, mentions, timeline, tweets and likes"""
+
+    name = "twitter"
+    hosts = ("api.twitter.com", "api.x.com")
+
+    def __init__(self, faults: Optional[Faults] = None, mentions: int = 3, timeline: int = 10):
+        super().__init__(faults)
+        self.mentions = mentions
+        self.timeline = timeline
+        self._next_id = 1900000000000000000
+        self._next_mention = 0
+
+    def routes(self) -> List[Route]:
+        return [
+            ("GET", r"/2/users/me", self.me),
+            ("GET", r"/2/users/(?P<user_id>\w+)/mentions", self.user_mentions),
+            ("GET", r"/2/users/(?P<user_id>\w+)/timelines/reverse_chronological", self.home_timeline),
+            ("GET", r"/2/users/(?P<user_id>\w+)/tweets", self.home_timeline),
+            ("GET", r"/2/users/by/username/(?P<username>\w+)", self.user_by_username),
+            ("GET", r"/2/users", self.users_by_id),
+            ("GET", r"/2/tweets/search/recent", self.search),
+            ("POST", r"/2/tweets", self.post_tweet),
+            ("POST", r"/2/users/(?P<user_id>\w+)/likes", self.like),
+        ]
+
+    def _tweet(self, i: int, text: str) -> Dict[str, Any]:
+        return {"id": str(1800000000000000000 + i), "author_id": str(1300000000000000000 + i % 5),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()), "text": text}
+
+    def _users(self, tweets) -> List[Dict[str, str]]:
+        authors = sorted({tweet["author_id"] for tweet in tweets})
+        return [{"id": author, "name": f"Bench User {author[-1]}", "username": f"bench_user_{author[-1]}"}
+                for author in authors]
+
+    def me(self, request):
+        return {"data": {"id": TWITTER_USER_ID, "username": BOT_USERNAME.replace("-", "_"), "name": "ZerePy Bench"}}
+
+    def user_by_username(self, request, username):
+        return {"data": {"id": str(1300000000000000000 + len(username) % 5), "username": username, "name": username}}
+
+    def users_by_id(self, request):
+        ids = [user_id for user_id in request.arg("ids", "").split(",") if user_id]
+        return {"data": [{"id": user_id, "name": f"Bench User {user_id[-1]}", "username": f"bench_user_{user_id[-1]}"}
+                         for user_id in ids]}
+
+    def user_mentions(self, request, user_id):
+        # Every poll finds `mentions` new ones, newer than any since_id handed out before
+        with self._lock:
+            first = self._next_mention
+            self._next_mention += self.mentions
+        tweets = [self._tweet(i, f"@{BOT_USERNAME} deploy a token called Bench{i} with ticker BEN{i}")
+                  for i in reversed(range(first, first + self.mentions))]
+        meta = {"result_count": len(tweets)}
+        if tweets:
+            meta.update(newest_id=tweets[0]["id"], oldest_id=tweets[-1]["id"])
+        return {"data": tweets, "meta": meta}
+
+    def home_timeline(self, request, user_id):
+        count = int(request.arg("max_results", self.timeline))
+        tweets = [self._tweet(i, f"Timeline tweet {i} about on-chain agents") for i in range(count)]
+        return {"data": tweets, "includes": {"users": self._users(tweets)}, "meta": {"result_count": len(tweets)}}
+
+    def search(self, request):
+        tweets = [self._tweet(i, f"Reply {i}") for i in range(int(request.arg("max_results", 10)))]
+        return {"data": tweets, "includes": {"users": self._users(tweets)}, "meta": {"result_count": len(tweets)}}
+
+    def post_tweet(self, request):
+        with self._lock:
+            self._next_id += 1
+            tweet_id = str(self._next_id)
+        return 201, {"data": {"id": tweet_id, "text": request.json().get("text", ""), "edit_history_tweet_ids": [tweet_id]}}
+
+    def like(self, request, user_id):
+        return {"data": {"liked": True}}
+
+
+class DiscordService(FakeService):
+    """Discord REST API v10: the bot user, guild channels, messages, replies and reactions.
+    Every message mentions the bot and asks for an anti-rug check, each read finds new ones."""
+
+    name = "discord"
+    hosts = ("discord.com", "discordapp.com")
+
+    def __init__(self, faults: Optional[Faults] = None, channels: int = 2):
+        super().__init__(faults)
+        self.channels = channels
+        self._next_message = 0
+
+    def routes(self) -> List[Route]:
+        return [
+            ("GET", r"/api/v\d+/users/@me", self.me),
+            ("GET", r"/api/v\d+/guilds/(?P<guild_id>\w+)/channels", self.list_channels),
+            ("GET", r"/api/v\d+/channels/(?P<channel_id>\w+)/messages", self.read_messages),
+            ("POST", r"/api/v\d+/channels/(?P<channel_id>\w+)/messages", self.post_message),
+            ("PUT", r"/api/v\d+/channels/(?P<channel_id>\w+)/messages/(?P<message_id>\w+)/reactions/.+", self.react),
+        ]
+
+    def _user(self, user_id: str, username: str) -> Dict[str, Any]:
+        return {"id": user_id, "username": username, "discriminator": "0", "global_name": username}
+
+    def _message(self, channel_id: str, message_id: str, content: str, mentions: List[Dict[str, Any]]):
+        return {
+            "id": message_id,
+            "channel_id": channel_id,
+            "author": self._user("1400000000000000001", "bench_user"),
+            "content": content,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S.000000+00:00", time.gmtime()),
+            "mentions": mentions,
+        }
+
+    def me(self, request):
+        return dict(self._user(BOT_ID, BOT_USERNAME), bot=True)
+
+    def list_channels(self, request, guild_id):
+        text = [{"id": str(1500000000000000000 + i), "type": 0, "name": f"bench-{i}", "guild_id": guild_id}
+                for i in range(self.channels)]
+        return text + [{"id": "1500000000000000999", "type": 2, "name": "voice", "guild_id": guild_id}]
+
+    def read_messages(self, request, channel_id):
+        # Newer than any id handed out before, so they are all after the reader's cursor
+        count = int(request.arg("limit", 10))
+        with self._lock:
+            first = self._next_message
+            self._next_message += count
+        bot = self._user(BOT_ID, BOT_USERNAME)
+        return [self._message(channel_id, str(1600000000000000000 + i),
+                              f"<@{BOT_ID}> check anti-rug {TOKEN_ADDRESS}", [bot])
+                for i in reversed(range(first, first + count))]
+
+    def post_message(self, request, channel_id):
+        message = self._message(channel_id, str(1700000000000000000 + self.requests),
+                                request.json().get("content", ""), [])
+        message["author"] = self._user(BOT_ID, BOT_USERNAME)
+        return message
+
+    def react(self, request, channel_id, message_id):
+        return 204, None
+
+
+class MoralisService(FakeService):
+    """Moralis EVM API: ERC20 owners, transfers and metadata"""
+
+    name = "moralis"
+    hosts = ("deep-index.moralis.io",)
+
+    def routes(self) -> List[Route]:
+        return [
+            ("GET", r".*/erc20/metadata", self.metadata),
+            ("GET", r".*/erc20/(?P<address>\w+)/owners", self.owners),
+            ("GET", r".*/erc20/(?P<address>\w+)/transfers", self.transfers),
+        ]
+
+    def owners(self, request, address):
+        return {"cursor": None, "page": 0, "page_size": 100, "result": [
+            {"owner_address": "0x" + _digest(address, "owner", i), "balance": str(10 ** 21 // (i + 1)),
+             "balance_formatted": str(1000 / (i + 1)), "percentage_relative_to_total_supply": round(12 / (i + 1), 4),
+             "is_contract": i == 0}
+            for i in range(25)
+        ]}
+
+    def transfers(self, request, address):
+        return {"cursor": None, "page": 0, "page_size": 100, "result": [
+            {"transaction_hash": "0x" + _digest(address, "tx", i, length=64),
+             "from_address": "0x" + _digest(address, "from", i), "to_address": "0x" + _digest(address, "to", i),
+             "value": str(10 ** 18 * (i + 1)), "value_decimal": str(i + 1),
+             "block_timestamp": "2025-01-01T00:00:00.000Z", "block_number": str(9_000_000 + i)}
+            for i in range(25)
+        ]}
+
+    def metadata(self, request):
+        addresses = request.query.get("addresses[0]") or request.query.get("addresses") or [TOKEN_ADDRESS]
+        return [{"address": address, "name": "Bench Token", "symbol": "BENCH", "decimals": "18",
+                 "total_supply": str(10 ** 27), "total_supply_formatted": "1000000000", "verified_contract": True}
+                for address in addresses]
+
+
+class KyberswapService(FakeService):
+    """Kyberswap aggregator: swap routes and route building"""
+
+    name = "kyberswap"
+    hosts = ("aggregator-api.kyberswap.com",)
+
+    def routes(self) -> List[Route]:
+        return [
+            ("GET", r"/(?P<chain>[\w-]+)/api/v1/routes", self.get_route),
+            ("POST", r"/(?P<chain>[\w-]+)/api/v1/route/build", self.build_route),
+        ]
+
+    def get_route(self, request, chain):
+        amount_in = request.arg("amountIn", "0")
+        return {"code": 0, "message": "successfully", "data": {
+            "routeSummary": {"tokenIn": request.arg("tokenIn"), "amountIn": amount_in,
+                             "tokenOut": request.arg("tokenOut"), "amountOut": str(int(amount_in) * 3),
+                             "gas": "180000", "route": []},
+            "routerAddress": ROUTER_ADDRESS,
+        }}
+
+    def build_route(self, request, chain):
+        summary = request.json().get("routeSummary", {})
+        return {"code": 0, "message": "successfully", "data": {
+            "amountIn": summary.get("amountIn"), "amountOut": summary.get("amountOut"), "gas": "180000",
+            "data": "0x" + _digest(json.dumps(summary, sort_keys=True), length=64) * 4,
+            "routerAddress": ROUTER_ADDRESS,
+        }}
+
+
+class DexscreenerService(FakeService):
+    """Dexscreener search, a few pairs per query on each chain"""
+
+    name = "dexscreener"
+    hosts = ("api.dexscreener.com",)
+    CHAINS = ("ethereum", "sonic", "base", "solana")
+
+    def routes(self) -> List[Route]:
+        return [("GET", r"/latest/dex/search/?", self.search)]
+
+    def search(self, request):
+        query = (request.arg("q") or "").upper()
+        return {"schemaVersion": "1.0.0", "pairs": [
+            {"chainId": chain, "dexId": "bench", "pairAddress": "0x" + _digest(query, chain, i),
+             "baseToken": {"address": "0x" + _digest(query, chain, "base", i), "name": query.title(),
+                           "symbol": query if i == 0 else f"{query}{i}"},
+             "quoteToken": {"address": "0x" + _digest("WETH", chain), "symbol": "WETH"},
+             "priceUsd": str(round(0.01 * (i + 1), 4)),
+             "liquidity": {"usd": 100000 / (i + 1)}, "volume": {"h24": 50000 / (i + 1)}}
+            for chain in self.CHAINS for i in range(3)
+        ]}
+
+
+class JupiterService(FakeService):
+    """Jupiter v6 quotes and swap transactions"""
+
+    name = "jupiter"
+    hosts = ("quote-api.jup.ag", "jup.ag", "api.jup.ag")
+
+    def routes(self) -> List[Route]:
+        return [
+            ("GET", r"(/swap)?/v6/quote", self.quote),
+            ("POST", r"(/swap)?/v6/swap", self.swap),
+        ]
+
+    def quote(self, request):
+        amount = request.arg("amount", "0")
+        return {"inputMint": request.arg("inputMint"), "outputMint": request.arg("outputMint"),
+                "inAmount": amount, "outAmount": str(int(amount) * 2), "otherAmountThreshold": str(int(amount) * 2),
+                "swapMode": "ExactIn", "slippageBps": int(request.arg("slippageBps", 50)), "priceImpactPct": "0.001",
+                "routePlan": [{"swapInfo": {"ammKey": _digest(amount, length=44), "label": "Bench"}, "percent": 100}],
+                "contextSlot": 300000000, "timeTaken": 0.002}
+
+    def swap(self, request):
+        return {"swapTransaction": "AQ" + "A" * 342, "lastValidBlockHeight": 280000000,
+                "prioritizationFeeLamports": 5000}
+
+
+class SupabaseService(FakeService):
+    """Supabase PostgREST with the chains, tokens and x_users tables, eq. and in. filters and limit"""
+
+    name = "supabase"
+
+    def __init__(self, faults: Optional[Faults] = None):
+        super().__init__(faults)
+        self.tables: Dict[str, List[Dict[str, Any]]] = {
+            "chains": [{"id": i + 1, "name": name} for i, name in enumerate(DexscreenerService.CHAINS)],
+            "tokens": [{"id": i, "chain_id": i % 4 + 1, "symbol": f"BEN{i}", "price": round(100 / (i + 1), 4)}
+                       for i in range(40)],
+            "x_users": [{"account_id": str(1300000000000000000 + i), "is_active": True} for i in range(5)],
+        }
+
+    def routes(self) -> List[Route]:
+        return [
+            ("GET", r"/rest/v1/(?P<table>\w+)", self.select),
+            ("POST", r"/rest/v1/(?P<table>\w+)", self.insert),
+        ]
+
+    def select(self, request, table):
+        rows = self.tables.get(table)
+        if rows is None:
+            return 404, {"code": "42P01", "message": f'relation "public.{table}" does not exist'}
+        for column, values in request.query.items():
+            if values and values[0].startswith("eq."):
+                rows = [row for row in rows if str(row.get(column)).lower() == values[0][3:].lower()]
+            elif values and values[0].startswith("in.("):
+                wanted = {value.strip('"') for value in values[0][4:].rstrip(")").split(",")}
+                rows = [row for row in rows if str(row.get(column)) in wanted]
+        order = request.arg("order")
+        if order:
+            column, _, direction = order.partition(".")
+            rows = sorted(rows, key=lambda row: row.get(column) or 0, reverse=direction.startswith("desc"))
+        return rows[:int(request.arg("limit", len(rows)))]
+
+    def insert(self, request, table):
+        rows = request.json()
+        rows = rows if isinstance(rows, list) else [rows]
+        with self._lock:
+            self.tables.setdefault(table, []).extend(rows)
+        return 201, rows
+
+
+class RPCService(FakeService):
+    """JSON-RPC node answering the EVM and Solana calls the wallets make, batches included"""
+
+    name = "rpc"
+    hosts = ("rpc.soniclabs.com", "rpc.blaze.soniclabs.com", "ethereum-rpc.publicnode.com", "mainnet.base.org",
+             "polygon-rpc.com", "api.mainnet-beta.solana.com", "api.devnet.solana.com")
+
+    def __init__(self, faults: Optional[Faults] = None, chain_id: int = 1):
+        super().__init__(faults)
+        self.chain_id = chain_id
+        self.block = 21_000_000
+
+    def routes(self) -> List[Route]:
+        return [("POST", r"/.*", self.rpc)]
+
+    def rpc(self, request):
+        body = request.json()
+        if isinstance(body, list):
+            return [self._call(call) for call in body]
+        return self._call(body)
+
+    def _call(self, call: Dict[str, Any]) -> Dict[str, Any]:
+        method, params = call.get("method"), call.get("params") or []
+        handler = getattr(self, method, None) if isinstance(method, str) and not method.startswith("_") else None
+        if handler is None:
+            return {"jsonrpc": "2.0", "id": call.get("id"),
+                    "error": {"code": -32601, "message": f"the method {method} does not exist"}}
+        return {"jsonrpc": "2.0", "id": call.get("id"), "result": handler(params)}
+
+    def _uint(self, value: int) -> str:
+        return "0x" + format(value, "064x")
+
+    def _latest_block(self) -> Dict[str, Any]:
+        with self._lock:
+            self.block += 1
+            number = self.block
+        return {"number": hex(number), "hash": "0x" + _digest("block", number, length=64),
+                "parentHash": "0x" + _digest("block", number - 1, length=64), "timestamp": hex(int(time.time())),
+                "baseFeePerGas": hex(20 * 10 ** 9), "gasLimit": hex(30_000_000), "gasUsed": hex(15_000_000),
+                "miner": "0x" + "00" * 20, "transactions": []}
+
+    # EVM
+    def eth_chainId(self, params):
+        return hex(self.chain_id)
+
+    def net_version(self, params):
+        return str(self.chain_id)
+
+    def eth_blockNumber(self, params):
+        return self._latest_block()["number"]
+
+    def eth_getBlockByNumber(self, params):
+        return self._latest_block()
+
+    def eth_getBalance(self, params):
+        return hex(12 * 10 ** 18)
+
+    def eth_gasPrice(self, params):
+        return hex(25 * 10 ** 9)
+
+    def eth_maxPriorityFeePerGas(self, params):
+        return hex(10 ** 9)
+
+    def eth_feeHistory(self, params):
+        return {"oldestBlock": hex(self.block), "baseFeePerGas": [hex(20 * 10 ** 9)] * 2, "reward": [[hex(10 ** 9)]]}
+
+    def eth_estimateGas(self, params):
+        return hex(150_000)
+
+    def eth_getTransactionCount(self, params):
+        return hex(7)
+
+    def eth_getCode(self, params):
+        return "0x6080"
+
+    def eth_call(self, params):
+        # decimals(), balanceOf() and allowance() all decode a single uint256
+        data = (params[0] or {}).get("data") or (params[0] or {}).get("input") or ""
+        return self._uint(18 if data.startswith("0x313ce567") else 5 * 10 ** 21)
+
+    def eth_sendRawTransaction(self, params):
+        return "0x" + _digest(params[0], length=64)
+
+    def eth_getTransactionReceipt(self, params):
+        return {"transactionHash": params[0], "status": "0x1", "blockNumber": hex(self.block),
+                "blockHash": "0x" + _digest("block", self.block, length=64), "gasUsed": hex(120_000),
+                "effectiveGasPrice": hex(25 * 10 ** 9), "logs": [], "contractAddress": None,
+                "cumulativeGasUsed": hex(120_000), "from": "0x" + "00" * 20, "to": ROUTER_ADDRESS,
+                "transactionIndex": "0x0", "type": "0x2", "logsBloom": "0x" + "00" * 256}
+
+    # Solana
+    def _context(self, value):
+        return {"context": {"slot": self.block, "apiVersion": "2.0.0"}, "value": value}
+
+    def getVersion(self, params):
+        return {"solana-core": "2.0.0", "feature-set": 1}
+
+    def getSlot(self, params):
+        return self.block
+
+    def getBalance(self, params):
+        return self._context(3 * 10 ** 9)
+
+    def getLatestBlockhash(self, params):
+        return self._context({"blockhash": _digest("blockhash", self.block, length=44),
+                              "lastValidBlockHeight": self.block + 150})
+
+    def getTokenAccountsByOwner(self, params):
+        return self._context([])
+
+    def getTokenAccountBalance(self, params):
+        return self._context({"amount": "5000000000", "decimals": 9, "uiAmount": 5.0, "uiAmountString": "5"})
+
+    def sendTransaction(self, params):
+        return _digest(params[0] if params else "", length=88)
+
+    def getSignatureStatuses(self, params):
+        return self._context([{"slot": self.block, "confirmations": None, "err": None,
+                               "confirmationStatus": "finalized"} for _ in (params[0] if params else [])])
+
+
+class DeployService(FakeService):
+    """The memecoin deploy API behind DEPLOY_TOKEN_URL"""
+
+    name = "deploy"
+
+    def routes(self) -> List[Route]:
+        return [("POST", r"/api/memecoin/create-for-user", self.create)]
+
+    def create(self, request):
+        body = request.json() or {}
+        seed = json.dumps(body, sort_keys=True)
+        return {"success": True, "data": {
+            "name": "Bench Token", "symbol": "BENCH", "address": "0x" + _digest(seed),
+            "txHash": "0x" + _digest(seed, "tx", length=64), "owner": body.get("twitterHandle"),
+        }}
+
+
+SERVICES = {
+    service.name: service for service in (
+        OpenAIService, TwitterService, DiscordService, MoralisService, KyberswapService, DexscreenerService,
+        JupiterService, SupabaseService, RPCService, DeployService,
+    )
+}
+
+# Rough medians, scaled down so a benchmark run stays short
+DEFAULT_LATENCY = {
+    "openai": 0.05, "twitter": 0.02, "discord": 0.02, "moralis": 0.02, "kyberswap": 0.02, "dexscreener": 0.01,
+    "jupiter": 0.02, "supabase": 0.01, "rpc": 0.005, "deploy": 0.05,
+}
+
+
+def _serve(names: List[str], faults: Dict[str, Faults], conn) -> None:
+    services = {name: SERVICES[name](faults.get(name)) for name in names}
+    conn.send({name: service.start() for name, service in services.items()})
+    conn.recv()
+    for service in services.values():
+        service.stop()
+
+
+class FakeServices:
+    """Starts the fake services, in a child process by default so their threads do not
+    compete with the code under test for the GIL or show up in its allocations."""
+
+    def __init__(self, faults: Optional[Dict[str, Faults]] = None, names: Optional[Iterable[str]] = None,
+                 in_process: bool = False):
+        self.names = list(names or SERVICES)
+        self.faults = {name: Faults(latency=DEFAULT_LATENCY.get(name, 0.0)) for name in self.names}
+        self.faults.update(faults or {})
+        self.in_process = in_process
+        self.urls: Dict[str, str] = {}
+        self._services: Dict[str, FakeService] = {}
+        self._process = None
+        self._conn = None
+
+    def start(self) -> "FakeServices":
+        if self.in_process:
+            self._services = {name: SERVICES[name](self.faults.get(name)) for name in self.names}
+            self.urls = {name: service.start() for name, service in self._services.items()}
+        else:
+            context = multiprocessing.get_context("spawn")
+            self._conn, child = context.Pipe()
+            self._process = context.Process(target=_serve, args=(self.names, self.faults, child), daemon=True)
+            self._process.start()
+            self.urls = self._conn.recv()
+        return self
+
+    def stop(self) -> None:
+        for service in self._services.values():
+            service.stop()
+        self._services = {}
+        if self._process is not None:
+            self._conn.send("stop")
+            self._process.join(timeout=5)
+            self._process = None
+
+    def __enter__(self) -> "FakeServices":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def host_map(self) -> Dict[str, str]:
+        """Real hostname -> fake base URL, for redirect_hosts()"""
+        return {host: self.urls[name] for name in self.names for host in SERVICES[name].hosts}
+
+    def env(self) -> Dict[str, str]:
+        """Environment pointing ZerePy's connections at the fakes, with dummy credentials"""
+        env = {
+            "OPENAI_API_KEY": "bench", "MORALIS_API_KEY": "bench", "DISCORD_TOKEN": "bench",
+            "TWITTER_CONSUMER_KEY": "bench", "TWITTER_CONSUMER_SECRET": "bench", "TWITTER_ACCESS_TOKEN": "bench",
+            "TWITTER_ACCESS_TOKEN_SECRET": "bench", "TWITTER_USER_ID": TWITTER_USER_ID,
+            "TWITTER_BEARER_TOKEN": "bench", "SUPABASE_KEY": "bench", "EVM_PRIVATE_KEY": EVM_PRIVATE_KEY,
+        }
+        if "openai" in self.urls:
+            env["OPENAI_BASE_URL"] = self.urls["openai"] + "/v1"
+        if "supabase" in self.urls:
+            env["SUPABASE_URL"] = self.urls["supabase"]
+        if "deploy" in self.urls:
+            env["DEPLOY_TOKEN_URL"] = self.urls["deploy"] + "/"
+        return env
+
+    def _control(self, name: str, path: str, body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        data = json.dumps(body).encode() if body is not None else None
+        request = Request(self.urls[name] + path, data=data, method="POST" if data else "GET",
+                          headers={"Content-Type": "application/json"})
+        with urlopen(request, timeout=5) as response:
+            return json.loads(response.read())
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: self._control(name, "/__fake__/stats") for name in self.urls}
+
+    def set_faults(self, name: str, faults: Faults) -> None:
+        self.faults[name] = faults
+        self._control(name, "/__fake__/faults", asdict(faults))
+
+
+def _rewrite(url: str, host_map: Dict[str, str]) -> str:
+    parts = urlsplit(url)
+    target = host_map.get(parts.hostname or "")
+    if target is None:
+        return url
+    target = urlsplit(target)
+    return urlunsplit((target.scheme, target.netloc, parts.path, parts.query, parts.fragment))
+
+
+@contextmanager
+def redirect_hosts(host_map: Dict[str, str]):
+    """Send requests, httpx and urllib3 traffic for the given hostnames to other base URLs"""
+    patches = []
+
+    def patch(owner, attribute, replacement):
+        patches.append((owner, attribute, getattr(owner, attribute)))
+        setattr(owner, attribute, replacement)
+
+    try:
+        import requests
+    except ImportError:
+        requests = None
+    if requests is not None:
+        session_request = requests.Session.request
+
+        def redirected_request(session, method, url, *args, **kwargs):
+            return session_request(session, method, _rewrite(url, host_map), *args, **kwargs)
+
+        patch(requests.Session, "request", redirected_request)
+
+    try:
+        import urllib3
+    except ImportError:
+        urllib3 = None
+    if urllib3 is not None:
+        # Generated API clients such as the Moralis SDK go through PoolManager directly
+        pool_urlopen = urllib3.PoolManager.urlopen
+
+        def redirected_urlopen(manager, method, url, *args, **kwargs):
+            return pool_urlopen(manager, method, _rewrite(url, host_map), *args, **kwargs)
+
+        patch(urllib3.PoolManager, "urlopen", redirected_urlopen)
+
+    try:
+        import httpx
+    except ImportError:
+        httpx = None
+    if httpx is not None:
+        client_send = httpx.Client.send
+        async_send = httpx.AsyncClient.send
+
+        def redirected_send(client, request, *args, **kwargs):
+            request.url = httpx.URL(_rewrite(str(request.url), host_map))
+            return client_send(client, request, *args, **kwargs)
+
+        async def redirected_async_send(client, request, *args, **kwargs):
+            request.url = httpx.URL(_rewrite(str(request.url), host_map))
+            return await async_send(client, request, *args, **kwargs)
+
+        patch(httpx.Client, "send", redirected_send)
+        patch(httpx.AsyncClient, "send", redirected_async_send)
+
+    try:
+        yield host_map
+    finally:
+        for owner, attribute, original in reversed(patches):
+            setattr(owner, attribute, original)
+
+
+def parse_service_values(values: Optional[List[str]], cast=float) -> Dict[str, Any]:
+    """["openai=0.2", "all=0.01"] -> {"openai": 0.2, "all": 0.01}"""
+    parsed = {}
+    for value in values or []:
+        name, _, number = value.partition("=")
+        if name != "all" and name not in SERVICES:
+            raise argparse.ArgumentTypeError(f"Unknown service {name}, expected one of {', '.join(SERVICES)} or all")
+        parsed[name] = cast(number)
+    return parsed
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", action="append", metavar="SERVICE=SECONDS",
+                        help="Median latency of a service, 'all' for every one")
+    parser.add_argument("--jitter", action="append", metavar="SERVICE=SIGMA",
+                        help="Log-normal sigma of a service's latency")
+    parser.add_argument("--error-rate", action="append", metavar="SERVICE=RATE",
+                        help="Share of a service's requests that fail")
+    parser.add_argument("--error-status", action="append", metavar="SERVICE=STATUS",
+                        help="Status code of injected failures (default 500)")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def faults_from_args(args) -> Dict[str, Faults]:
+    settings = {
+        "latency": parse_service_values(args.latency),
+        "jitter": parse_service_values(args.jitter),
+        "error_rate": parse_service_values(args.error_rate),
+        "error_status": parse_service_values(args.error_status, int),
+    }
+    faults = {}
+    for name in SERVICES:
+        values = {"latency": DEFAULT_LATENCY.get(name, 0.0), "seed": args.seed}
+        for field in fields(Faults):
+            per_service = settings.get(field.name, {})
+            if name in per_service or "all" in per_service:
+                values[field.name] = per_service.get(name, per_service.get("all"))
+        faults[name] = Faults(**values)
+    return faults
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run local stand-ins for the APIs ZerePy talks to")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    services = FakeServices(faults_from_args(args), in_process=True).start()
+    for name, url in services.urls.items():
+        print(f"{name:12s}{url}  {' '.join(SERVICES[name].hosts)}")
+    print("\nexport " + " ".join(f"{key}={value}" for key, value in services.env().items()))
+    print("Hardcoded hosts need redirect_hosts(), see bench/suite.py. Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        services.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Per-request latency of module level requests calls versus the pooled sessions of
+src/http_session.py, sync and async, against a local keep-alive HTTP server.
+
+Loopback connections are almost free, so the server waits --connect-delay seconds before
+answering on a new connection, standing in for the TCP and TLS handshake round trips to
+a remote API. --tls serves HTTPS with a throwaway self-signed certificate (needs the
+openssl binary) so real TLS handshakes are measured too.
+
+    poetry run python -m bench.http_pool --requests 200 --connect-delay 0.03
+    poetry run python -m bench.http_pool --tls --connect-delay 0
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from bench.stubs import percentile
+from src.http_session import close_async_sessions, close_sessions, get_async_session, get_session
+
+BODY = json.dumps({"pairs": [{"chainId": "ethereum", "baseToken": {"symbol": "PEPE"}}] * 20}).encode()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes, Nagle would hold the body back on a kept-alive socket
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+        time.sleep(self.server.connect_delay)
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(connect_delay: float, tls: bool):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.connections, server.connect_delay = 0, connect_delay
+    cert = None
+    if tls:
+        directory = tempfile.mkdtemp(prefix="zerepy-bench-")
+        cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                        "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+                        "-keyout", key, "-out", cert], check=True, capture_output=True)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    scheme = "https" if tls else "http"
+    return server, f"{scheme}://127.0.0.1:{server.server_address[1]}/latest/dex/search?q=PEPE", cert
+
+
+def run_sync(get, url: str, requests_count: int, cert):
+    samples = []
+    for _ in range(requests_count):
+        started = time.perf_counter()
+        response = get(url, verify=cert or True)
+        response.raise_for_status()
+        response.json()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def run_async(url: str, requests_count: int, concurrency: int, pooled: bool, cert):
+    import aiohttp
+
+    context = ssl.create_default_context(cafile=cert) if cert else None
+    samples, semaphore = [], asyncio.Semaphore(concurrency)
+
+    async def fetch(session):
+        async with session.get(url, ssl=context) as response:
+            response.raise_for_status()
+            await response.json()
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            if pooled:
+                await fetch(get_async_session("bench"))
+            else:
+                async with aiohttp.ClientSession() as session:
+                    await fetch(session)
+            samples.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one() for _ in range(requests_count)))
+    await close_async_sessions()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pooled HTTP sessions against per-call connections")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent requests of the async runs")
+    parser.add_argument("--connect-delay", type=float, default=0.03,
+                        help="Seconds the server waits on every new connection (default: 0.03)")
+    parser.add_argument("--tls", action="store_true", help="Serve HTTPS with a self-signed certificate")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    server, url, cert = start_server(args.connect_delay, args.tls)
+    runs = [
+        ("requests.get", lambda: run_sync(requests.get, url, args.requests, cert)),
+        ("get_session", lambda: run_sync(get_session("bench").get, url, args.requests, cert)),
+        ("aiohttp per call", lambda: asyncio.run(run_async(url, args.requests, args.concurrency, False, cert))),
+        ("get_async_session", lambda: asyncio.run(run_async(url, args.requests, args.concurrency, True, cert))),
+    ]
+
+    print(f"requests={args.requests} concurrency={args.concurrency} connect_delay={args.connect_delay}s "
+          f"tls={args.tls}")
+    print(f"{'client':<20}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'conns':>7}")
+    for label, run in runs:
+        try:
+            connections = server.connections
+            started = time.perf_counter()
+            samples = run()
+            seconds = time.perf_counter() - started
+        except ImportError as e:
+            print(f"{label:<20}skipped, {e}")
+            continue
+        print(f"{label:<20}{percentile(samples, 50) * 1000:>9.2f}{percentile(samples, 95) * 1000:>9.2f}"
+              f"{percentile(samples, 99) * 1000:>9.2f}{len(samples) / seconds:>9.1f}"
+              f"{server.connections - connections:>7}")
+    close_sessions()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
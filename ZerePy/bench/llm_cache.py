@@ -0,0 +1,76 @@
+"""
+Latency saved by the generate-text response cache on a replayed workload.
+
+The workload is a fixed sequence of prompts drawn from a small pool, so some of them
+repeat byte for byte the way ReAct prompts and rug-detect summaries do. It is replayed
+against a stub provider with no cache, the in-memory LRU and the SQLite backend.
+
+    poetry run python -m bench.llm_cache --requests 500 --unique 50
+"""
+import argparse
+import logging
+import random
+import time
+from pathlib import Path
+
+from src.agent import ZerePyAgent
+from src.llm_cache import MemoryLLMCache, SQLiteLLMCache
+from bench.stubs import make_agent_dir, agent_definition, attach_stub_llm, percentile
+
+
+def build_workload(requests: int, unique: int, seed: int):
+    rng = random.Random(seed)
+    pool = [f"Summarize the holder distribution of token 0x{i:040x}" for i in range(unique)]
+    # Skewed towards the first prompts, like the handful of tokens everyone asks about
+    weights = [1 / (rank + 1) for rank in range(unique)]
+    return rng.choices(pool, weights=weights, k=requests)
+
+
+def replay(agent, workload):
+    samples = []
+    started = time.perf_counter()
+    for prompt in workload:
+        call_started = time.perf_counter()
+        agent.prompt_llm(prompt, system_prompt="You are a benchmark agent.")
+        samples.append(time.perf_counter() - call_started)
+    return time.perf_counter() - started, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the LLM response cache on a replayed workload")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--unique", type=int, default=50, help="Distinct prompts in the workload")
+    parser.add_argument("--llm-latency", type=float, default=0.02)
+    parser.add_argument("--max-entries", type=int, default=1024)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    root = make_agent_dir({"bench_cache": agent_definition("BenchCache")})
+    agent = ZerePyAgent("bench_cache")
+    stub = attach_stub_llm(agent, args.llm_latency)
+    agent._setup_llm_provider()
+    workload = build_workload(args.requests, args.unique, args.seed)
+
+    backends = [
+        ("no cache", None),
+        ("memory", MemoryLLMCache(max_entries=args.max_entries)),
+        ("sqlite", SQLiteLLMCache(path=str(Path(root) / "llm_cache.sqlite"), max_entries=args.max_entries)),
+    ]
+
+    print(f"requests={args.requests} unique={args.unique} llm={args.llm_latency}s "
+          f"max_entries={args.max_entries}")
+    print(f"{'backend':<10}{'total s':>9}{'p50 ms':>9}{'p95 ms':>9}{'hit rate':>10}{'llm calls':>11}{'saved s':>9}")
+    baseline = None
+    for label, cache in backends:
+        agent.llm_cache = cache
+        stub.calls = 0
+        total, samples = replay(agent, workload)
+        baseline = total if baseline is None else baseline
+        hit_rate = cache.stats()["hit_rate"] if cache is not None else 0.0
+        print(f"{label:<10}{total:>9.2f}{percentile(samples, 50) * 1000:>9.2f}"
+              f"{percentile(samples, 95) * 1000:>9.2f}{hit_rate:>10.1%}{stub.calls:>11}{baseline - total:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
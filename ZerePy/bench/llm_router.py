@@ -0,0 +1,78 @@
+"""
+Tail latency of a single LLM provider versus the router, with and without hedging.
+
+Three stub providers with log-normal latencies, occasional slow outliers and a small
+error rate stand in for real APIs. The same request sequence is sent to the fastest
+provider alone, to the router with failover only and to the router with hedging.
+
+    poetry run python -m bench.llm_router --requests 300
+"""
+import argparse
+import logging
+import time
+
+from src.agent import ZerePyAgent
+from src.connections.router_connection import RouterConnection
+from bench.stubs import JitteryLLMConnection, make_agent_dir, agent_definition, percentile
+
+PROVIDERS = {
+    "provider_a": {"latency": 0.05, "spike_rate": 0.04, "spike_latency": 0.5, "error_rate": 0.01, "seed": 1},
+    "provider_b": {"latency": 0.07, "spike_rate": 0.03, "spike_latency": 0.5, "error_rate": 0.01, "seed": 2},
+    "provider_c": {"latency": 0.10, "spike_rate": 0.02, "spike_latency": 0.8, "error_rate": 0.05, "seed": 3},
+}
+
+
+def build_agent():
+    make_agent_dir({"bench_router": agent_definition("BenchRouter")})
+    agent = ZerePyAgent("bench_router")
+    for name, config in PROVIDERS.items():
+        agent.connection_manager.connections[name] = JitteryLLMConnection(dict(config, name=name))
+    agent.is_llm_set = True
+    return agent
+
+
+def use_router(agent, hedge: bool) -> RouterConnection:
+    router = RouterConnection({"name": "router", "providers": list(PROVIDERS), "hedge": hedge})
+    router.bind_connection_manager(agent.connection_manager)
+    agent.connection_manager.connections["router"] = router
+    agent.model_provider = "router"
+    return router
+
+
+def run(agent, requests: int):
+    samples, failures = [], 0
+    for i in range(requests):
+        started = time.perf_counter()
+        if agent.prompt_llm(f"request {i}", system_prompt="You are a benchmark agent.") is None:
+            failures += 1
+        samples.append(time.perf_counter() - started)
+    return samples, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the latency-aware LLM router")
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    agent = build_agent()
+
+    scenarios = [("provider_a only", None), ("router", False), ("router+hedge", True)]
+    print(f"requests={args.requests}")
+    print(f"{'scenario':<18}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'failed':>8}")
+    for label, hedge in scenarios:
+        if hedge is None:
+            agent.model_provider = "provider_a"
+        else:
+            router = use_router(agent, hedge)
+        samples, failures = run(agent, args.requests)
+        print(f"{label:<18}{percentile(samples, 50) * 1000:>9.1f}{percentile(samples, 95) * 1000:>9.1f}"
+              f"{percentile(samples, 99) * 1000:>9.1f}{max(samples) * 1000:>9.1f}{failures:>8}")
+        if hedge is not None:
+            for name, stats in router.provider_stats().items():
+                print(f"    {name:<12} requests={stats['requests']:<5} p50={stats['p50_ms']}ms "
+                      f"errors={stats['error_rate']:.0%} hedged wins={stats['hedged_wins']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Loop iterations of a real agent replayed from a cassette, so its CPU cost can be profiled
+and compared between releases without touching the network.
+
+Record once, against the live services the agent is configured for (this posts for real):
+
+    poetry run python -m bench.replay anti_rug cassettes/anti_rug.jsonl.gz --record --iterations 3
+
+or record a normal run with `python main.py --record cassettes/anti_rug.jsonl.gz`. Then replay
+as often as needed, with the recorded latencies or none at all:
+
+    poetry run python -m bench.replay anti_rug cassettes/anti_rug.jsonl.gz --timing zero --save rug-v0.4.0
+    poetry run python -m bench.replay anti_rug cassettes/anti_rug.jsonl.gz --timing zero --compare rug-v0.4.0
+    poetry run python -m bench.replay anti_rug cassettes/anti_rug.jsonl.gz --profile anti_rug.prof
+
+Agents are loaded from ./agents, run from the project root. Baselines are shared with
+bench.suite, under bench/baselines.
+"""
+import argparse
+import cProfile
+import json
+import logging
+import platform
+import pstats
+import sys
+import time
+
+from bench.suite import BASELINE_DIR, compare, measure, print_results, save_baseline
+from src.cassette import use_cassette
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an agent's loop iterations from a cassette")
+    parser.add_argument("agent", help="Agent in ./agents, e.g. anti_rug or deploy_token")
+    parser.add_argument("cassette", help="Cassette file, gzipped when it ends in .gz")
+    parser.add_argument("--record", action="store_true",
+                        help="Run against the live services and record the cassette instead")
+    parser.add_argument("--timing", choices=["original", "zero"], default="zero",
+                        help="Replay with the recorded latencies or none (default: zero)")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--alloc-iterations", type=int, default=3,
+                        help="Iterations measured with tracemalloc, 0 to skip allocations")
+    parser.add_argument("--profile", metavar="PATH", help="Write a cProfile of the timed iterations to PATH")
+    parser.add_argument("--save", metavar="NAME", help="Save the results as bench/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="Compare with bench/baselines/NAME.json")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Relative change counted as a regression (default: 0.15)")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(BASELINE_DIR / f"{args.compare}.json") as f:
+            baseline = json.load(f)
+
+    from src.agent import ZerePyAgent
+
+    logging.disable(logging.CRITICAL)
+    mode = "record" if args.record else "replay"
+    with use_cassette(args.cassette, mode, args.timing) as cassette:
+        agent = ZerePyAgent(args.agent)
+        agent._setup_llm_provider()
+        system_prompt = agent._loop_system_prompt()
+        profiler = cProfile.Profile() if args.profile else None
+
+        def iteration():
+            if profiler is not None:
+                profiler.enable()
+            try:
+                agent._run_iteration(system_prompt)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+
+        result = measure(args.agent, iteration, args.iterations, args.warmup,
+                         0 if args.record else args.alloc_iterations)
+        stats = cassette.stats()
+
+    if profiler is not None:
+        profiler.dump_stats(args.profile)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+        print(f"Saved profile to {args.profile}")
+    print(f"cassette {args.cassette}: " + ", ".join(f"{key} {value}" for key, value in stats.items()))
+    if args.record:
+        return
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"cassette": args.cassette, "timing": args.timing, "iterations": args.iterations},
+        "results": {args.agent: result.summary()},
+    }
+    print_results(report["results"], baseline)
+    if stats.get("missed"):
+        print(f"warning: {stats['missed']} requests were not in the cassette, re-record it for this release")
+    if args.save:
+        print(f"Saved baseline to {save_baseline(args.save, report)}")
+    if baseline is not None:
+        regressions = compare(baseline, report, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
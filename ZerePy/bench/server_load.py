@@ -0,0 +1,137 @@
+"""
+Requests per second and tail latency of the HTTP server against a stub LLM.
+
+The server runs in-process on a local port with --agents warm agents whose LLM is a stub
+that sleeps for --llm-latency. Concurrent clients post to /structured_outputs/completions,
+or with --scenario chat to /chat/completions where every request is a ReAct episode of two
+LLM calls and a `bench-io` action sleeping for --io-latency. Requests are spread over the
+agents through the model field, while a probe keeps hitting / to show that status checks
+are not stuck behind LLM calls. Requests beyond the admission limits come back as 429 or
+503 and are counted separately.
+
+    poetry run python -m bench.server_load --clients 64 --duration 10
+    poetry run python -m bench.server_load --scenario chat --clients 8 --agents 1
+"""
+import argparse
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import List
+
+import aiohttp
+import uvicorn
+
+from src.action_handler import register_action
+from src.server.app import ZerePyServer
+from bench.stubs import make_agent_dir, agent_definition, attach_stub_llm, percentile
+
+
+ENDPOINTS = {
+    "structured": "/structured_outputs/completions",
+    "chat": "/chat/completions",
+}
+
+
+def register_bench_action(io_latency: float) -> None:
+    @register_action("bench-io")
+    async def bench_io(agent, **kwargs):
+        await asyncio.sleep(io_latency)
+        return "ok"
+
+
+def agent_names(args) -> List[str]:
+    return [f"bench_server_{i}" for i in range(args.agents)]
+
+
+async def build_server(args) -> ZerePyServer:
+    make_agent_dir({
+        name: agent_definition(f"BenchServer{i}", max_concurrent_requests=args.max_concurrent_requests)
+        for i, name in enumerate(agent_names(args))
+    })
+    server = ZerePyServer(executor_threads=args.executor_threads, max_queue=args.max_queue,
+                          queue_timeout=args.queue_timeout, max_agents=args.agents)
+    for name in agent_names(args):
+        # Warm the pool up front, the stub LLM is not a registered connection
+        agent = await server.state.agents.get(name)
+        attach_stub_llm(agent, args.llm_latency)
+        agent._setup_llm_provider()
+    return server
+
+
+async def client(session, url: str, model: str, deadline: float, latencies, statuses):
+    body = {"model": model, "messages": [{"role": "user", "content": "name a token"}]}
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        async with session.post(url, json=body) as response:
+            await response.read()
+            statuses[response.status] += 1
+            if response.status == 200:
+                latencies.append(time.perf_counter() - started)
+            elif response.status in (429, 503):
+                await asyncio.sleep(float(response.headers.get("Retry-After", "1")) / 10)
+
+
+async def probe(session, url: str, deadline: float, latencies):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        async with session.get(url) as response:
+            await response.read()
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.05)
+
+
+async def run(args):
+    register_bench_action(args.io_latency)
+    config = uvicorn.Config((await build_server(args)).app, host="127.0.0.1", port=args.port, log_level="error")
+    server = uvicorn.Server(config)
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    base = f"http://127.0.0.1:{args.port}"
+    latencies, probe_latencies, statuses = [], [], Counter()
+    models = agent_names(args)
+    connector = aiohttp.TCPConnector(limit=args.clients + 1)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(
+            probe(session, base + "/", deadline, probe_latencies),
+            *(client(session, base + ENDPOINTS[args.scenario], models[i % len(models)], deadline,
+                     latencies, statuses)
+              for i in range(args.clients)))
+
+    server.should_exit = True
+    await serving
+    return latencies, probe_latencies, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the ZerePy server against a stub LLM")
+    parser.add_argument("--scenario", choices=sorted(ENDPOINTS), default="structured")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--agents", type=int, default=1, help="Agents served by the one server process")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--io-latency", type=float, default=0.05, help="bench-io action time, chat scenario")
+    parser.add_argument("--max-concurrent-requests", type=int, default=16)
+    parser.add_argument("--max-queue", type=int, default=16)
+    parser.add_argument("--queue-timeout", type=float, default=30.0)
+    parser.add_argument("--executor-threads", type=int, default=32)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    latencies, probe_latencies, statuses = asyncio.run(run(args))
+
+    print(f"scenario={args.scenario} clients={args.clients} agents={args.agents} llm={args.llm_latency}s "
+          f"max_concurrent={args.max_concurrent_requests} max_queue={args.max_queue}")
+    print(f"completions : {len(latencies) / args.duration:8.2f} req/s  p50={percentile(latencies, 50) * 1000:.0f}ms "
+          f"p99={percentile(latencies, 99) * 1000:.0f}ms")
+    print(f"status /    : p50={percentile(probe_latencies, 50) * 1000:.1f}ms "
+          f"p99={percentile(probe_latencies, 99) * 1000:.1f}ms ({len(probe_latencies)} probes)")
+    print("responses   : " + ", ".join(f"{status}={count}" for status, count in sorted(statuses.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Local stand-ins used by the benchmarks. Nothing in here touches the network.
+"""
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.connections.base_connection import BaseConnection, Action, ActionParameter
+from src.usage import CallUsage
+
+
+class StubLLMConnection(BaseConnection):
+    """LLM provider that sleeps for a fixed latency and answers with a two step ReAct episode"""
+
+    # Canned answers, the same as a provider sampling at temperature 0
+    default_temperature = 0.0
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.latency = config.get("latency", 0.05)
+        self.calls = 0
+
+    @property
+    def is_llm_provider(self) -> bool:
+        return True
+
+    def validate_config(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        return config
+
+    def configure(self, **kwargs) -> bool:
+        return True
+
+    def is_configured(self, verbose=False) -> bool:
+        return True
+
+    def register_actions(self) -> None:
+        self.actions = {
+            "generate-text": Action(
+                name="generate-text",
+                parameters=[
+                    ActionParameter("prompt", True, str, "The input prompt for text generation"),
+                    ActionParameter("system_prompt", True, str, "System prompt to guide the model"),
+                    ActionParameter("stop", False, list, "Stop sequences"),
+                    ActionParameter("response_format", False, dict, "Response format to use"),
+                ],
+                description="Generate canned text after a fixed delay"
+            )
+        }
+
+    def generate_text(self, prompt: str, system_prompt: str, stop: Optional[List[str]] = None, **kwargs) -> str:
+        self.calls += 1
+        with CallUsage(self.config["name"], "stub", system_prompt, prompt) as usage:
+            time.sleep(self.latency)
+            if "Observation 1:" in prompt:
+                text = "I have what I need Action 2: Finish[done]"
+            else:
+                text = "I should look something up Action 1: Call[bench-io]"
+            usage.report(len(system_prompt + prompt) // 4, len(text) // 4)
+        return text
+
+    def perform_action(self, action_name: str, kwargs) -> Any:
+        if action_name not in self.actions:
+            raise KeyError(f"Unknown action: {action_name}")
+        method = getattr(self, action_name.replace('-', '_'))
+        return method(**kwargs)
+
+
+class JitteryLLMConnection(StubLLMConnection):
+    """Stub provider with a log-normal latency, occasional slow outliers and failures.
+
+    Config: latency (median seconds), sigma, spike_rate, spike_latency, error_rate, seed.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.sigma = config.get("sigma", 0.25)
+        self.spike_rate = config.get("spike_rate", 0.0)
+        self.spike_latency = config.get("spike_latency", 1.0)
+        self.error_rate = config.get("error_rate", 0.0)
+        self._rng = random.Random(config.get("seed", 0))
+        self._rng_lock = threading.Lock()
+
+    def sample_latency(self) -> float:
+        with self._rng_lock:
+            if self._rng.random() < self.spike_rate:
+                return self.spike_latency
+            return self.latency * self._rng.lognormvariate(0, self.sigma)
+
+    def generate_text(self, prompt: str, system_prompt: str, stop: Optional[List[str]] = None, **kwargs) -> str:
+        self.calls += 1
+        time.sleep(self.sample_latency())
+        with self._rng_lock:
+            failed = self._rng.random() < self.error_rate
+        if failed:
+            raise RuntimeError(f"{self.config['name']} returned 500")
+        return f"answer from {self.config['name']}"
+
+
+def make_agent_dir(agents: Dict[str, Dict[str, Any]]) -> Path:
+    """Write agent definitions into a fresh temp dir and chdir into it, ZerePyAgent
+    resolves agents/<name>.json relative to the working directory."""
+    root = Path(tempfile.mkdtemp(prefix="zerepy-bench-"))
+    (root / "agents").mkdir()
+    for name, definition in agents.items():
+        with open(root / "agents" / f"{name}.json", "w") as f:
+            json.dump(definition, f)
+    os.chdir(root)
+    return root
+
+
+def agent_definition(name: str, loop_delay: float = 0, config: Optional[List[Dict[str, Any]]] = None,
+                     tasks: Optional[List[Dict[str, Any]]] = None, **extra) -> Dict[str, Any]:
+    definition = {
+        "name": name,
+        "bio": ["You are a benchmark agent.", "{tool}"],
+        "traits": [],
+        "examples": [],
+        "loop_delay": loop_delay,
+        "config": config or [],
+        "tasks": tasks or [{"name": "bench-io", "weight": 1}],
+        "use_time_based_weights": False,
+        "time_based_multipliers": {},
+    }
+    definition.update(extra)
+    return definition
+
+
+def attach_stub_llm(agent, latency: float) -> StubLLMConnection:
+    connection = StubLLMConnection({"name": "stub-llm", "latency": latency})
+    agent.connection_manager.connections["stub-llm"] = connection
+    return connection
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
@@ -0,0 +1,378 @@
+"""
+End-to-end benchmarks of the hot paths against local fake services, with baselines.
+
+Scenarios run real agents and connections, only the network is local (see bench/fakes.py):
+
+    loop          ZerePyAgent loop iterations: a ReAct episode calling list-channels, then post-tweet
+    rug-detect    AntiRugAgent: Discord mentions, Moralis holders/transfers/metadata, LLM analysis, reply
+    deploy-token  DeployTokenAgent: Twitter mentions, Supabase subscription check, deploy API, LLM, reply
+    evm           get-token-by-ticker (Dexscreener), get-balance (RPC) and a Kyberswap swap
+    server-chat   POST /chat/completions, server-stream with stream=true, server-status GET /
+
+Each reports throughput, p50/p95/p99 latency, CPU time and memory per operation: the peak allocated
+on top of what was live and what is still allocated afterwards (tracemalloc, measured in a
+separate pass so tracing does not skew the timings). Scenarios whose connection SDK is
+not installed are skipped.
+
+    poetry run python -m bench.suite --iterations 50 --save v0.4.0
+    poetry run python -m bench.suite --compare v0.4.0 --tolerance 0.15
+
+--compare exits with status 1 when throughput drops, or p99 latency, CPU time or memory per
+operation grow, by more than the tolerance against the saved baseline.
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import platform
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from bench.fakes import FakeServices, add_fault_arguments, faults_from_args, redirect_hosts
+from bench.stubs import make_agent_dir, agent_definition, percentile
+
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+
+OPENAI = {"name": "openai", "model": "gpt-4o-mini"}
+TWITTER = {"name": "twitter", "timeline_read_count": 10, "own_tweet_replies_count": 2, "tweet_interval": 5400}
+# REST polling, the gateway is a WebSocket the fakes do not serve
+DISCORD = {"name": "discord", "message_read_count": 1, "message_emoji_name": "❤️", "server_id": "1234567890",
+           "gateway": False}
+SUPABASE = {"name": "supabase"}
+
+
+class Skipped(Exception):
+    """A scenario cannot run here, e.g. its SDK is not installed"""
+
+
+@dataclass
+class Result:
+    scenario: str
+    ops: int
+    errors: int
+    seconds: float
+    latencies: List[float] = field(repr=False)
+    cpu_seconds: float = 0.0
+    peak_kib_per_op: float = 0.0
+    retained_kib_per_op: float = 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "ops": self.ops,
+            "errors": self.errors,
+            "ops_per_sec": round(self.ops / self.seconds, 3) if self.seconds else 0.0,
+            "p50_ms": round(percentile(self.latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(self.latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(self.latencies, 99) * 1000, 2),
+            "cpu_ms_per_op": round(self.cpu_seconds / self.ops * 1000, 3) if self.ops else 0.0,
+            "peak_kib_per_op": round(self.peak_kib_per_op, 2),
+            "retained_kib_per_op": round(self.retained_kib_per_op, 2),
+        }
+
+
+def require(*modules: str) -> None:
+    missing = [module for module in modules if importlib.util.find_spec(module) is None]
+    if missing:
+        raise Skipped(f"{', '.join(missing)} not installed")
+
+
+def measure(name: str, operation: Callable[[], Any], iterations: int, warmup: int, alloc_iterations: int) -> Result:
+    for _ in range(warmup):
+        operation()
+
+    latencies, errors = [], 0
+    started, cpu_started = time.perf_counter(), time.process_time()
+    for _ in range(iterations):
+        op_started = time.perf_counter()
+        try:
+            operation()
+        except Exception as e:
+            errors += 1
+            logging.getLogger("bench").debug(f"{name} failed: {e}")
+        else:
+            latencies.append(time.perf_counter() - op_started)
+    seconds, cpu_seconds = time.perf_counter() - started, time.process_time() - cpu_started
+
+    result = Result(name, iterations, errors, seconds, latencies, cpu_seconds)
+    if alloc_iterations:
+        # Peak is the memory an operation needs on top of what was live when it started,
+        # retained what is still allocated after it, which should stay near zero
+        tracemalloc.start()
+        peak, started_with = 0, tracemalloc.get_traced_memory()[0]
+        for _ in range(alloc_iterations):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            try:
+                operation()
+            except Exception:
+                pass
+            peak += tracemalloc.get_traced_memory()[1] - before
+        retained = tracemalloc.get_traced_memory()[0] - started_with
+        tracemalloc.stop()
+        result.peak_kib_per_op = peak / alloc_iterations / 1024
+        result.retained_kib_per_op = max(0, retained) / alloc_iterations / 1024
+    return result
+
+
+# Scenarios return the operation to time. They run inside make_agent_dir(), with the
+# fakes' environment set and their hostnames redirected.
+
+def scenario_loop(args) -> Callable[[], Any]:
+    from src.agent import ZerePyAgent
+
+    make_agent_dir({"bench_loop": agent_definition(
+        "BenchLoop", config=[OPENAI, TWITTER, DISCORD],
+        tasks=[{"name": "list-channels", "weight": 1}, {"name": "post-tweet", "weight": 1, "min_interval": 0}])})
+    agent = ZerePyAgent("bench_loop")
+    agent._setup_llm_provider()
+    system_prompt = agent._loop_system_prompt()
+
+    def iteration():
+        # A failed iteration is logged and retried after loop_delay + 60 seconds
+        if agent._run_iteration(system_prompt) != 60:
+            raise RuntimeError("loop iteration failed")
+
+    return iteration
+
+
+def scenario_rug_detect(args) -> Callable[[], Any]:
+    require("moralis")
+    from src.agent import ZerePyAgent
+
+    make_agent_dir({"anti_rug": agent_definition(
+        "AntiRugAgent", config=[OPENAI, DISCORD], tasks=[{"name": "rug-detect", "action": "rug-detect", "weight": 1}])})
+    agent = ZerePyAgent("anti_rug")
+    agent._setup_llm_provider()
+    return lambda: agent._run_iteration(agent._loop_system_prompt())
+
+
+def scenario_deploy_token(args) -> Callable[[], Any]:
+    require("supabase")
+    from src.agent import ZerePyAgent
+
+    make_agent_dir({"deploy_token": agent_definition(
+        "DeployTokenAgent", config=[OPENAI, TWITTER, SUPABASE],
+        tasks=[{"name": "deploy-tokens", "action": "deploy-token", "weight": 1}])})
+    agent = ZerePyAgent("deploy_token")
+    agent._setup_llm_provider()
+    return lambda: agent._run_iteration(agent._loop_system_prompt())
+
+
+def scenario_evm(args) -> Callable[[], Any]:
+    require("web3")
+    from src.agent import ZerePyAgent
+
+    make_agent_dir({"bench_evm": agent_definition("BenchEVM", config=[{"name": "evm", "network": "ethereum"}])})
+    agent = ZerePyAgent("bench_evm")
+    manager = agent.connection_manager
+    native = manager.connections["evm"].NATIVE_TOKEN
+
+    def trade():
+        token = manager.perform_action("evm", "get-token-by-ticker", ["PEPE"])
+        if not token:
+            raise RuntimeError("token lookup failed")
+        manager.perform_action("evm", "get-balance", [])
+        result = manager.perform_action("evm", "swap", [native, token, 0.1])
+        if not result or "failed" in str(result):
+            raise RuntimeError(str(result))
+
+    return trade
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _serve(args) -> str:
+    """Start the HTTP server in a background thread, once, and return its base URL"""
+    if getattr(args, "_server_url", None):
+        return args._server_url
+    require("fastapi", "uvicorn")
+    import uvicorn
+    from src.server.app import ZerePyServer
+
+    make_agent_dir({"bench_loop": agent_definition(
+        "BenchLoop", config=[OPENAI, TWITTER, DISCORD], tasks=[{"name": "list-channels", "weight": 1}])})
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(ZerePyServer().app, host="127.0.0.1", port=port, log_level="error"))
+    threading.Thread(target=server.run, name="bench-server", daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    args._server_url = f"http://127.0.0.1:{port}"
+    return args._server_url
+
+
+def scenario_server_chat(args) -> Callable[[], Any]:
+    import requests
+
+    url = _serve(args) + "/chat/completions"
+    session = requests.Session()
+    body = {"model": "bench_loop", "messages": [{"role": "user", "content": "what is new today?"}]}
+
+    def chat():
+        response = session.post(url, json=body, timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    return chat
+
+
+def scenario_server_stream(args) -> Callable[[], Any]:
+    import requests
+
+    url = _serve(args) + "/chat/completions"
+    session = requests.Session()
+    body = {"model": "bench_loop", "stream": True, "messages": [{"role": "user", "content": "what is new today?"}]}
+
+    def stream():
+        with session.post(url, json=body, stream=True, timeout=30) as response:
+            response.raise_for_status()
+            for _ in response.iter_lines():
+                pass
+
+    return stream
+
+
+def scenario_server_status(args) -> Callable[[], Any]:
+    import requests
+
+    url = _serve(args) + "/"
+    session = requests.Session()
+    return lambda: session.get(url, timeout=30).raise_for_status()
+
+
+SCENARIOS: Dict[str, Callable[[Any], Callable[[], Any]]] = {
+    "loop": scenario_loop,
+    "rug-detect": scenario_rug_detect,
+    "deploy-token": scenario_deploy_token,
+    "evm": scenario_evm,
+    "server-chat": scenario_server_chat,
+    "server-stream": scenario_server_stream,
+    "server-status": scenario_server_status,
+}
+
+
+def settings(args) -> Dict[str, Any]:
+    return {
+        "iterations": args.iterations,
+        "latency": sorted(args.latency or []),
+        "jitter": sorted(args.jitter or []),
+        "error_rate": sorted(args.error_rate or []),
+        "seed": args.seed,
+    }
+
+
+def save_baseline(name: str, report: Dict[str, Any]) -> Path:
+    BASELINE_DIR.mkdir(exist_ok=True)
+    path = BASELINE_DIR / f"{name}.json"
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    return path
+
+
+def compare(baseline: Dict[str, Any], report: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions of report against baseline, as readable lines"""
+    regressions = []
+    if baseline.get("settings") != report["settings"]:
+        print("warning: the baseline was recorded with different settings, "
+              f"{baseline.get('settings')} vs {report['settings']}")
+    for scenario, current in report["results"].items():
+        previous = baseline.get("results", {}).get(scenario)
+        if not previous:
+            continue
+        checks = (("ops_per_sec", -1), ("p99_ms", 1), ("cpu_ms_per_op", 1), ("peak_kib_per_op", 1),
+                  ("retained_kib_per_op", 1))
+        for metric, direction in checks:
+            before, after = previous.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if change * direction > tolerance:
+                regressions.append(f"{scenario}: {metric} {before} -> {after} ({change:+.0%})")
+    return regressions
+
+
+def print_results(results: Dict[str, Dict[str, Any]], baseline: Optional[Dict[str, Any]]) -> None:
+    def row(label: str, summary: Dict[str, Any]) -> str:
+        return (f"{label:15s}{summary['ops_per_sec']:9.2f}{summary['p50_ms']:9.1f}{summary['p95_ms']:9.1f}"
+                f"{summary['p99_ms']:9.1f}{summary.get('cpu_ms_per_op', 0):9.2f}{summary['peak_kib_per_op']:10.1f}"
+                f"{summary['retained_kib_per_op']:10.1f}{summary['errors']:8d}")
+
+    print(f"{'scenario':15s}{'ops/s':>9s}{'p50 ms':>9s}{'p95 ms':>9s}{'p99 ms':>9s}{'CPU ms':>9s}"
+          f"{'peak KiB':>10s}{'kept KiB':>10s}{'errors':>8s}")
+    for scenario, summary in results.items():
+        print(row(scenario, summary))
+        previous = (baseline or {}).get("results", {}).get(scenario)
+        if previous:
+            print(row("  baseline", previous))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ZerePy's hot paths against local fake services")
+    parser.add_argument("scenarios", nargs="*", metavar="SCENARIO",
+                        help=f"Scenarios to run (default: all): {', '.join(SCENARIOS)}")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--alloc-iterations", type=int, default=5,
+                        help="Operations measured with tracemalloc, 0 to skip allocations")
+    parser.add_argument("--save", metavar="NAME", help="Save the results as bench/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="Compare with bench/baselines/NAME.json")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Relative change counted as a regression (default: 0.15)")
+    parser.add_argument("--stats", action="store_true", help="Print the requests each fake service served")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario {', '.join(unknown)}, expected one of {', '.join(SCENARIOS)}")
+    baseline = None
+    if args.compare:
+        with open(BASELINE_DIR / f"{args.compare}.json") as f:
+            baseline = json.load(f)
+
+    logging.disable(logging.CRITICAL)
+    results = {}
+    with FakeServices(faults_from_args(args)) as fakes, redirect_hosts(fakes.host_map()):
+        os.environ.update(fakes.env())
+        for name in args.scenarios or SCENARIOS:
+            try:
+                operation = SCENARIOS[name](args)
+            except Skipped as e:
+                print(f"{name}: skipped, {e}")
+                continue
+            results[name] = measure(name, operation, args.iterations, args.warmup, args.alloc_iterations).summary()
+        if args.stats:
+            for name, stats in fakes.stats().items():
+                print(f"{name:12s}{stats['requests']:7d} requests {stats['errors']:5d} injected errors")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": settings(args),
+        "results": results,
+    }
+    print_results(results, baseline)
+    if args.save:
+        print(f"Saved baseline to {save_baseline(args.save, report)}")
+    if baseline is not None:
+        regressions = compare(baseline, report, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,65 @@
 import argparse
-from src.cli import ZerePyCLI
+import os
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='ZerePy - AI Agent Framework')
     parser.add_argument('--server', action='store_true', help='Run in server mode')
     parser.add_argument('--host', default='0.0.0.0', help='Server host (default: 0.0.0.0)')
     parser.add_argument('--port', type=int, default=8000, help='Server port (default: 8000)')
+    parser.add_argument('--executor-threads', type=int, default=32,
+                        help='Worker threads for blocking agent work in server mode (default: 32)')
+    parser.add_argument('--max-concurrent-requests', type=int, default=4,
+                        help='LLM requests the server runs at once per agent (default: 4)')
+    parser.add_argument('--max-queue', type=int, default=16,
+                        help='Requests queued per agent before the server answers 429 (default: 16)')
+    parser.add_argument('--queue-timeout', type=float, default=30.0,
+                        help='Seconds a queued request waits before the server answers 503 (default: 30)')
+    parser.add_argument('--max-agents', type=int, default=8,
+                        help='Agents the server keeps loaded, least recently used idle ones are evicted (default: 8)')
+    parser.add_argument('--agent-idle-timeout', type=float, default=900.0,
+                        help='Seconds before the server evicts an unused agent, 0 keeps them (default: 900)')
+    parser.add_argument('--supervise', nargs='+', metavar='AGENT',
+                        help='Run the given agents on a shared pool of worker processes')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes for --supervise (default: number of cores)')
+    parser.add_argument('--profile-startup', nargs='?', const='', metavar='AGENT',
+                        help='Report import and construction time of every connection of an agent and exit')
+    parser.add_argument('--trace', metavar='PATH',
+                        help='Write tracing spans to PATH, Chrome trace format if it ends in .json, JSONL otherwise')
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument('--record', metavar='CASSETTE',
+                          help='Record every HTTP exchange of the connections to CASSETTE (.gz to compress)')
+    cassette.add_argument('--replay', metavar='CASSETTE',
+                          help='Answer HTTP requests from CASSETTE instead of the network')
+    parser.add_argument('--replay-timing', choices=['original', 'zero'], default='original',
+                        help='Replay with the recorded latency or without any (default: original)')
     args = parser.parse_args()
 
-    if args.server:
+    if args.trace:
+        # Through the environment so supervised worker processes trace too
+        os.environ["ZEREPY_TRACE"] = args.trace
+    if args.record or args.replay:
+        os.environ["ZEREPY_CASSETTE"] = args.record or args.replay
+        os.environ["ZEREPY_CASSETTE_MODE"] = "record" if args.record else "replay"
+        os.environ["ZEREPY_CASSETTE_TIMING"] = args.replay_timing
+
+    if args.profile_startup is not None:
+        from src.startup_profile import profile_startup
+        profile_startup(args.profile_startup or None)
+    elif args.supervise:
+        from src.supervisor import AgentSupervisor
+        AgentSupervisor(args.supervise, workers=args.workers).run()
+    elif args.server:
         try:
             from src.server import start_server
-            start_server(host=args.host, port=args.port)
+            start_server(host=args.host, port=args.port, executor_threads=args.executor_threads,
+                         max_concurrent_requests=args.max_concurrent_requests,
+                         max_queue=args.max_queue, queue_timeout=args.queue_timeout,
+                         max_agents=args.max_agents, agent_idle_timeout=args.agent_idle_timeout)
         except ImportError:
             print("Server dependencies not installed. Run: poetry install --extras server")
             exit(1)
     else:
+        from src.cli import ZerePyCLI
         cli = ZerePyCLI()
         cli.main_loop()
\ No newline at end of file
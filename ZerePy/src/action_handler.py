@@ -1,5 +1,11 @@
+import asyncio
+import inspect
 import logging
 
+from src.metrics import AGENT_ACTION_SECONDS
+from src.tracing import span
+from src.usage import usage_scope
+
 logger = logging.getLogger("action_handler")
 
 action_registry = {}
@@ -10,9 +16,37 @@ def register_action(action_name):
         return func
     return decorator
 
+def _usage_scope(agent, action_name):
+    # LLM calls made by the action are attributed to it in the usage ledger
+    if hasattr(agent, "usage_scope"):
+        return agent.usage_scope(action_name)
+    return usage_scope(action=action_name)
+
 def execute_action(agent, action_name, **kwargs):
     if action_name in action_registry:
-       return action_registry[action_name](agent, **kwargs)
+       handler = action_registry[action_name]
+       with _usage_scope(agent, action_name), AGENT_ACTION_SECONDS.time(action=action_name), \
+               span(f"action:{action_name}"):
+           if inspect.iscoroutinefunction(handler):
+               # Async handlers called from sync code get their own event loop
+               return asyncio.run(handler(agent, **kwargs))
+           return handler(agent, **kwargs)
+    else:
+        logger.error(f"Action {action_name} not found")
+        return None
+
+async def aexecute_action(agent, action_name, **kwargs):
+    """Async counterpart of execute_action. Sync handlers run in a worker thread
+    so they never block the event loop."""
+    if action_name in action_registry:
+        handler = action_registry[action_name]
+        with _usage_scope(agent, action_name), AGENT_ACTION_SECONDS.time(action=action_name), \
+                span(f"action:{action_name}"):
+            if inspect.iscoroutinefunction(handler):
+                return await handler(agent, **kwargs)
+            if hasattr(agent, "run_in_thread"):
+                return await agent.run_in_thread(handler, agent, **kwargs)
+            return await asyncio.to_thread(handler, agent, **kwargs)
     else:
         logger.error(f"Action {action_name} not found")
         return None
@@ -1,14 +1,20 @@
 from src.action_handler import register_action
 from src.helpers import print_h_bar
 import os
+import threading
+import time
 from dotenv import load_dotenv
 import json
-import requests
-from moralis import evm_api
+from src.http_session import SLOW_TIMEOUT, get_session
+from src.rate_limit import GOVERNOR
 
 load_dotenv()
 
 DEPLOY_TOKEN_URL = os.getenv("DEPLOY_TOKEN_URL")
+# Start of Discord's snowflake ids, in milliseconds since the Unix epoch
+DISCORD_EPOCH_MS = 1420070400000
+# Guards checking and marking a message as taken, the gateway workers and a REST poll may see the same one
+_CLAIM_LOCK = threading.Lock()
 SYSTEM_PROMPT = """You are an expert in analyzing Sonic Protocol tokens and smart contracts for potential rug pulls and security risks.
     Your task is to provide a comprehensive security analysis of tokens, focusing on these key areas:
 
@@ -125,8 +131,22 @@ def list_channels(agent, **kwargs) -> dict:
     return list_channels
 
 
+def _channel_cursor(channel_id) -> str:
+    return f"discord_channel:{channel_id}"
+
+
+def _snowflake_now() -> int:
+    """Message id Discord would give a message posted now"""
+    return int(time.time() * 1000 - DISCORD_EPOCH_MS) << 22
+
+
 @register_action("read-mentioned-messages")
 def read_mentioned_messages(agent, **kwargs) -> list:
+    """Messages mentioning the bot that were posted since the last read, over REST. Each
+    channel has a cursor at the newest message read, so a mention is not missed when
+    other messages follow it. A channel without a cursor only gets one, at its newest
+    message, so the first run does not answer old requests."""
+    discord = agent.connection_manager.connections["discord"]
     list_channels = agent.connection_manager.perform_action(
         connection_name="discord",
         action_name="list-channels",
@@ -135,85 +155,155 @@ def read_mentioned_messages(agent, **kwargs) -> list:
     agent.logger.info(list_channels)
     list_messages = []
     for channel in list_channels:
-        mentioned_messages = agent.connection_manager.perform_action(
+        cursor = agent.state_store.get_cursor(agent.name, _channel_cursor(channel["id"]))
+        if not cursor:
+            newest = agent.connection_manager.perform_action(
+                connection_name="discord",
+                action_name="read-messages",
+                params=[channel["id"], 1, None]
+            )
+            if newest is not None:
+                agent.state_store.advance_cursor(agent.name, _channel_cursor(channel["id"]),
+                                                 int(newest[0]["id"]) if newest else _snowflake_now())
+            continue
+        messages = agent.connection_manager.perform_action(
             connection_name="discord",
-            action_name="read-mentioned-messages",
-            params=[channel["id"], 1]
+            action_name="read-messages",
+            params=[channel["id"], discord.config["message_read_count"], str(cursor)]
         )
+        if not messages:
+            continue
+        mentioned_messages = discord._filter_message_for_bot_mentions(messages)
         agent.logger.info(mentioned_messages)
-        if mentioned_messages:
-            list_messages.append(mentioned_messages[0])
+        list_messages.extend(mentioned_messages)
+        agent.state_store.advance_cursor(agent.name, _channel_cursor(channel["id"]),
+                                         max(int(message["id"]) for message in messages))
     return list_messages
 
 
+def _claim(agent, kind: str, message_id) -> bool:
+    """Mark a message as taken by kind, False if it already was. Messages are claimed before
+    they are handled, so a token is never deployed twice for one message."""
+    taken = agent.state_store.seen_set(agent.name, kind)
+    with _CLAIM_LOCK:
+        if not message_id or message_id in taken:
+            return False
+        taken.add(message_id)
+        return True
+
+
+def _reply(agent, name: str, handle, message) -> None:
+    if not _claim(agent, f"discord_{name}", message.get("id")):
+        return
+    agent.logger.info(message)
+    reply_text = handle(agent, message)
+    if not reply_text:
+        return
+    agent.connection_manager.perform_action(
+        connection_name="discord",
+        action_name="reply-to-message",
+        params=[message.get('channel_id'), message.get("id"), reply_text]
+    )
+    agent.logger.info(f"\n🚀 Posting reply: '{reply_text}'")
+
+
+def _dispatch_mention(agent, message) -> None:
+    """Run every handler subscribed to the gateway on a message it delivered"""
+    for name, handle in list(agent.discord_handlers.items()):
+        try:
+            _reply(agent, name, handle, message)
+        except Exception as e:
+            agent.logger.error(f"{name} failed on Discord message {message.get('id')}: {e}")
+
+
+def _handle_mentions(agent, name: str, handle):
+    """Reply to messages mentioning the bot with handle(agent, message).
+
+    With the connection's gateway on (the default), the first call subscribes the agent to
+    the Discord Gateway and reads what was posted while the agent was away over REST. A
+    connection shared by several agents runs one gateway that dispatches to each of them.
+    Mentions are then handled as they arrive, and later calls only report how the gateway
+    is doing. Calls poll every channel over REST while the gateway is off or disconnected,
+    messages seen both ways are handled once. Only REST reads move the channel cursors, so
+    a poll after a failed RESUME reads everything the gateway may have missed.
+    """
+    discord = agent.connection_manager.connections["discord"]
+    if not hasattr(agent, "discord_handlers"):
+        agent.discord_handlers = {}
+    subscribed = name in agent.discord_handlers
+    agent.discord_handlers[name] = handle
+
+    if discord.config.get("gateway", True):
+        gateway = discord.start_gateway(agent.name, lambda message: agent.run_in_thread(_dispatch_mention, agent, message))
+        if gateway.connected and subscribed:
+            return gateway.snapshot()
+
+    for message in read_mentioned_messages(agent):
+        try:
+            _reply(agent, name, handle, message)
+        except Exception as e:
+            agent.logger.error(f"{name} failed on Discord message {message.get('id')}: {e}")
+    return True
+
+
+def _deploy_token_reply(agent, message):
+    url = f"{DEPLOY_TOKEN_URL}api/memecoin/create-for-user"
+    data = {
+        "isTwitter": True,
+        "twitterHandle": message.get('mentions')[0].get("username"),
+        "input": message.get('message'),
+    }
+    agent.logger.info(data)
+    # The message is claimed before this runs, so a failure here never deploys it twice
+    response = get_session("deploy_token").post(url, json=data, timeout=SLOW_TIMEOUT)
+    response.raise_for_status()
+    result = response.json()
+    agent.logger.info(f"\n✅ Deploy token successfully! with {result}")
+
+    # Generate natural language reponse given the json data
+    llm_message = agent.prompt_llm(prompt="Generate a message discord given the response",
+                                   system_prompt=json.dumps(result))
+    agent.logger.info(f"\n📝 Generated response: {llm_message}")
+    return llm_message
+
+
 @register_action("deploy-token-discord")
 def deploy_token_discord(agent, **kwargs):
     agent.logger.info("\n📝 Deploying token with discord")
     print_h_bar()
-    url = f"{DEPLOY_TOKEN_URL}api/memecoin/create-for-user"
+    return _handle_mentions(agent, "deploy-token-discord", _deploy_token_reply)
 
-    messages = read_mentioned_messages(agent, **kwargs)
 
-    responses = []
-    for message in messages:
-        agent.logger.info(message)
-        data = {
-            "isTwitter": True,
-            "twitterHandle": message.get('mentions')[0].get("username"),
-            "input": message.get('message'),
-        }
-        agent.logger.info(data)
-        response = requests.post(url, json=data)
-        agent.logger.info(f"\n✅ Deploy token successfully! with {response.json()}")
-
-        # Generate natural language reponse given the json data
-        llm_message = agent.prompt_llm(prompt="Generate a message discord given the response",
-                                       system_prompt=json.dumps(response.json()))
-        agent.logger.info(f"\n📝 Generated response: {llm_message}")
-        responses.append({
-            "message_id": message.get("id"),
-            "channel_id": message.get('channel_id'),
-            "response": llm_message
-        })
-
-    # json response -> reply to tweet
-    for response in responses:
-        message_id = response['message_id']
-        channel_id = response['channel_id']
-        reply_text = response['response']
-
-        agent.connection_manager.perform_action(
-            connection_name="discord",
-            action_name="reply-to-message",
-            params=[channel_id, message_id, reply_text]
-        )
-        agent.logger.info(f"\n🚀 Posting reply: '{reply_text}'")
-    return
+def _rug_detect_reply(agent, message):
+    if "check anti-rug" not in message.get('message'):
+        return None
 
+    # Imported here so the Moralis SDK is only loaded by agents that run rug detection
+    from moralis import evm_api
 
-@register_action("rug-detect")
-def rug_detect(agent, **kwargs):
     def get_token_owners(address):
-        result = evm_api.token.get_token_owners(
-          api_key=os.getenv("MORALIS_API_KEY"),
-          params={
-            "chain": "fantom",
-            "order": "DESC",
-            "token_address": address
-          },
-        )
+        with GOVERNOR.guard("moralis", "token"):
+            result = evm_api.token.get_token_owners(
+              api_key=os.getenv("MORALIS_API_KEY"),
+              params={
+                "chain": "fantom",
+                "order": "DESC",
+                "token_address": address
+              },
+            )
         data = result["result"][:10]
         return map(lambda x: {"address": x["owner_address"], "balance": x["balance_formatted"], "percentage_owned_to_total_supply": x["percentage_relative_to_total_supply"]}, data)
 
     def get_token_transfers(address):
-        result = evm_api.token.get_token_transfers(
-          api_key=os.getenv("MORALIS_API_KEY"),
-          params={
-            "chain": "fantom",
-            "order": "DESC",
-            "address": address
-          },
-        )
+        with GOVERNOR.guard("moralis", "token"):
+            result = evm_api.token.get_token_transfers(
+              api_key=os.getenv("MORALIS_API_KEY"),
+              params={
+                "chain": "fantom",
+                "order": "DESC",
+                "address": address
+              },
+            )
         data = result["result"][:10]
         return map(lambda x: {"from": x["from_address"], "to": x["to_address"], "value": x["value_decimal"], "block_timestamp": x["block_timestamp"]}, data)
 
@@ -223,58 +313,29 @@ def rug_detect(agent, **kwargs):
             "addresses": [address]
         }
 
-        result = evm_api.token.get_token_metadata(
-        api_key=os.getenv("MORALIS_API_KEY"),
-        params=params,
-        )
+        with GOVERNOR.guard("moralis", "token"):
+            result = evm_api.token.get_token_metadata(
+            api_key=os.getenv("MORALIS_API_KEY"),
+            params=params,
+            )
         return result[0]
 
-    # system prompt
-
-
-    messages = read_mentioned_messages(agent, **kwargs)
-
-    responses = []
-    for message in messages:
-        agent.logger.info(message)
-        if "check anti-rug" in message.get('message'):
-            address = message.get('message').split(" ")[-1]
-            data = {
-                "holders": list(get_token_owners(address)),
-                "transactions": list(get_token_transfers(address)),
-                "token_info": get_token_metadata(address)
-            }
-            agent.logger.info(USER_PROMPT.format(data=json.dumps(data, indent=2)))
-            llm_analysis = agent.prompt_llm(prompt=USER_PROMPT.format(data=json.dumps(data, indent=2)), system_prompt=SYSTEM_PROMPT)
-            agent.logger.info(f"\n📝 Generated response: {llm_analysis}")
-            agent.logger.info(len(llm_analysis))
-
-            if len(llm_analysis) > 2000:
-                llm_summary = agent.prompt_llm(prompt=llm_analysis,
-                                                system_prompt="summary response under 300 words")
-                responses.append({
-                    "message_id": message.get("id"),
-                    "channel_id": message.get('channel_id'),
-                    "response": llm_summary
-                })
-            else:
-                responses.append({
-                    "message_id": message.get("id"),
-                    "channel_id": message.get('channel_id'),
-                    "response": llm_analysis
-                })
-
-    # json response -> reply to tweet
-    for response in responses:
-        message_id = response['message_id']
-        channel_id = response['channel_id']
-        reply_text = response['response']
-
-        agent.connection_manager.perform_action(
-            connection_name="discord",
-            action_name="reply-to-message",
-            params=[channel_id, message_id, reply_text]
-        )
-        agent.logger.info(f"\n🚀 Posting reply successfully! ")
+    address = message.get('message').split(" ")[-1]
+    data = {
+        "holders": list(get_token_owners(address)),
+        "transactions": list(get_token_transfers(address)),
+        "token_info": get_token_metadata(address)
+    }
+    agent.logger.info(USER_PROMPT.format(data=json.dumps(data, indent=2)))
+    llm_analysis = agent.prompt_llm(prompt=USER_PROMPT.format(data=json.dumps(data, indent=2)), system_prompt=SYSTEM_PROMPT)
+    agent.logger.info(f"\n📝 Generated response: {llm_analysis}")
+    agent.logger.info(len(llm_analysis))
+
+    if len(llm_analysis) > 2000:
+        return agent.prompt_llm(prompt=llm_analysis, system_prompt="summary response under 300 words")
+    return llm_analysis
 
-    return
\ No newline at end of file
+
+@register_action("rug-detect")
+def rug_detect(agent, **kwargs):
+    return _handle_mentions(agent, "rug-detect", _rug_detect_reply)
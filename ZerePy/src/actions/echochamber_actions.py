@@ -9,8 +9,6 @@ def post_echochambers(agent, **kwargs):
     # Initialize state
     if "echochambers_last_message" not in agent.state:
         agent.state["echochambers_last_message"] = 0
-    if "echochambers_replied_messages" not in agent.state:
-        agent.state["echochambers_replied_messages"] = set()
     
     if current_time - agent.state["echochambers_last_message"] > agent.echochambers_message_interval:
         agent.logger.info("\n📝 GENERATING NEW ECHOCHAMBERS MESSAGE")
@@ -43,10 +41,8 @@ def post_echochambers(agent, **kwargs):
 def reply_echochambers(agent, **kwargs):
     agent.logger.info("\n🔍 CHECKING FOR MESSAGES TO REPLY TO")
     
-    # Initialize replied messages set if not exists
-    if "echochambers_replied_messages" not in agent.state:
-        agent.state["echochambers_replied_messages"] = set()
-        
+    # Messages already replied to, kept in the state store so restarts do not reply twice
+    replied_messages = agent.state_store.seen_set(agent.name, "echochambers_replied")
 
     # Get recent messages
     history = agent.connection_manager.perform_action(
@@ -72,7 +68,7 @@ def reply_echochambers(agent, **kwargs):
             # 1. It's our message
             # 2. We've already replied to it
             if (sender_username == agent.connection_manager.connections["echochambers"].config["sender_username"] or 
-                message_id in agent.state.get("echochambers_replied_messages", set())):
+                message_id in replied_messages):
                 agent.logger.info(f"Skipping message from {sender_username} (already replied or own message)")
                 continue
                 
@@ -96,7 +92,7 @@ def reply_echochambers(agent, **kwargs):
                     action_name="send-message",
                     params=[reply]
                 )
-                agent.state["echochambers_replied_messages"].add(message_id)
+                replied_messages.add(message_id)
                 agent.logger.info("✅ Reply posted successfully!")
                 return True
     else:
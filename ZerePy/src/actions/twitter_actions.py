@@ -1,8 +1,8 @@
-import threading
 from src.action_handler import register_action
 from src.helpers import print_h_bar
 from src.prompts import REPLY_TWEET_PROMPT
-import requests
+from src.http_session import SLOW_TIMEOUT, get_session
+from src.twitter_stream import DEFAULT_QUEUE_SIZE, DEFAULT_STALL_TIMEOUT, DEFAULT_WORKERS, TwitterStreamConsumer
 import os
 from dotenv import load_dotenv
 import json
@@ -10,17 +10,22 @@ import json
 load_dotenv()
 
 DEPLOY_TOKEN_URL = os.getenv("DEPLOY_TOKEN_URL")
+# State store cursor holding the newest mention already handled
+MENTIONS_CURSOR = "twitter_mentions"
+# Agent state key of a read stopped at the page limit: the token of its first unread page
+# and the newest id it saw, the cursor moves there once the older pages are read
+MENTIONS_BACKLOG = "twitter_mentions_backlog"
 
 
 @register_action("post-tweet")
-def post_tweet(agent, **kwargs):
+def post_tweet(agent, text=None, **kwargs):
     agent.logger.info("\n📝 GENERATING NEW TWEET")
     print_h_bar()
 
     agent.connection_manager.perform_action(
         connection_name="twitter",
         action_name="post-tweet",
-        params=[agent.answer]
+        params=[text]
     )
     agent.logger.info("\n✅ Tweet posted successfully!")
     return True
@@ -66,8 +71,8 @@ def like_tweet(agent, **kwargs):
         if not tweet_id:
             return False
 
-        is_own_tweet = tweet.get(
-            'author_username', '').lower() == agent.username
+        # Compared by id, which needs no username lookup
+        is_own_tweet = tweet.get('author_id') == os.getenv("TWITTER_USER_ID")
         if is_own_tweet:
             replies = agent.connection_manager.perform_action(
                 connection_name="twitter",
@@ -93,57 +98,121 @@ def like_tweet(agent, **kwargs):
     return False
 
 
-@register_action("respond-to-mentions")
-def respond_to_mentions(agent, **kwargs):  # REQUIRES TWITTER PREMIUM PLAN
+def _reply_to_mention(agent, tweet):
+    """Reply to one streamed mention, at most once per tweet"""
+    replied = agent.state_store.seen_set(agent.name, "twitter_stream_replied")
+    tweet_id = tweet.get('id')
+    if not tweet_id or tweet_id in replied:
+        return
+    agent.logger.info(f"Received a mention: {tweet.get('text')}")
+    reply_text = agent.prompt_llm(prompt=REPLY_TWEET_PROMPT.format(tweet_text=tweet.get('text')),
+                                  system_prompt=agent._construct_system_prompt())
+    if reply_text:
+        reply = agent.connection_manager.perform_action(
+            connection_name="twitter",
+            action_name="reply-to-tweet",
+            params=[tweet_id, reply_text]
+        )
+        if reply is None:
+            # Not recorded, so the mention is answered if Twitter delivers it again
+            agent.logger.warning(f"Could not reply to mention {tweet_id}")
+            return
+        replied.add(tweet_id)
+        agent.logger.info(f"\n🚀 Replied to mention {tweet_id}: '{reply_text}'")
 
-    filter_str = f"@{agent.username} -is:retweet"
-    stream_function = agent.connection_manager.perform_action(
-        connection_name="twitter",
-        action_name="stream-tweets",
-        params=[filter_str]
-    )
 
-    def process_tweets():
-        for tweet_data in stream_function:
-            tweet_id = tweet_data["id"]
-            tweet_text = tweet_data["text"]
-            agent.logger.info(f"Received a mention: {tweet_text}")
+@register_action("respond-to-mentions")
+def respond_to_mentions(agent, **kwargs):  # REQUIRES TWITTER PREMIUM PLAN
+    """Start replying to mentions as they are streamed, once per agent. Later calls only
+    report how the stream is doing."""
+    consumer = getattr(agent, "mention_stream", None)
+    if consumer is not None and consumer.running:
+        return consumer.snapshot()
 
-    processing_thread = threading.Thread(target=process_tweets)
-    processing_thread.daemon = True
-    processing_thread.start()
+    twitter = agent.connection_manager.connections["twitter"]
+    username = getattr(agent, "username", None) or twitter._get_authenticated_user_info()[1]
+    filter_str = f"@{username} -is:retweet"
 
+    consumer = agent.mention_stream = TwitterStreamConsumer(
+        twitter,
+        filter_str,
+        lambda tweet: agent.run_in_thread(_reply_to_mention, agent, tweet),
+        workers=twitter.config.get("stream_workers", DEFAULT_WORKERS),
+        queue_size=twitter.config.get("stream_queue_size", DEFAULT_QUEUE_SIZE),
+        stall_timeout=twitter.config.get("stream_stall_timeout", DEFAULT_STALL_TIMEOUT),
+    )
+    consumer.start()
+    agent.logger.info(f"\n👂 Streaming mentions of @{username}")
+    return True
 
-@register_action("get-mentioned-tweets")
-def get_mentioned_tweets(agent, **kwargs):
-    agent.logger.info("\n📝 Retrieving mentioned tweets")
-    print_h_bar()
 
-    tweets = agent.connection_manager.perform_action(
+def _read_mentions(agent):
+    """Subscribed users' mentions newer than the mentions cursor, and the read position to
+    pass to _advance_mentions() once the tweets are handled. The position is None when a
+    read or the subscriber lookup failed, so the cursor stays put."""
+    since_id = agent.state_store.get_cursor(agent.name, MENTIONS_CURSOR)
+    backlog = agent.state.get(MENTIONS_BACKLOG) or {}
+    result = agent.connection_manager.perform_action(
         connection_name="twitter",
         action_name="get-mentioned-tweets",
-        params=[]
+        params={"since_id": str(since_id) if since_id else None,
+                "pagination_token": backlog.get("pagination_token")}
     )
+    if result is None:
+        return [], None
 
-    selected_tweets = []
+    new_tweets = [tweet for tweet in result["tweets"] if not since_id or int(tweet.get('id')) > since_id]
+    newest_id = max([since_id or 0, backlog.get("newest_id") or 0] +
+                    [int(tweet.get('id')) for tweet in new_tweets]) or None
+    position = (newest_id, result["next_token"])
+    if not new_tweets:
+        return [], position
 
-    for tweet in tweets:
-        tweet_id = tweet.get('id')
-        tweet_text = tweet.get('text')
-        agent.logger.info(f"Processing tweet: {tweet.get('text')}")
+    # One lookup for every author instead of a query per tweet
+    subscribed = agent.connection_manager.perform_action(
+        connection_name="supabase",
+        action_name="check-subscribed-users",
+        params=[[tweet.get('author_id') for tweet in new_tweets]]
+    )
+    if subscribed is None:
+        # The lookup failed, keep the cursor so these mentions are read again next time
+        agent.logger.warning("Could not check mention authors' subscriptions, will retry")
+        return [], None
+    subscribed = set(subscribed)
 
-        tweet_author = tweet.get('author_id')
-        tweet_username = tweet.get('username')
-        if agent.connection_manager.perform_action(
-                connection_name="supabase",
-                action_name="check-subscribed-user",
-                params=[tweet_author]
-        ):
+    selected_tweets = []
+    for tweet in new_tweets:
+        agent.logger.info(f"Processing tweet: {tweet.get('text')}")
+        if str(tweet.get('author_id')) in subscribed:
             selected_tweets.append({
-                "tweet_id": tweet_id,
-                "text": tweet_text,
-                "username": tweet_username
+                "tweet_id": tweet.get('id'),
+                "text": tweet.get('text'),
+                "username": tweet.get('author_username')
             })
+    return selected_tweets, position
+
+
+def _advance_mentions(agent, position) -> None:
+    """Mark a _read_mentions() read as handled"""
+    if position is None:
+        return
+    newest_id, next_token = position
+    if next_token:
+        # Older pages are still unread, the cursor stays and the next read goes on from there
+        agent.state[MENTIONS_BACKLOG] = {"pagination_token": next_token, "newest_id": newest_id}
+        return
+    agent.state.pop(MENTIONS_BACKLOG, None)
+    if newest_id:
+        agent.state_store.advance_cursor(agent.name, MENTIONS_CURSOR, newest_id)
+
+
+@register_action("get-mentioned-tweets")
+def get_mentioned_tweets(agent, **kwargs):
+    agent.logger.info("\n📝 Retrieving mentioned tweets")
+    print_h_bar()
+
+    selected_tweets, position = _read_mentions(agent)
+    _advance_mentions(agent, position)
 
     agent.logger.info("\n✅ Tweets retrieved successfully!")
     return selected_tweets
@@ -154,34 +223,42 @@ def deploy_token(agent, **kwargs):
     agent.logger.info("\n📝 Deploying token")
     print_h_bar()
     url = f"{DEPLOY_TOKEN_URL}api/memecoin/create-for-user"
-    tweets = get_mentioned_tweets(agent, **kwargs)
+    agent.logger.info("\n📝 Retrieving mentioned tweets")
+    tweets, position = _read_mentions(agent)
     agent.logger.info(tweets)
-    responses = []
-    for tweet in tweets:
+    # Tweets already deployed for, in case the last run stopped before advancing the cursor
+    deployed = agent.state_store.seen_set(agent.name, "twitter_deployed")
+    # Set when a deploy failed, the cursor then stays so the tweet is read again
+    retry = False
+    for tweet in deployed.filter_unseen(tweets, key=lambda tweet: tweet.get('tweet_id')):
+        tweet_id = tweet.get('tweet_id')
         data = {
             "isTwitter": True,
             "twitterHandle": tweet.get('username'),
             "input": tweet.get('text'),
         }
-        response = requests.post(url, json=data)
-        agent.logger.info("\n✅ Deploy token successfully!")
-        agent.logger.info(response.json())
-        # Generate natural language reponse given the json data
-        llm_tweet = agent.prompt_llm(prompt="Generate a tweet given the response under 40 words", system_prompt=json.dumps(response.json()))
-        agent.logger.info(f"\n📝 Generated response: {llm_tweet}")
-        responses.append({
-            "tweet_id": tweet.get('tweet_id'),
-            "response": llm_tweet
-        })
-
-    # json response -> reply to tweet
-    for response in responses:
-        tweet_id = response['tweet_id']
-        reply_text = response['response']
-        agent.connection_manager.perform_action(
-            connection_name="twitter",
-            action_name="reply-to-tweet",
-            params=[tweet_id, reply_text]
-        )
-        agent.logger.info(f"\n🚀 Posting reply: '{reply_text}'")
+        try:
+            response = get_session("deploy_token").post(url, json=data, timeout=SLOW_TIMEOUT)
+            response.raise_for_status()
+            # Marked before anything else can fail, so the token is never deployed twice
+            deployed.add(tweet_id)
+            result = response.json()
+            agent.logger.info("\n✅ Deploy token successfully!")
+            agent.logger.info(result)
+            # Generate natural language reponse given the json data
+            reply_text = agent.prompt_llm(prompt="Generate a tweet given the response under 40 words", system_prompt=json.dumps(result))
+            agent.logger.info(f"\n📝 Generated response: {reply_text}")
+
+            # json response -> reply to tweet
+            agent.connection_manager.perform_action(
+                connection_name="twitter",
+                action_name="reply-to-tweet",
+                params=[tweet_id, reply_text]
+            )
+            agent.logger.info(f"\n🚀 Posting reply: '{reply_text}'")
+        except Exception as e:
+            agent.logger.error(f"Deploying a token for tweet {tweet_id} failed: {e}")
+            retry = retry or tweet_id not in deployed
+    if not retry:
+        _advance_mentions(agent, position)
     return
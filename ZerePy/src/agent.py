@@ -1,14 +1,28 @@
+import asyncio
 import json
 import logging
+import threading
 import time
+from contextlib import aclosing
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional, Any
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
 import src.actions.twitter_actions
 import src.actions.supabase_actions
 import src.actions.discord_actions
-from src.action_handler import execute_action
+from src.action_handler import execute_action, aexecute_action
+from src.connection_health import DEFAULT_HEALTH_TTL
 from src.connection_manager import ConnectionManager
+from src.llm_cache import create_llm_cache, llm_cache_key
+from src.metrics import PROMPT_LLM_SECONDS
+from src.retry import RetryPolicy
+from src.prompts import TASK_EPISODE_PROMPT
+from src.scheduler import ScheduledTask, TaskScheduler
+from src.state_store import create_state_store
+from src.tracing import span, traced
+from src.usage import TokenUsage, UsageMeter, create_usage_ledger, usage_scope
 from src.helpers import print_h_bar
+from src.helpers.streaming import aiter_in_thread, stream_until
 
 REQUIRED_FIELDS = ["name", "bio", "traits",
                    "examples", "loop_delay", "config", "tasks"]
@@ -16,10 +30,55 @@ REQUIRED_FIELDS = ["name", "bio", "traits",
 logger = logging.getLogger("agent")
 
 
+@dataclass
+class ReActEpisode:
+    """Scratch state of one Thought/Action/Observation episode. Each loop iteration and
+    server request gets its own, so episodes of one agent can run concurrently."""
+    steps: int = 0
+    answer: Optional[str] = None
+    obs: Any = None
+    usage: Optional[TokenUsage] = None
+
+
+# Thought/Action/Observation steps per episode before it is finished with finish[]
+REACT_STEPS = 4
+
+
+def _thought_request(prompt: str, i: int) -> Dict[str, Any]:
+    """prompt_llm arguments for the thought and action of step i"""
+    return {"prompt": prompt + f"Thought {i}:", "stop": [f"Observation {i}:"]}
+
+
+def _parse_step(text: str, i: int) -> Tuple[str, Optional[str]]:
+    """(thought, action) written for step i, action is None when the model left it out"""
+    try:
+        thought, action_name = text.strip().split(f"Action {i}:")
+    except ValueError:
+        logger.info(f'ohh... {text}')
+        return text.strip().split('\n')[0], None
+    return thought, action_name.strip()
+
+
+def _action_request(prompt: str, i: int, thought: str) -> Dict[str, Any]:
+    """prompt_llm arguments asking again for the action of step i, after _parse_step found none"""
+    return {"prompt": prompt + f"Thought {i}: {thought}\nAction {i}:", "stop": ["\n"]}
+
+
+def _env_action(action_name: str) -> str:
+    """Action as env() takes it, Call[...] and Finish[...] lowercased"""
+    return action_name[:1].lower() + action_name[1:]
+
+
+def _step_record(i: int, thought: str, action_name: str, obs: Any) -> str:
+    """Step i as it is appended to the prompt of the next one"""
+    return f"Thought {i}: {thought}\nAction {i}: {action_name}\nObservation {i}: {obs}\n"
+
+
 class ZerePyAgent:
     def __init__(
             self,
-            agent_name: str
+            agent_name: str,
+            connection_pool=None
     ):
         try:
             agent_path = Path("agents") / f"{agent_name}.json"
@@ -36,21 +95,64 @@ class ZerePyAgent:
             self.traits = agent_dict["traits"]
             self.examples = agent_dict["examples"]
             self.loop_delay = agent_dict["loop_delay"]
-            self.connection_manager = ConnectionManager(agent_dict["config"])
+
+            # Agent state, cursors and seen-item sets persisted across restarts, see src/state_store.py
+            self.state_store = create_state_store(agent_dict.get("state_store"))
+            self.state = self.state_store.agent_state(self.name)
+
+            self.connection_manager = ConnectionManager(
+                agent_dict["config"],
+                connection_pool,
+                health_ttl=agent_dict.get("health_check_ttl", DEFAULT_HEALTH_TTL),
+                health_refresh_interval=agent_dict.get("health_refresh_interval"),
+                state_store=self.state_store,
+            )
             self.use_time_based_weights = agent_dict["use_time_based_weights"]
             self.time_based_multipliers = agent_dict["time_based_multipliers"]
+            # Loop iterations kept in flight, above 1 loop() runs on the async runtime
+            self.max_concurrent_actions = max(1, agent_dict.get("max_concurrent_actions", 1))
+            # Requests the server runs at once for this agent, None uses the server default
+            self.max_concurrent_requests = agent_dict.get("max_concurrent_requests")
             self.is_llm_set = False
+            # Optional generate-text response cache, see src/llm_cache.py
+            self.llm_cache = create_llm_cache(agent_dict.get("llm_cache"))
+            # Token usage of every LLM call, totalled here and appended to the usage ledger
+            self.usage = UsageMeter()
+            self.episode_usage = TokenUsage()
+            self.usage_ledger = create_usage_ledger(agent_dict.get("usage_ledger"))
+            # Backoff for transient failures of steps and connection actions, see src/retry.py
+            self.retry_policy = RetryPolicy(**agent_dict.get("retry", {}))
+            self.connection_manager.retry_policy = self.retry_policy
 
             # Cache for system prompt
             self._system_prompt = None
 
             # Extract loop tasks
             self.tasks = agent_dict.get("tasks", [])
-            self.task_weights = [task.get("weight", 0) for task in self.tasks]
             self.logger = logging.getLogger("agent")
 
-            # Set up empty agent state
-            self.state = {}
+            # Picks each loop iteration's task from the weights of "tasks", see src/scheduler.py
+            self.scheduler = TaskScheduler(
+                self.tasks,
+                connection_configs={config["name"]: config for config in agent_dict["config"]},
+                use_time_based_weights=self.use_time_based_weights,
+                time_based_multipliers=self.time_based_multipliers,
+                last_run=self.state.setdefault("task_last_run", {}),
+                on_record=lambda: self.state.touch("task_last_run"),
+                is_healthy=self._is_connection_healthy,
+            )
+
+            # Set by stop(), also when it is called before aloop() has started
+            self._stop_event = asyncio.Event()
+            # Concurrent loop iterations must not both claim the post-tweet slot
+            self._post_lock = threading.Lock()
+
+            # Worker thread accounting for the async runtime, reported by the supervisor
+            self._stats_lock = threading.Lock()
+            self.cpu_time = 0.0
+            self.iterations = 0
+            self.queued_calls = 0
+            self.running_calls = 0
         except Exception as e:
             logger.error("Could not load ZerePy agent")
             raise e
@@ -60,7 +162,9 @@ class ZerePyAgent:
         llm_providers = self.connection_manager.get_model_providers()
         if not llm_providers:
             raise ValueError("No configured LLM provider found")
-        self.model_provider = llm_providers[0]
+        # A configured router spreads calls over the other providers, prefer it
+        self.model_provider = "router" if "router" in llm_providers else llm_providers[0]
+        self.is_llm_set = True
 
     def _construct_system_prompt(self) -> str:
         """Construct the system prompt from agent configuration"""
@@ -83,58 +187,407 @@ class ZerePyAgent:
 
         return self._system_prompt
 
-    def _adjust_weights_for_time(self, current_hour: int, task_weights: list) -> list:
-        weights = task_weights.copy()
-
-        # Reduce tweet frequency during night hours (1 AM - 5 AM)
-        if 1 <= current_hour <= 5:
-            weights = [
-                weight * self.time_based_multipliers.get("tweet_night_multiplier", 0.4) if task["name"] == "post-tweet"
-                else weight
-                for weight, task in zip(weights, self.tasks)
-            ]
-
-        # Increase engagement frequency during day hours (8 AM - 8 PM) (peak hours?🤔)
-        if 8 <= current_hour <= 20:
-            weights = [
-                weight * self.time_based_multipliers.get("engagement_day_multiplier", 1.5) if task["name"] in (
-                    "reply-to-tweet", "like-tweet")
-                else weight
-                for weight, task in zip(weights, self.tasks)
-            ]
-
-        return weights
+    def _is_connection_healthy(self, name: str) -> bool:
+        """False only when the connection's last cached health check failed, never blocks"""
+        if name not in self.connection_manager.connections:
+            return True
+        return self.connection_manager.health.peek(name) is not False
 
     def prompt_llm(
             self,
             prompt: str,
             system_prompt: str = None,
             stop: Optional[list[str]] = None,
-            response_format: Optional[Any] = None
+            response_format: Optional[Any] = None,
+            temperature: Optional[float] = None,
+            use_cache: bool = True
     ) -> str:
+        """Generate text using the configured LLM provider.
+
+        Responses are served from the agent's llm_cache when one is configured. Callers
+        opt out with use_cache=False. Calls that sample, at the given temperature or else the
+        provider's configured or default one, always skip it, as do providers whose default
+        is not known.
+        """
         if not self.is_llm_set:
             self._setup_llm_provider()
-        """Generate text using the configured LLM provider"""
         system_prompt = system_prompt or self._construct_system_prompt()
 
-        return self.connection_manager.perform_action(
-            connection_name=self.model_provider,
-            action_name="generate-text",
-            params=[prompt, system_prompt, stop, response_format]
-        )
+        with PROMPT_LLM_SECONDS.time(provider=self.model_provider) as labels, \
+                span("llm:prompt_llm", provider=self.model_provider) as current:
+            response = self._prompt_llm(prompt, system_prompt, stop, response_format, temperature,
+                                        use_cache and self._is_deterministic(temperature), labels)
+            if response is None:
+                labels["status"] = "error"
+            if current is not None:
+                current.set(cache=labels["cache"], status=labels.get("status", "ok"))
+            return response
+
+    def _is_deterministic(self, temperature: Optional[float]) -> bool:
+        connection = self.connection_manager.connections.get(self.model_provider)
+        effective = connection.effective_temperature(temperature) if connection is not None else None
+        return effective is not None and effective <= 0
+
+    def _prompt_llm(self, prompt: str, system_prompt: str, stop: Optional[list[str]], response_format: Any,
+                    temperature: Optional[float], use_cache: bool, labels: dict) -> str:
+        if self.llm_cache is None or not use_cache:
+            labels["cache"] = "bypass"
+            return self._generate_text(prompt, system_prompt, stop, response_format, temperature)
+
+        connection = self.connection_manager.connections.get(self.model_provider)
+        model = connection.config.get("model") if connection is not None else None
+        key = llm_cache_key(self.model_provider, model, system_prompt, prompt, stop, response_format)
+        response = self.llm_cache.get(key)
+        labels["cache"] = "miss" if response is None else "hit"
+        if response is not None:
+            return response
+        response = self._generate_text(prompt, system_prompt, stop, response_format, temperature)
+        # Failed calls return None and are not cached
+        if isinstance(response, str):
+            self.llm_cache.set(key, response)
+        return response
+
+    def _generate_text(self, prompt, system_prompt: str, stop: Optional[list[str]],
+                       response_format: Optional[Any], temperature: Optional[float] = None) -> str:
+        # Whole answers go through generate-text, where the router can hedge. Providers whose
+        # generate-text ignores stop sequences are streamed so generation ends at the first one.
+        try:
+            connection = self.connection_manager.connections.get(self.model_provider)
+            if connection is None or not self._takes(connection, "generate-text", stop=stop,
+                                                     response_format=response_format):
+                return "".join(self.stream_llm(prompt, system_prompt, stop, response_format, temperature))
+            with self.usage_scope():
+                result = self.connection_manager.perform_action(
+                    connection_name=self.model_provider,
+                    action_name="generate-text",
+                    params={"prompt": prompt, "system_prompt": system_prompt, "stop": stop,
+                            "response_format": response_format, "temperature": temperature}
+                )
+            if not isinstance(result, str):
+                raise ValueError(f"{self.model_provider} did not return any text")
+            return "".join(stream_until([result], stop))
+        except Exception as e:
+            logger.error(f"\nText generation with {self.model_provider} failed: {e}")
+            return None
+
+    @staticmethod
+    def _takes(connection, action_name: str, **arguments) -> bool:
+        """Whether the connection has the action and it takes every argument that is set"""
+        action = connection.actions.get(action_name)
+        if action is None:
+            return False
+        names = {param.name for param in action.parameters}
+        return all(value is None or name in names for name, value in arguments.items())
+
+    def stream_llm(
+            self,
+            prompt: str,
+            system_prompt: str = None,
+            stop: Optional[list[str]] = None,
+            response_format: Optional[Any] = None,
+            temperature: Optional[float] = None
+    ) -> Iterator[str]:
+        """Stream text deltas from the configured LLM provider, ending at the first stop sequence.
+
+        The provider stream is closed as soon as a stop sequence shows up, so a ReAct step is
+        done once "Observation {i}:" is generated. Providers without a generate-text-stream
+        action yield their whole answer at once.
+        """
+        if not self.is_llm_set:
+            self._setup_llm_provider()
+        system_prompt = system_prompt or self._construct_system_prompt()
+
+        connection = self.connection_manager.connections.get(self.model_provider)
+        streaming = connection is not None and "generate-text-stream" in connection.actions
+        with self.usage_scope():
+            result = self.connection_manager.perform_action(
+                connection_name=self.model_provider,
+                action_name="generate-text-stream" if streaming else "generate-text",
+                # By name, providers take these in different orders and not all of them
+                params={"prompt": prompt, "system_prompt": system_prompt, "stop": stop,
+                        "response_format": response_format, "temperature": temperature}
+            )
+            if result is None:
+                raise ValueError(f"{self.model_provider} did not return any text")
+            # Providers cut at stop sequences themselves, this also covers the buffered ones.
+            # Failures while reading are recorded by the connection manager, see MeteredStream.
+            yield from stream_until([result] if isinstance(result, str) else result, stop)
+
+    async def astream_llm(
+            self,
+            prompt: str,
+            system_prompt: str = None,
+            stop: Optional[list[str]] = None,
+            response_format: Optional[Any] = None,
+            temperature: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """Async variant of stream_llm, the provider stream is read in a worker thread"""
+        async for delta in aiter_in_thread(
+                lambda: self.stream_llm(prompt, system_prompt, stop, response_format, temperature)):
+            yield delta
+
+    def usage_scope(self, action: Optional[str] = None, meter: Optional[UsageMeter] = None):
+        """Attribute LLM calls inside the block to this agent, see src/usage.py"""
+        return usage_scope(agent=self.name, action=action, meter=meter or self.usage, ledger=self.usage_ledger)
 
     def perform_action(self, connection: str, action: str, **kwargs) -> None:
         return self.connection_manager.perform_action(connection, action, **kwargs)
 
+    async def aprompt_llm(
+            self,
+            prompt: str,
+            system_prompt: str = None,
+            stop: Optional[list[str]] = None,
+            response_format: Optional[Any] = None,
+            temperature: Optional[float] = None,
+            use_cache: bool = True
+    ) -> str:
+        """Async variant of prompt_llm, the provider call runs in a worker thread"""
+        return await self.run_in_thread(self.prompt_llm, prompt, system_prompt, stop, response_format,
+                                        temperature, use_cache)
+
+    async def aperform_action(self, connection: str, action: str, **kwargs) -> Any:
+        """Async variant of perform_action, the connection call runs in a worker thread"""
+        return await self.run_in_thread(self.perform_action, connection, action, **kwargs)
+
+    async def run_in_thread(self, func, *args, **kwargs) -> Any:
+        """Run blocking work for this agent in the loop's executor, keeping track of
+        queue depth and the CPU time spent on the agent's behalf"""
+        with self._stats_lock:
+            self.queued_calls += 1
+
+        def timed():
+            with self._stats_lock:
+                self.queued_calls -= 1
+                self.running_calls += 1
+            started = time.thread_time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._stats_lock:
+                    self.cpu_time += time.thread_time() - started
+                    self.running_calls -= 1
+
+        return await asyncio.to_thread(timed)
+
+    def runtime_stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "cpu_time": self.cpu_time,
+                "iterations": self.iterations,
+                "queue_depth": self.queued_calls,
+                "in_flight": self.running_calls,
+                "llm_cache": self.llm_cache.stats() if self.llm_cache is not None else None,
+                "usage": self.usage.to_dict(),
+            }
+
+    def _loop_system_prompt(self) -> str:
+        system_prompt = self._construct_system_prompt()
+        return system_prompt.format(
+            tool=self.tasks
+        )
+
+    def _react_episode(self, prompt: str, system_prompt: str) -> ReActEpisode:
+        """Run one Thought/Action/Observation episode. The tokens it used are also kept in
+        self.episode_usage, the usage of the last episode to finish."""
+        episode = ReActEpisode()
+        meter = UsageMeter()
+        try:
+            with self.usage_scope("react-episode", meter), span("react:episode", agent=self.name):
+                self._react_steps(prompt, system_prompt, episode)
+        finally:
+            episode.usage = self.episode_usage = meter.usage
+        return episode
+
+    def _react_steps(self, prompt: str, system_prompt: str, episode: ReActEpisode) -> None:
+        for i in range(1, REACT_STEPS + 1):
+            with span("react:step", step=i):
+                thought_action = self.prompt_llm(system_prompt=system_prompt, **_thought_request(prompt, i))
+                logger.info(f"thought_action {thought_action}...")
+                thought, action_name = _parse_step(thought_action, i)
+                if action_name is None:
+                    action_name = self.prompt_llm(system_prompt=system_prompt,
+                                                  **_action_request(prompt, i, thought)).strip()
+                obs, r, done, info = self.env(_env_action(action_name), episode)
+                logger.info(f"return env {obs, r, done, info}...")
+                prompt += _step_record(i, thought, action_name, obs)
+                logger.info(f"{prompt}...")
+                if done:
+                    break
+        if not done:
+            self.env("finish[]", episode)
+
+    async def _areact_episode(self, prompt: str, system_prompt: str) -> ReActEpisode:
+        """Async mirror of _react_episode, LLM calls and actions are awaited"""
+        episode = ReActEpisode()
+        meter = UsageMeter()
+        try:
+            with self.usage_scope("react-episode", meter), span("react:episode", agent=self.name):
+                await self._areact_steps(prompt, system_prompt, episode)
+        finally:
+            episode.usage = self.episode_usage = meter.usage
+        return episode
+
+    async def _areact_steps(self, prompt: str, system_prompt: str, episode: ReActEpisode) -> None:
+        for i in range(1, REACT_STEPS + 1):
+            with span("react:step", step=i):
+                thought_action = await self.aprompt_llm(system_prompt=system_prompt, **_thought_request(prompt, i))
+                logger.info(f"thought_action {thought_action}...")
+                thought, action_name = _parse_step(thought_action, i)
+                if action_name is None:
+                    action_name = (await self.aprompt_llm(system_prompt=system_prompt,
+                                                          **_action_request(prompt, i, thought))).strip()
+                obs, r, done, info = await self.aenv(_env_action(action_name), episode)
+                logger.info(f"return env {obs, r, done, info}...")
+                prompt += _step_record(i, thought, action_name, obs)
+                if done:
+                    break
+        if not done:
+            await self.aenv("finish[]", episode)
+
+    async def astream_react_episode(self, prompt: str, system_prompt: str) -> AsyncIterator[dict]:
+        """Run one ReAct episode and yield its progress as it happens.
+
+        Yields {"type": "thought", "delta"} while the model writes its thought,
+        {"type": "action", "content"} and {"type": "observation", "content"} per step, and
+        {"type": "answer", "delta"} for the final answer, streamed as soon as the model starts
+        writing Finish[...]. Closing the generator closes the provider stream.
+        """
+        if not self.is_llm_set:
+            self._setup_llm_provider()
+        episode = ReActEpisode()
+        answer_streamed = ""
+        done = False
+        for i in range(1, REACT_STEPS + 1):
+            marker = f"Action {i}:"
+            text, thought_sent = "", 0
+            request = _thought_request(prompt, i)
+            async with aclosing(self.astream_llm(request["prompt"], system_prompt, stop=request["stop"])) as deltas:
+                async for delta in deltas:
+                    text += delta
+                    if marker in text:
+                        thought_end = text.index(marker)
+                    else:
+                        # Hold back what could be the start of the action marker
+                        thought_end = max(thought_sent, len(text) - len(marker) + 1)
+                    if thought_end > thought_sent:
+                        yield {"type": "thought", "step": i, "delta": text[thought_sent:thought_end]}
+                        thought_sent = thought_end
+                    if marker in text:
+                        action_text = text.split(marker, 1)[1].lstrip()
+                        if action_text.lower().startswith("finish["):
+                            visible = action_text[len("finish["):].rstrip().rstrip("]")
+                            if len(visible) > len(answer_streamed) and visible.startswith(answer_streamed):
+                                yield {"type": "answer", "delta": visible[len(answer_streamed):]}
+                                answer_streamed = visible
+
+            thought, action_name = _parse_step(text, i)
+            if action_name is None:
+                action_name = (await self.aprompt_llm(system_prompt=system_prompt,
+                                                      **_action_request(prompt, i, thought))).strip()
+            yield {"type": "action", "step": i, "content": action_name}
+            obs, r, done, info = await self.aenv(_env_action(action_name), episode)
+            if not done:
+                yield {"type": "observation", "step": i, "content": str(obs)}
+            prompt += _step_record(i, thought, action_name, obs)
+            if done:
+                break
+        if not done:
+            await self.aenv("finish[]", episode)
+        answer = episode.answer or ""
+        if answer.startswith(answer_streamed) and len(answer) > len(answer_streamed):
+            yield {"type": "answer", "delta": answer[len(answer_streamed):]}
+
+    @traced("loop:iteration")
+    def _run_iteration(self, system_prompt: str) -> float:
+        """Run a single loop iteration and return the number of seconds to wait before the next one"""
+        task, wait = self._pick_task()
+        if wait is not None:
+            return wait
+        if task is not None and task.action:
+            execute_action(self, task.action)
+            return self.loop_delay
+
+        try:
+            episode = self._react_episode(self._task_prompt(task), system_prompt)
+            self._post_episode(episode, task)
+            return 60
+        except Exception as e:
+            logger.error(f"\n❌ Error in agent loop iteration: {e}")
+            logger.info(
+                f"⏳ Waiting {self.loop_delay} seconds before retrying...")
+            return self.loop_delay + 60
+
+    @traced("loop:iteration")
+    async def _arun_iteration(self, system_prompt: str) -> float:
+        """Async mirror of _run_iteration"""
+        task, wait = self._pick_task()
+        if wait is not None:
+            return wait
+        if task is not None and task.action:
+            await aexecute_action(self, task.action)
+            return self.loop_delay
+
+        try:
+            episode = await self._areact_episode(self._task_prompt(task), system_prompt)
+            await self.run_in_thread(self._post_episode, episode, task)
+            return 60
+        except Exception as e:
+            logger.error(f"\n❌ Error in agent loop iteration: {e}")
+            logger.info(
+                f"⏳ Waiting {self.loop_delay} seconds before retrying...")
+            return self.loop_delay + 60
+
+    def _pick_task(self) -> Tuple[Optional[ScheduledTask], Optional[float]]:
+        """(task, None) to run a task, its action directly or else a ReAct episode about it,
+        (None, None) to run a ReAct episode of the model's choosing, (None, seconds) to wait
+        because no task is ready"""
+        if self.scheduler.is_empty:
+            return None, None
+        task, wait = self.scheduler.next_task()
+        if task is None:
+            wait = min(wait, self.loop_delay) if wait else self.loop_delay
+            logger.info(f"\n⏳ No task is ready, waiting {wait:.0f} seconds...")
+            return None, wait
+        # Recorded when picked, so min_interval holds and an overdue task stops being overdue
+        self.scheduler.record_run(task.name)
+        return task, None
+
+    @staticmethod
+    def _task_prompt(task: Optional[ScheduledTask]) -> str:
+        if task is None:
+            return ""
+        return TASK_EPISODE_PROMPT.format(task_name=task.name, task_description=task.description or "")
+
+    def _post_episode(self, episode: ReActEpisode, task: Optional[ScheduledTask] = None) -> None:
+        task_exists = any(action['name'] == 'post-tweet' for action in self.tasks)
+        # post-tweet keeps to its min_interval, by default the twitter tweet_interval. A picked
+        # post-tweet task has already been recorded by _pick_task.
+        picked = task is not None and task.name == "post-tweet"
+        with self._post_lock:
+            post = task_exists and (picked or self.scheduler.ready("post-tweet"))
+            if post and not picked:
+                self.scheduler.record_run("post-tweet")
+        if post:
+            logger.info("post-tweet started ...")
+            execute_action(self, "post-tweet", text=episode.answer)
+        logger.info(
+            f"\n⏳ Waiting {self.loop_delay} seconds before next loop...")
+        print_h_bar()
+
     def loop(self):
-        """Main agent loop for autonomous behavior"""
+        """Main agent loop for autonomous behavior. Agents with max_concurrent_actions above 1
+        run on aloop(), the only runtime that keeps several iterations in flight."""
+        if self.max_concurrent_actions > 1:
+            # With one iteration at a time the asyncio runtime only adds executor hops
+            asyncio.run(self.aloop())
+            return
         if not self.is_llm_set:
             self._setup_llm_provider()
 
-        system_prompt = self._construct_system_prompt()
-        system_prompt = system_prompt.format(
-            tool=self.tasks
-        )
+        system_prompt = self._loop_system_prompt()
+        # A loop stopped before closed the connections' background work
+        self.connection_manager.start()
 
         logger.info("\n🚀 Starting agent loop...")
         logger.info("Press Ctrl+C at any time to stop the loop.")
@@ -149,158 +602,164 @@ class ZerePyAgent:
             time.sleep(1)
         try:
             while True:
-                success = False
-                if self.name == "DeployTokenAgent":
-                    execute_action(self, "deploy-token")
-                    success = True
-                elif self.name == "DeployTokenDiscordAgent":
-                    execute_action(self, "deploy-token-discord")
-                    success = True
-                elif self.name == "AntiRugAgent":
-                    execute_action(self, "rug-detect")
-                    success = True
-                else:
-                    try:
-                        n_calls, n_badcalls = 0, 0
-                        self.steps = 0
-                        self.answer = None
-                        prompt = ""
-                        for i in range(1, 5):
-                            n_calls += 1
-                            thought_action = self.prompt_llm(prompt=prompt + f"Thought {i}:",
-                                                            system_prompt=system_prompt,
-                                                            stop=[f"Observation {i}:"])
-                            logger.info(f"thought_action {thought_action}...")
-                            try:
-                                thought, action_name = thought_action.strip().split(
-                                    f"Action {i}:")
-                                action_name = action_name.strip()
-                            except:
-                                logger.info(f'ohh... {thought_action}')
-                                n_badcalls += 1
-                                n_calls += 1
-                                thought = thought_action.strip().split('\n')[0]
-                                action_name = self.prompt_llm(prompt=prompt + f"Thought {i}: {thought}\nAction {i}:",
-                                                            system_prompt=system_prompt,
-                                                            stop=[f"\n"]).strip()
-                            logger.info(
-                                f"action_name {action_name[0], action_name[0].lower(), action_name[1:]}...")
-                            obs, r, done, info = self.env(
-                                action_name[0].lower() + action_name[1:])
-                            logger.info(f"return env {obs, r, done, info}...")
-                            step_str = f"Thought {i}: {thought}\nAction {i}: {action_name}\nObservation {i}: {obs}\n"
-                            prompt += step_str
-                            logger.info(f"{prompt}...")
-                            if done:
-                                break
-                        if not done:
-                            obs, r, done, info = self.env("finish[]")
-                        task_exists = any(action['name'] == 'post-tweet' for action in self.tasks)
-                        if task_exists:
-                            logger.info(f"post-tweet started ...")
-                            execute_action(self, "post-tweet")
-                        logger.info(
-                            f"\n⏳ Waiting {self.loop_delay} seconds before next loop...")
-                        print_h_bar()
-    
-                    except Exception as e:
-                        logger.error(f"\n❌ Error in agent loop iteration: {e}")
-                        logger.info(
-                            f"⏳ Waiting {self.loop_delay} seconds before retrying...")
-                        time.sleep(self.loop_delay)
-                time.sleep(self.loop_delay if success else 60)
+                time.sleep(self._run_iteration(system_prompt))
         except KeyboardInterrupt:
             logger.info("\n🛑 Agent loop stopped by user.")
             return
+        finally:
+            self.close()
+
+    async def _asleep(self, seconds: float) -> bool:
+        """Sleep that wakes up early when the agent is stopped. Returns True if stopped."""
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), timeout=seconds)
+            return True
+        except asyncio.TimeoutError:
+            return self._stop_event.is_set()
+
+    async def _aloop_lane(self, lane: int, system_prompt: str) -> None:
+        # Stagger lanes so concurrent iterations spread over the loop delay
+        if lane and await self._asleep(self.loop_delay * lane / self.max_concurrent_actions):
+            return
+        while not self._stop_event.is_set():
+            try:
+                delay = await self._arun_iteration(system_prompt)
+            except Exception as e:
+                # One failing iteration must not take down the other agents sharing this loop
+                logger.error(f"\n❌ Error in {self.name} loop iteration: {e}")
+                delay = self.loop_delay
+            self.iterations += 1
+            if await self._asleep(delay):
+                return
+
+    async def aloop(self, countdown: bool = True) -> None:
+        """Asyncio agent loop. Runs max_concurrent_actions iterations concurrently and
+        returns once stop() is called or the surrounding task is cancelled."""
+        if not self.is_llm_set:
+            await self.run_in_thread(self._setup_llm_provider)
+
+        system_prompt = self._loop_system_prompt()
+        self.connection_manager.start()
+
+        logger.info(f"\n🚀 Starting async agent loop for {self.name}...")
+        if countdown:
+            logger.info("Starting loop in 5 seconds...")
+            if await self._asleep(5):
+                return
+
+        lanes = [
+            asyncio.create_task(self._aloop_lane(lane, system_prompt))
+            for lane in range(self.max_concurrent_actions)
+        ]
+        try:
+            await asyncio.gather(*lanes)
+        finally:
+            for lane in lanes:
+                lane.cancel()
+            await asyncio.gather(*lanes, return_exceptions=True)
+            await asyncio.to_thread(self.close)
+            logger.info(f"\n🛑 Async agent loop for {self.name} stopped.")
+
+    def close(self) -> None:
+        """Shutdown path of the loops: flush state and stop background threads"""
+        mention_stream = getattr(self, "mention_stream", None)
+        if mention_stream is not None:
+            mention_stream.stop()
+            # Bounded, a handler stuck in a slow reply must not hold up shutdown
+            mention_stream.join(timeout=5)
+            self.mention_stream = None
+        self.state_store.flush()
+        self.connection_manager.close()
+
+    def stop(self) -> None:
+        """Stop a running aloop, or make the next one return at once. Must be called from
+        the loop's thread, use loop.call_soon_threadsafe(agent.stop) from other threads."""
+        self._stop_event.set()
 
     def prompt_agent(self, prompt: str):
         if not self.is_llm_set:
             self._setup_llm_provider()
 
-        system_prompt = self._construct_system_prompt()
-        system_prompt = system_prompt.format(
-            tool=self.tasks
-        )
+        system_prompt = self._loop_system_prompt()
         logger.info(f"system prompt: {system_prompt}")
         logger.info("\n🚀 Starting prompt agent")
 
         try:
             # CHOOSE AN ACTION
             # TODO: Add agentic action selection
-            n_calls, n_badcalls = 0, 0
-            self.steps = 0
-            self.answer = None
-            for i in range(1, 5):
-                n_calls += 1
-                thought_action = self.prompt_llm(prompt=prompt + f"Thought {i}:",
-                                                 system_prompt=system_prompt,
-                                                 stop=[f"Observation {i}:"])
-                logger.info(f"thought_action {thought_action}...")
-                try:
-                    thought, action_name = thought_action.strip().split(
-                        f"Action {i}:")
-                    action_name = action_name.strip()
-                except:
-                    logger.info(f'ohh... {thought_action}')
-                    n_badcalls += 1
-                    n_calls += 1
-                    thought = thought_action.strip().split('\n')[0]
-                    action_name = self.prompt_llm(prompt=prompt + f"Thought {i}: {thought}\nAction {i}:",
-                                                  system_prompt=system_prompt,
-                                                  stop=[f"\n"]).strip()
-                logger.info(
-                    f"action_name {action_name[0], action_name[0].lower(), action_name[1:]}...")
-                obs, r, done, info = self.env(
-                    action_name[0].lower() + action_name[1:])
-                logger.info(f"return env {obs, r, done, info}...")
-                step_str = f"Thought {i}: {thought}\nAction {i}: {action_name}\nObservation {i}: {obs}\n"
-                prompt += step_str
-                logger.info(f"{prompt}...")
-                if done:
-                    break
-            if not done:
-                obs, r, done, info = self.env("finish[]")
-            return self.answer
+            return self._react_episode(prompt, system_prompt).answer
         except KeyboardInterrupt:
             logger.info("\n🛑 Agent loop stopped by user.")
             return
 
-    def env(self, action):
-        attempts = 0
-        while attempts < 10:
-            try:
-                return self.step(action)
-            except:
-                attempts += 1
+    async def aprompt_agent(self, prompt: str):
+        """Async variant of prompt_agent, LLM calls and actions run in worker threads"""
+        if not self.is_llm_set:
+            await self.run_in_thread(self._setup_llm_provider)
+        system_prompt = await self.run_in_thread(self._loop_system_prompt)
+        episode = await self._areact_episode(prompt, system_prompt)
+        return episode.answer
+
+    def env(self, action, episode: ReActEpisode):
+        """step() with failures that never reached a server retried with backoff, steps run
+        actions that may post or deploy. A step that still fails becomes an observation so
+        the episode can go on."""
+        try:
+            return self.retry_policy.call(self.step, action, episode, target="step", idempotent=False)
+        except Exception as e:
+            return self._failed_step(action, e, episode)
 
-    def _get_info_env(self):
+    async def aenv(self, action, episode: ReActEpisode):
+        try:
+            return await self.retry_policy.acall(self.astep, action, episode, target="step", idempotent=False)
+        except Exception as e:
+            return self._failed_step(action, e, episode)
+
+    def _failed_step(self, action, error: Exception, episode: ReActEpisode):
+        logger.error(f"\nStep {action} failed: {error}")
+        episode.obs = f"Action failed: {error}"
+        episode.steps += 1
+        return episode.obs, 0, False, self._get_info_env(episode)
+
+    def _get_info_env(self, episode: ReActEpisode):
         return {
-            "steps": self.steps,
-            "answer": self.answer,
+            "steps": episode.steps,
+            "answer": episode.answer,
         }
 
-    def step(self, action):
+    def step(self, action, episode: ReActEpisode):
         reward = 0
         done = False
         action = action.strip()
-        if self.answer is not None:  # already finished
+        if episode.answer is not None:  # already finished
             done = True
-            return self.obs, reward, done, self._get_info_env()
+            return episode.obs, reward, done, self._get_info_env(episode)
 
         if action.startswith("call[") and action.endswith("]"):
             entity = action[len("call["):-1]
             logger.info(f"action to be invoked: {entity}")
-            self.obs = execute_action(self, entity)
+            episode.obs = execute_action(self, entity)
         elif action.startswith("finish[") and action.endswith("]"):
             answer = action[len("finish["):-1]
-            self.answer = answer
+            episode.answer = answer
             done = True
-            self.obs = f"Episode finished, reward = {reward}\n"
+            episode.obs = f"Episode finished, reward = {reward}\n"
         elif action.startswith("think[") and action.endswith("]"):
-            self.obs = "Nice thought."
+            episode.obs = "Nice thought."
         else:
-            self.obs = "Invalid action: {}".format(action)
+            episode.obs = "Invalid action: {}".format(action)
+
+        episode.steps += 1
 
-        self.steps += 1
+        return episode.obs, reward, done, self._get_info_env(episode)
 
-        return self.obs, reward, done, self._get_info_env()
+    async def astep(self, action, episode: ReActEpisode):
+        """Async step, only call[] actions do real work so everything else is delegated to step"""
+        stripped = action.strip()
+        if episode.answer is None and stripped.startswith("call[") and stripped.endswith("]"):
+            entity = stripped[len("call["):-1]
+            logger.info(f"action to be invoked: {entity}")
+            episode.obs = await aexecute_action(self, entity)
+            episode.steps += 1
+            return episode.obs, 0, False, self._get_info_env(episode)
+        return self.step(action, episode)
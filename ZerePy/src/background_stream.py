@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from src.http_session import close_async_sessions
+
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 100
+
+# (first wait, growth, cap), growth is "linear" or "exponential"
+BackoffPolicy = Tuple[float, str, float]
+
+
+class Backoff:
+    def __init__(self, policy: BackoffPolicy):
+        self.first, self.growth, self.cap = policy
+        self.next = self.first
+
+    def wait(self) -> float:
+        wait = self.next
+        self.next = min(self.cap, self.next + self.first if self.growth == "linear" else self.next * 2)
+        return wait
+
+
+class BackgroundStream(ABC):
+    """Keeps one long-lived connection open on its own event loop and feeds what it
+    receives to a pool of workers.
+
+    Subclasses implement _connect(), one connection attempt that puts items with
+    _enqueue() and returns or raises when the connection ends, and _on_disconnect(),
+    which names the reason and backoff policy of the reconnect or gives up. Items go into
+    a queue of queue_size, the reader waits for room when the workers fall behind.
+    Reconnect waits grow per backoff policy and start over once a connection was up.
+    """
+
+    # Set by subclasses
+    logger = logging.getLogger("background_stream")
+    label = "stream"
+    item_label = "item"
+    thread_name = "background-stream"
+    items_metric = None
+    reconnects_metric = None
+    queue_depth_metric = None
+
+    def __init__(self, handler: Callable[[Dict[str, Any]], Awaitable[Any]],
+                 workers: int = DEFAULT_WORKERS, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.connected = False
+        self._queue: Optional[asyncio.Queue] = None
+        self._stop_event: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        # Set by stop(), so a stop that comes before run() has made its event is not lost
+        self._stop_requested = False
+
+    @abstractmethod
+    async def _connect(self) -> None:
+        pass
+
+    @abstractmethod
+    def _on_disconnect(self, error: Optional[BaseException]) -> Optional[Tuple[str, BackoffPolicy]]:
+        """(reason, backoff policy) to reconnect with after _connect() ended, or None to stop
+        for good. error is None when _connect() returned."""
+        pass
+
+    async def run(self) -> None:
+        """Run until stop() is called or _on_disconnect() gives up"""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._stop_event = asyncio.Event()
+        if self._stop_requested:
+            return
+        workers = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        try:
+            await self._connect_forever()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _connect_forever(self) -> None:
+        # Keyed by policy, so reasons sharing one keep growing the same wait
+        backoffs: Dict[BackoffPolicy, Backoff] = {}
+        stopped = asyncio.create_task(self._stop_event.wait())
+        try:
+            while True:
+                attempt = asyncio.create_task(self._connect())
+                await asyncio.wait({attempt, stopped}, return_when=asyncio.FIRST_COMPLETED)
+                if stopped.done():
+                    attempt.cancel()
+                    await asyncio.gather(attempt, return_exceptions=True)
+                    return
+                retry = self._on_disconnect(attempt.exception())
+                if retry is None:
+                    return
+                reason, policy = retry
+                if self.connected:
+                    # The connection was up, start the backoff over
+                    backoffs.clear()
+                    self.connected = False
+                wait = backoffs.setdefault(policy, Backoff(policy)).wait()
+                self.reconnects_metric.inc(reason=reason)
+                self.logger.info(f"Reconnecting to the {self.label} in {wait:.2f}s")
+                await asyncio.wait({stopped}, timeout=wait)
+                if stopped.done():
+                    return
+        finally:
+            stopped.cancel()
+            self.connected = False
+
+    async def _enqueue(self, item: Dict[str, Any]) -> None:
+        self.items_metric.inc(status="received")
+        await self._queue.put(item)
+        self.queue_depth_metric.set(self._queue.qsize())
+
+    async def _work(self) -> None:
+        while True:
+            item = await self._queue.get()
+            self.queue_depth_metric.set(self._queue.qsize())
+            try:
+                await self.handler(item)
+                self.items_metric.inc(status="handled")
+            except Exception as e:
+                self.items_metric.inc(status="failed")
+                self.logger.error(f"Failed to handle {self.item_label} {item.get('id')}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def start(self) -> None:
+        """Run on its own event loop in a daemon thread"""
+        if self._thread is not None:
+            return
+
+        async def main():
+            try:
+                await self.run()
+            finally:
+                await close_async_sessions()
+
+        self._thread = threading.Thread(target=lambda: asyncio.run(main()), name=self.thread_name, daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self) -> None:
+        """Stop, safe to call from any thread and before run() has started"""
+        self._stop_requested = True
+        if self._loop is not None and self._stop_event is not None:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """Wait for the thread start() began to end, call stop() first"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "connected": self.connected,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "workers": self.workers,
+        }
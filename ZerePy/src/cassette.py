@@ -0,0 +1,506 @@
+import asyncio
+import base64
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger("cassette")
+
+# Set to a cassette path to record or replay HTTP traffic in this process and the worker
+# processes it starts. Paths ending in .gz are gzip compressed.
+CASSETTE_ENV = "ZEREPY_CASSETTE"
+# "record" or "replay"
+CASSETTE_MODE_ENV = "ZEREPY_CASSETTE_MODE"
+# "original" replays with the recorded latency, "zero" without any
+CASSETTE_TIMING_ENV = "ZEREPY_CASSETTE_TIMING"
+
+# Query parameters whose values are never written to a cassette
+SECRET_PARAMS = {"api_key", "apikey", "api-key", "key", "token", "access_token", "auth", "secret"}
+# Query parameters and JSON body fields that change on every run, ignored when matching
+VOLATILE_PARAMS = {"start_time", "end_time", "deadline", "timestamp", "_"}
+VOLATILE_FIELDS = {"id", "deadline", "timestamp"}
+# Response headers that no longer apply to the decoded body, or should not be stored
+DROPPED_HEADERS = {"content-encoding", "transfer-encoding", "content-length", "connection", "keep-alive",
+                   "set-cookie"}
+
+
+class CassetteMiss(LookupError):
+    """Raised, as the HTTP client's own connection error, for requests a cassette has no recording of"""
+
+
+def _canonical_url(url: str) -> str:
+    parts = urlsplit(str(url))
+    query = [(name, "REDACTED" if name.lower() in SECRET_PARAMS else value)
+             for name, value in parse_qsl(parts.query, keep_blank_values=True)]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def _match_url(url: str) -> str:
+    parts = urlsplit(url)
+    query = sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if name not in VOLATILE_PARAMS)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def _without_volatile(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _without_volatile(item) for key, item in value.items() if key not in VOLATILE_FIELDS}
+    if isinstance(value, list):
+        return [_without_volatile(item) for item in value]
+    return value
+
+
+def _body_key(body: Optional[bytes]) -> str:
+    if not body:
+        return ""
+    try:
+        canonical = json.dumps(_without_volatile(json.loads(body)), sort_keys=True).encode()
+    except ValueError:
+        canonical = body
+    return hashlib.sha256(canonical).hexdigest()[:16]
+
+
+def _as_bytes(body: Any) -> Optional[bytes]:
+    if body is None or isinstance(body, bytes):
+        return body
+    if isinstance(body, str):
+        return body.encode()
+    if isinstance(body, (bytearray, memoryview)):
+        return bytes(body)
+    # Generators, files and multipart writers cannot be read without consuming them
+    return repr(type(body)).encode()
+
+
+def _rpc_ids(body: Optional[bytes]) -> Any:
+    """Request ids of a JSON-RPC call or batch, replayed responses get them back"""
+    try:
+        payload = json.loads(body or b"")
+    except ValueError:
+        return None
+    if isinstance(payload, dict) and "jsonrpc" in payload:
+        return payload.get("id")
+    if isinstance(payload, list) and payload and all(isinstance(call, dict) and "jsonrpc" in call
+                                                     for call in payload):
+        return [call.get("id") for call in payload]
+    return None
+
+
+class Interaction:
+    """One recorded request and its response"""
+
+    __slots__ = ("method", "url", "body_key", "status", "headers", "body", "elapsed")
+
+    def __init__(self, method: str, url: str, body_key: str, status: int, headers: Dict[str, str],
+                 body: bytes, elapsed: float):
+        self.method = method
+        self.url = url
+        self.body_key = body_key
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.elapsed = elapsed
+
+    def to_dict(self) -> Dict[str, Any]:
+        record = {"m": self.method, "u": self.url, "k": self.body_key, "s": self.status, "h": self.headers,
+                  "t": round(self.elapsed, 4)}
+        try:
+            record["b"] = self.body.decode()
+        except UnicodeDecodeError:
+            record["b64"] = base64.b64encode(self.body).decode()
+        return record
+
+    @classmethod
+    def from_dict(cls, record: Dict[str, Any]) -> "Interaction":
+        body = base64.b64decode(record["b64"]) if "b64" in record else record.get("b", "").encode()
+        return cls(record["m"], record["u"], record.get("k", ""), record["s"], record.get("h", {}), body,
+                   record.get("t", 0.0))
+
+    def body_for(self, request_body: Optional[bytes]) -> bytes:
+        """The recorded body, with JSON-RPC ids swapped for the ones of the replayed request"""
+        ids = _rpc_ids(request_body)
+        if ids is None:
+            return self.body
+        try:
+            payload = json.loads(self.body)
+            if isinstance(ids, list) and isinstance(payload, list):
+                for response, request_id in zip(payload, ids):
+                    response["id"] = request_id
+            elif isinstance(payload, dict):
+                payload["id"] = ids
+            return json.dumps(payload).encode()
+        except (ValueError, TypeError):
+            return self.body
+
+
+class Cassette:
+    """HTTP exchanges recorded to a compact JSON lines file, one interaction per line.
+
+    Replays match a request on method, URL and body, ignoring volatile fields such as
+    Twitter's start_time or JSON-RPC ids, then on method and URL alone. Recordings of the
+    same request are replayed in order and the last one repeats, so a cassette of a few
+    loop iterations can drive any number of them.
+    """
+
+    def __init__(self, path: str, mode: str = "replay", timing: str = "original"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Cassette mode must be record or replay, not {mode}")
+        if timing not in ("original", "zero"):
+            raise ValueError(f"Cassette timing must be original or zero, not {timing}")
+        self.path = path
+        self.mode = mode
+        self.timing = timing
+        self.recorded = 0
+        self.replayed = 0
+        self.missed = 0
+        self._lock = threading.Lock()
+        self._exact: Dict[Tuple[str, str, str], Deque[Interaction]] = defaultdict(deque)
+        self._loose: Dict[Tuple[str, str], Deque[Interaction]] = defaultdict(deque)
+        self._file = None
+        if mode == "replay":
+            self._load()
+        else:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = gzip.open(path, "at") if path.endswith(".gz") else open(path, "a")
+
+    def _load(self) -> None:
+        opener = gzip.open if self.path.endswith(".gz") else open
+        with opener(self.path, "rt") as f:
+            for line in f:
+                if line.strip():
+                    self._add(Interaction.from_dict(json.loads(line)))
+        logger.info(f"Loaded {len(self)} recorded requests from {self.path}")
+
+    def _add(self, interaction: Interaction) -> None:
+        url = _match_url(interaction.url)
+        self._exact[(interaction.method, url, interaction.body_key)].append(interaction)
+        self._loose[(interaction.method, url)].append(interaction)
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._loose.values())
+
+    def record(self, method: str, url: str, body: Optional[bytes], status: int, headers, content: bytes,
+               elapsed: float) -> None:
+        kept = {name.lower(): value for name, value in dict(headers).items() if name.lower() not in DROPPED_HEADERS}
+        interaction = Interaction(method.upper(), _canonical_url(url), _body_key(body), status, kept,
+                                  content or b"", elapsed)
+        line = json.dumps(interaction.to_dict(), separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.recorded += 1
+
+    def match(self, method: str, url: str, body: Optional[bytes]) -> Optional[Interaction]:
+        method, url = method.upper(), _match_url(_canonical_url(url))
+        with self._lock:
+            queue = self._exact.get((method, url, _body_key(body))) or self._loose.get((method, url))
+            if not queue:
+                self.missed += 1
+                return None
+            interaction = queue[0]
+            # Used up in both indexes, unless it is the last recording left there
+            for index in (self._exact[(method, url, interaction.body_key)], self._loose[(method, url)]):
+                if len(index) > 1:
+                    index.remove(interaction)
+            self.replayed += 1
+            return interaction
+
+    def replay(self, method: str, url: str, body: Optional[bytes]) -> Interaction:
+        interaction = self.match(method, url, body)
+        if interaction is None:
+            raise CassetteMiss(f"No recorded response for {method.upper()} {_canonical_url(url)} in {self.path}")
+        return interaction
+
+    def delay(self, interaction: Interaction) -> float:
+        return interaction.elapsed if self.timing == "original" else 0.0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"path": self.path, "mode": self.mode, "timing": self.timing, "recorded": self.recorded,
+                "replayed": self.replayed, "missed": self.missed}
+
+
+_active: Optional[Cassette] = None
+_installed = False
+_install_lock = threading.Lock()
+_env_lock = threading.Lock()
+
+
+def active_cassette() -> Optional[Cassette]:
+    return _active
+
+
+def _install_requests() -> None:
+    try:
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3 import HTTPResponse
+    except ImportError:
+        return
+    adapter_send = HTTPAdapter.send
+
+    def send(adapter, request, stream=False, **kwargs):
+        cassette = _active
+        if cassette is None:
+            return adapter_send(adapter, request, stream=stream, **kwargs)
+        body = _as_bytes(request.body)
+        if cassette.mode == "replay":
+            try:
+                interaction = cassette.replay(request.method, request.url, body)
+            except CassetteMiss as e:
+                raise requests.exceptions.ConnectionError(str(e), request=request)
+            time.sleep(cassette.delay(interaction))
+            raw = HTTPResponse(body=io.BytesIO(interaction.body_for(body)), headers=interaction.headers,
+                               status=interaction.status, preload_content=False, decode_content=False)
+            return adapter.build_response(request, raw)
+
+        started = time.perf_counter()
+        response = adapter_send(adapter, request, stream=stream, **kwargs)
+        if stream:
+            # Streams such as the Twitter filtered stream may never end, they pass through
+            return response
+        cassette.record(request.method, request.url, body, response.status_code, response.headers,
+                        response.content, time.perf_counter() - started)
+        return response
+
+    HTTPAdapter.send = send
+
+
+def _install_urllib3() -> None:
+    try:
+        import urllib3
+    except ImportError:
+        return
+    pool_urlopen = urllib3.PoolManager.urlopen
+
+    def urlopen(manager, method, url, redirect=True, **kwargs):
+        # Generated API clients such as the Moralis SDK use PoolManager directly, requests does not
+        cassette = _active
+        if cassette is None:
+            return pool_urlopen(manager, method, url, redirect=redirect, **kwargs)
+        body = _as_bytes(kwargs.get("body"))
+        if cassette.mode == "replay":
+            try:
+                interaction = cassette.replay(method, url, body)
+            except CassetteMiss as e:
+                raise urllib3.exceptions.HTTPError(str(e))
+            time.sleep(cassette.delay(interaction))
+            return urllib3.HTTPResponse(body=io.BytesIO(interaction.body_for(body)), headers=interaction.headers,
+                                        status=interaction.status,
+                                        preload_content=kwargs.get("preload_content", True))
+        started = time.perf_counter()
+        response = pool_urlopen(manager, method, url, redirect=redirect, **kwargs)
+        if kwargs.get("preload_content", True):
+            cassette.record(method, url, body, response.status, response.headers, response.data,
+                            time.perf_counter() - started)
+        return response
+
+    urllib3.PoolManager.urlopen = urlopen
+
+
+def _install_httpx() -> None:
+    try:
+        import httpx
+    except ImportError:
+        return
+    handle_request = httpx.HTTPTransport.handle_request
+    handle_async_request = httpx.AsyncHTTPTransport.handle_async_request
+
+    def replayed(cassette: Cassette, request, body: bytes) -> Interaction:
+        try:
+            interaction = cassette.replay(request.method, str(request.url), body)
+        except CassetteMiss as e:
+            raise httpx.ConnectError(str(e), request=request)
+        return interaction
+
+    def sync_handle(transport, request):
+        cassette = _active
+        if cassette is None:
+            return handle_request(transport, request)
+        body = request.read()
+        if cassette.mode == "replay":
+            interaction = replayed(cassette, request, body)
+            time.sleep(cassette.delay(interaction))
+            return httpx.Response(interaction.status, headers=interaction.headers,
+                                  content=interaction.body_for(body), request=request)
+        started = time.perf_counter()
+        response = handle_request(transport, request)
+        # LLM streams are buffered while recording, replays stream them from the cassette
+        content = response.read()
+        cassette.record(request.method, str(request.url), body, response.status_code, response.headers,
+                        content, time.perf_counter() - started)
+        return response
+
+    async def async_handle(transport, request):
+        cassette = _active
+        if cassette is None:
+            return await handle_async_request(transport, request)
+        body = await request.aread()
+        if cassette.mode == "replay":
+            interaction = replayed(cassette, request, body)
+            await asyncio.sleep(cassette.delay(interaction))
+            return httpx.Response(interaction.status, headers=interaction.headers,
+                                  content=interaction.body_for(body), request=request)
+        started = time.perf_counter()
+        response = await handle_async_request(transport, request)
+        content = await response.aread()
+        cassette.record(request.method, str(request.url), body, response.status_code, response.headers,
+                        content, time.perf_counter() - started)
+        return response
+
+    httpx.HTTPTransport.handle_request = sync_handle
+    httpx.AsyncHTTPTransport.handle_async_request = async_handle
+
+
+class _ReplayedClientResponse:
+    """The part of aiohttp.ClientResponse the connections use, backed by a recording"""
+
+    def __init__(self, method: str, url: str, status: int, headers: Dict[str, str], body: bytes):
+        from multidict import CIMultiDict
+        from yarl import URL
+        self.method = method
+        self.url = URL(url)
+        self.status = status
+        self.reason = None
+        self.headers = CIMultiDict(headers)
+        self._body = body
+
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+
+    @property
+    def content_type(self) -> str:
+        return self.headers.get("content-type", "application/octet-stream").split(";")[0]
+
+    async def read(self) -> bytes:
+        return self._body
+
+    async def text(self, encoding: Optional[str] = None, errors: str = "strict") -> str:
+        return self._body.decode(encoding or "utf-8", errors)
+
+    async def json(self, *, loads=json.loads, content_type: Optional[str] = "application/json", **kwargs) -> Any:
+        return loads(self._body.decode()) if self._body.strip() else None
+
+    def raise_for_status(self) -> None:
+        if not self.ok:
+            import aiohttp
+            raise aiohttp.ClientResponseError(None, (), status=self.status, message=f"Replayed {self.status}",
+                                              headers=self.headers)
+
+    def release(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    async def wait_for_close(self) -> None:
+        pass
+
+    async def __aenter__(self) -> "_ReplayedClientResponse":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        pass
+
+
+def _install_aiohttp() -> None:
+    try:
+        import aiohttp
+    except ImportError:
+        return
+    session_request = aiohttp.ClientSession._request
+
+    async def request(session, method, str_or_url, **kwargs):
+        cassette = _active
+        headers = {name.lower(): value for name, value in dict(kwargs.get("headers") or {}).items()}
+        if cassette is None or "upgrade" in headers:
+            # Websockets such as the Discord gateway are not recorded
+            return await session_request(session, method, str_or_url, **kwargs)
+        url = str(session._build_url(str_or_url)) if hasattr(session, "_build_url") else str(str_or_url)
+        if kwargs.get("params"):
+            url += ("&" if "?" in url else "?") + urlencode(kwargs["params"])
+        if kwargs.get("json") is not None:
+            body = json.dumps(kwargs["json"]).encode()
+        else:
+            body = _as_bytes(kwargs.get("data"))
+        if cassette.mode == "replay":
+            try:
+                interaction = cassette.replay(method, url, body)
+            except CassetteMiss as e:
+                raise aiohttp.ClientConnectionError(str(e))
+            await asyncio.sleep(cassette.delay(interaction))
+            return _ReplayedClientResponse(method, url, interaction.status, interaction.headers,
+                                           interaction.body_for(body))
+        started = time.perf_counter()
+        response = await session_request(session, method, str_or_url, **kwargs)
+        content = await response.read()
+        cassette.record(method, url, body, response.status, response.headers, content,
+                        time.perf_counter() - started)
+        return response
+
+    aiohttp.ClientSession._request = request
+
+
+def _install_hooks() -> None:
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        _installed = True
+    _install_requests()
+    _install_urllib3()
+    _install_httpx()
+    _install_aiohttp()
+
+
+def install_cassette(cassette: Optional[Cassette]) -> Optional[Cassette]:
+    """Route every requests, urllib3, httpx and aiohttp call through cassette, None stops.
+    Returns the cassette that was active before."""
+    global _active
+    if cassette is not None:
+        _install_hooks()
+    previous, _active = _active, cassette
+    return previous
+
+
+@contextmanager
+def use_cassette(path: str, mode: str = "replay", timing: str = "original"):
+    cassette = Cassette(path, mode, timing)
+    previous = install_cassette(cassette)
+    try:
+        yield cassette
+    finally:
+        install_cassette(previous)
+        cassette.close()
+
+
+def install_cassette_from_env() -> Optional[Cassette]:
+    """Record or replay as ZEREPY_CASSETTE and ZEREPY_CASSETTE_MODE say, once per process"""
+    path = os.getenv(CASSETTE_ENV)
+    if not path:
+        return _active
+    with _env_lock:
+        if _active is not None:
+            return _active
+        cassette = Cassette(path, os.getenv(CASSETTE_MODE_ENV, "replay"),
+                            os.getenv(CASSETTE_TIMING_ENV, "original"))
+        install_cassette(cassette)
+    logger.info(f"{'Recording' if cassette.mode == 'record' else 'Replaying'} HTTP traffic "
+                f"{'to' if cassette.mode == 'record' else 'from'} {path}")
+    return cassette
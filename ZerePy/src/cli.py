@@ -91,7 +91,8 @@ class ZerePyCLI:
             Command(
                 name="agent-loop",
                 description="Starts the current agent's autonomous behavior loop.",
-                tips=["Press Ctrl+C to stop the loop"],
+                tips=["Press Ctrl+C to stop the loop",
+                      "Set max_concurrent_actions in the agent file to run several iterations at once"],
                 handler=self.agent_loop,
                 aliases=['loop', 'start']
             )
@@ -339,7 +340,10 @@ class ZerePyCLI:
 
     def _load_agent_from_file(self, agent_name):
         try: 
-            self.agent = ZerePyAgent(agent_name)
+            agent = ZerePyAgent(agent_name)
+            if self.agent is not None:
+                self.agent.close()
+            self.agent = agent
             logger.info(f"\n✅ Successfully loaded agent: {self.agent.name}")
         except FileNotFoundError:
             logger.error(f"Agent file not found: {agent_name}")
@@ -542,6 +546,8 @@ class ZerePyCLI:
     def exit(self, input_list: List[str]) -> None:
         """Exit the CLI gracefully"""
         logger.info("\nGoodbye! 👋")
+        if self.agent is not None:
+            self.agent.close()
         sys.exit(0)
 
 
@@ -0,0 +1,149 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger("connection_health")
+
+DEFAULT_HEALTH_TTL = 300
+DEFAULT_FAILURE_TTL = 30
+
+# Substrings that mark an exception as a credential problem rather than a transient failure
+AUTH_ERROR_MARKERS = ("401", "403", "unauthorized", "forbidden", "authentication", "invalid api key",
+                      "credentials", "not configured")
+
+
+def is_auth_error(error: BaseException) -> bool:
+    """Best effort check whether an action failed because of bad or missing credentials"""
+    if "ConfigurationError" in type(error).__name__:
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in AUTH_ERROR_MARKERS)
+
+
+@dataclass
+class HealthState:
+    configured: bool
+    checked_at: float
+    last_error: Optional[str] = None
+    checks: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def age(self) -> float:
+        return time.monotonic() - self.checked_at
+
+
+class ConnectionHealthCache:
+    """Caches the result of BaseConnection.is_configured() for a limited time.
+
+    Several connections validate their credentials with a live API call, so checking
+    before every action doubles the number of round trips. Successful checks are kept
+    for `ttl` seconds, failed ones for `failure_ttl` seconds, and entries are dropped
+    as soon as an action fails with an auth error. An optional background thread
+    re-checks entries shortly before they expire so callers rarely pay for a check.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_HEALTH_TTL, failure_ttl: float = DEFAULT_FAILURE_TTL,
+                 refresh_interval: Optional[float] = None):
+        self.ttl = ttl
+        self.failure_ttl = min(failure_ttl, ttl)
+        self.refresh_interval = refresh_interval
+        self._states: Dict[str, HealthState] = {}
+        self._lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+        self._stop_refresher = threading.Event()
+
+    def _expiry(self, state: HealthState) -> float:
+        return self.ttl if state.configured else self.failure_ttl
+
+    def _is_fresh(self, state: Optional[HealthState]) -> bool:
+        return state is not None and state.checks > 0 and state.age() < self._expiry(state)
+
+    def _check(self, name: str, connection, verbose: bool = False) -> bool:
+        with self._lock:
+            state = self._states.setdefault(name, HealthState(configured=False, checked_at=0.0))
+        # One check per connection at a time, concurrent callers wait for its result
+        with state.lock:
+            if self._is_fresh(state) and not verbose:
+                return state.configured
+            try:
+                configured = bool(connection.is_configured(verbose=verbose))
+                state.last_error = None if configured else state.last_error
+            except Exception as e:
+                configured = False
+                state.last_error = str(e)
+            state.configured = configured
+            state.checked_at = time.monotonic()
+            state.checks += 1
+            return configured
+
+    def is_configured(self, name: str, connection, verbose: bool = False) -> bool:
+        """Cached connection.is_configured(). verbose=True always runs a fresh check so the
+        connection can log why it is not configured."""
+        state = self._states.get(name)
+        if not verbose and self._is_fresh(state):
+            return state.configured
+        return self._check(name, connection, verbose=verbose)
+
+    def peek(self, name: str) -> Optional[bool]:
+        """Last known result without running a check, None if there is none"""
+        state = self._states.get(name)
+        return state.configured if state is not None and state.checks else None
+
+    def invalidate(self, name: str, reason: Optional[str] = None) -> None:
+        with self._lock:
+            state = self._states.get(name)
+        if state is not None:
+            if reason:
+                logger.debug(f"Invalidating health of {name}: {reason}")
+                state.last_error = reason
+            state.checked_at = 0.0
+            state.checks = 0
+
+    def record_failure(self, name: str, error: BaseException) -> None:
+        """Called when an action failed, auth failures force a re-check on next use"""
+        if is_auth_error(error):
+            self.invalidate(name, str(error))
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            states = dict(self._states)
+        return {
+            name: {
+                "configured": state.configured,
+                "checked": state.checks > 0,
+                "age_seconds": round(state.age(), 1) if state.checks else None,
+                "stale": not self._is_fresh(state),
+                "last_error": state.last_error,
+            }
+            for name, state in states.items()
+        }
+
+    def start_refresher(self, get_connection: Callable[[str], object]) -> None:
+        """Start a daemon thread that re-checks cached entries before they expire, again after
+        stop_refresher() too"""
+        if not self.refresh_interval or self._refresher is not None:
+            return
+        # Each thread has its own stop event, so a stopped one cannot be revived by a restart
+        stop = self._stop_refresher = threading.Event()
+
+        def refresh_loop():
+            while not stop.wait(self.refresh_interval):
+                with self._lock:
+                    names = list(self._states.items())
+                for name, state in names:
+                    if state.checks and state.age() >= self._expiry(state) - self.refresh_interval:
+                        try:
+                            connection = get_connection(name)
+                            if connection is not None:
+                                self._check(name, connection)
+                        except Exception as e:
+                            logger.debug(f"Background health check for {name} failed: {e}")
+
+        self._refresher = threading.Thread(target=refresh_loop, name="connection-health", daemon=True)
+        self._refresher.start()
+
+    def stop_refresher(self) -> None:
+        self._stop_refresher.set()
+        self._refresher = None
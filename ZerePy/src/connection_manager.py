@@ -1,104 +1,276 @@
+import importlib
 import logging
-from typing import Any, List, Optional, Type, Dict
+import time
+from collections.abc import MutableMapping
+from typing import Any, Iterator, List, Optional, Type, Dict, Union
+from src.cassette import install_cassette_from_env
+from src.connection_health import ConnectionHealthCache, DEFAULT_HEALTH_TTL
 from src.connections.base_connection import BaseConnection
-from src.connections.anthropic_connection import AnthropicConnection
-from src.connections.eternalai_connection import EternalAIConnection
-from src.connections.goat_connection import GoatConnection
-from src.connections.groq_connection import GroqConnection
-from src.connections.openai_connection import OpenAIConnection
-from src.connections.twitter_connection import TwitterConnection
-from src.connections.farcaster_connection import FarcasterConnection
-from src.connections.ollama_connection import OllamaConnection
-from src.connections.echochambers_connection import EchochambersConnection
-from src.connections.solana_connection import SolanaConnection
-from src.connections.hyperbolic_connection import HyperbolicConnection
-from src.connections.galadriel_connection import GaladrielConnection
-from src.connections.sonic_connection import SonicConnection
-from src.connections.discord_connection import DiscordConnection
-from src.connections.allora_connection import AlloraConnection
-from src.connections.xai_connection import XAIConnection
-from src.connections.ethereum_connection import EthereumConnection
-from src.connections.together_connection import TogetherAIConnection
-from src.connections.evm_connection import EVMConnection
-from src.connections.perplexity_connection import PerplexityConnection
-from src.connections.supabase_connection import SupabaseConnection
-
+from src.metrics import CONNECTION_ACTION_SECONDS
+from src.retry import CircuitBreaker, CircuitOpen, NO_RETRY, RetryPolicy, get_breaker, is_stream
+from src.tracing import span
 logger = logging.getLogger("connection_manager")
 
+# Connection name -> (module, class, is_llm_provider). Modules are only imported when a
+# connection is first used, which keeps heavy SDKs (web3, solana, openai...) off the
+# startup path. The LLM flag mirrors each class' is_llm_provider so provider lookup
+# does not have to import every connection.
+CONNECTION_REGISTRY = {
+    "twitter": ("src.connections.twitter_connection", "TwitterConnection", False),
+    "anthropic": ("src.connections.anthropic_connection", "AnthropicConnection", True),
+    "openai": ("src.connections.openai_connection", "OpenAIConnection", True),
+    "farcaster": ("src.connections.farcaster_connection", "FarcasterConnection", False),
+    "groq": ("src.connections.groq_connection", "GroqConnection", True),
+    "eternalai": ("src.connections.eternalai_connection", "EternalAIConnection", True),
+    "ollama": ("src.connections.ollama_connection", "OllamaConnection", True),
+    "echochambers": ("src.connections.echochambers_connection", "EchochambersConnection", False),
+    "goat": ("src.connections.goat_connection", "GoatConnection", False),
+    "solana": ("src.connections.solana_connection", "SolanaConnection", False),
+    "hyperbolic": ("src.connections.hyperbolic_connection", "HyperbolicConnection", True),
+    "galadriel": ("src.connections.galadriel_connection", "GaladrielConnection", True),
+    "sonic": ("src.connections.sonic_connection", "SonicConnection", False),
+    "discord": ("src.connections.discord_connection", "DiscordConnection", False),
+    "allora": ("src.connections.allora_connection", "AlloraConnection", False),
+    "xai": ("src.connections.xai_connection", "XAIConnection", True),
+    "ethereum": ("src.connections.ethereum_connection", "EthereumConnection", False),
+    "together": ("src.connections.together_connection", "TogetherAIConnection", True),
+    "evm": ("src.connections.evm_connection", "EVMConnection", False),
+    "perplexity": ("src.connections.perplexity_connection", "PerplexityConnection", False),
+    "supabase": ("src.connections.supabase_connection", "SupabaseConnection", False),
+    "router": ("src.connections.router_connection", "RouterConnection", True),
+}
+
+
+class LazyConnections(MutableMapping):
+    """Mapping of connection name -> connection that builds each connection on first access.
+
+    Iterating yields every declared connection name without building anything, while
+    indexing, get() and items() instantiate on demand. Connections that fail to build are
+    logged and dropped, exactly as if they had never been declared.
+    """
+
+    def __init__(self, manager: "ConnectionManager"):
+        self._manager = manager
+        self._configs: Dict[str, Dict[str, Any]] = {}
+        self._built: Dict[str, BaseConnection] = {}
+
+    def declare(self, name: str, config: Dict[str, Any]) -> None:
+        self._configs[name] = config
+        self._built.pop(name, None)
+
+    def is_built(self, name: str) -> bool:
+        return name in self._built
+
+    def built(self) -> Dict[str, BaseConnection]:
+        return dict(self._built)
+
+    def __getitem__(self, name: str) -> BaseConnection:
+        connection = self._built.get(name)
+        if connection is not None:
+            return connection
+        if name not in self._configs:
+            raise KeyError(name)
+        connection = self._manager._build_connection(self._configs[name])
+        if connection is None:
+            del self._configs[name]
+            raise KeyError(name)
+        self._built[name] = connection
+        return connection
+
+    def items(self):
+        """(name, connection) for every connection that builds successfully"""
+        pairs = []
+        for name in list(self._configs):
+            try:
+                pairs.append((name, self[name]))
+            except KeyError:
+                continue
+        return pairs
+
+    def __setitem__(self, name: str, connection: BaseConnection) -> None:
+        self._configs.setdefault(name, {"name": name})
+        self._built[name] = connection
+
+    def __delitem__(self, name: str) -> None:
+        del self._configs[name]
+        self._built.pop(name, None)
+
+    def __iter__(self):
+        return iter(list(self._configs))
+
+    def __len__(self) -> int:
+        return len(self._configs)
+
+    def __contains__(self, name) -> bool:
+        return name in self._configs
+
+
+class MeteredStream:
+    """A streamed action result. It is timed to its end and settles the connection's
+    circuit breaker and health once it is exhausted, fails, is closed or is dropped, so
+    errors in the middle of a stream count like failed calls."""
+
+    def __init__(self, stream: Iterator[Any], manager: "ConnectionManager", connection_name: str,
+                 action_name: str, breaker: CircuitBreaker, started: float):
+        self._stream = stream
+        self._manager = manager
+        self._connection_name = connection_name
+        self._action_name = action_name
+        self._breaker = breaker
+        self._started = started
+        self._settled = False
+
+    def __iter__(self) -> "MeteredStream":
+        return self
+
+    def __next__(self) -> Any:
+        try:
+            return next(self._stream)
+        except StopIteration:
+            self._settle(None)
+            raise
+        except Exception as e:
+            self._settle(e)
+            raise
+
+    def close(self) -> None:
+        close = getattr(self._stream, "close", None)
+        if close is not None:
+            close()
+        self._settle(None)
+
+    def __del__(self):
+        self._settle(None)
+
+    def _settle(self, error: Optional[BaseException]) -> None:
+        if self._settled:
+            return
+        self._settled = True
+        CONNECTION_ACTION_SECONDS.observe(time.perf_counter() - self._started, connection=self._connection_name,
+                                          action=self._action_name, status="ok" if error is None else "error")
+        if error is None:
+            self._breaker.record_success()
+        else:
+            self._breaker.record_failure(error)
+            self._manager.health.record_failure(self._connection_name, error)
+
 
 class ConnectionManager:
-    def __init__(self, agent_config):
-        self.connections: Dict[str, BaseConnection] = {}
+    def __init__(self, agent_config, connection_pool=None, health_ttl: float = DEFAULT_HEALTH_TTL,
+                 health_refresh_interval: Optional[float] = None, state_store=None):
+        self.connections = LazyConnections(self)
+        # The agent's StateStore, bound to connections that persist what they have seen
+        self.state_store = state_store
+        # Import and construction time per connection, see profile_startup()
+        self.startup_profile: Dict[str, Dict[str, float]] = {}
+        # Optional SharedConnectionPool, lets agents hosted in one process reuse connections
+        self.connection_pool = connection_pool
+        # is_configured() results are cached, by default re-checked in the background every ttl/5
+        if health_refresh_interval is None:
+            health_refresh_interval = health_ttl / 5
+        self.health = ConnectionHealthCache(ttl=health_ttl, refresh_interval=health_refresh_interval)
+        # Transient action failures are retried with backoff, circuit breakers are per connection
+        self.retry_policy = RetryPolicy()
+        # Record or replay the connections' HTTP traffic when ZEREPY_CASSETTE is set
+        install_cassette_from_env()
         for config in agent_config:
             self._register_connection(config)
+        self.start()
 
-    @staticmethod
-    def _class_name_to_type(class_name: str) -> Type[BaseConnection]:
-        if class_name == "twitter":
-            return TwitterConnection
-        elif class_name == "anthropic":
-            return AnthropicConnection
-        elif class_name == "openai":
-            return OpenAIConnection
-        elif class_name == "farcaster":
-            return FarcasterConnection
-        elif class_name == "groq":
-            return GroqConnection
-        elif class_name == "eternalai":
-            return EternalAIConnection
-        elif class_name == "ollama":
-            return OllamaConnection
-        elif class_name == "echochambers":
-            return EchochambersConnection
-        elif class_name == "goat":
-            return GoatConnection
-        elif class_name == "solana":
-            return SolanaConnection
-        elif class_name == "hyperbolic":
-            return HyperbolicConnection
-        elif class_name == "galadriel":
-            return GaladrielConnection
-        elif class_name == "sonic":
-            return SonicConnection
-        elif class_name == "discord":
-            return DiscordConnection
-        elif class_name == "allora":
-            return AlloraConnection
-        elif class_name == "xai":
-            return XAIConnection
-        elif class_name == "ethereum":
-            return EthereumConnection
-        elif class_name == "together":
-            return TogetherAIConnection
-        elif class_name == "evm":
-            return EVMConnection
-        elif class_name == "perplexity":
-            return PerplexityConnection
-        elif class_name == "supabase":
-            return SupabaseConnection
-        return None
+    def start(self) -> None:
+        """Start the background health checks, a no-op while they run"""
+        self.health.start_refresher(self.connections.get)
+
+    def close(self) -> None:
+        """Stop the background health checks and the built connections' own threads.
+        start() resumes the health checks, connections restart theirs when next used."""
+        self.health.stop_refresher()
+        for name, connection in self.connections.built().items():
+            try:
+                connection.close()
+            except Exception as e:
+                logger.debug(f"Closing connection {name} failed: {e}")
+
+    def is_connection_configured(self, connection_name: str, verbose: bool = False) -> bool:
+        """Cached health check, see ConnectionHealthCache"""
+        return self.health.is_configured(connection_name, self.connections[connection_name], verbose=verbose)
+
+    def _class_name_to_type(self, class_name: str) -> Type[BaseConnection]:
+        entry = CONNECTION_REGISTRY.get(class_name)
+        if entry is None:
+            return None
+        module_name, attribute, _ = entry
+        started = time.perf_counter()
+        try:
+            module = importlib.import_module(module_name)
+        finally:
+            self.startup_profile.setdefault(class_name, {})["import"] = time.perf_counter() - started
+        return getattr(module, attribute)
 
     def _register_connection(self, config_dic: Dict[str, Any]) -> None:
         """
-        Create and register a new connection with configuration
+        Declare a connection. The connection is built the first time it is used.
 
         Args:
-            name: Identifier for the connection
-            connection_class: The connection class to instantiate
-            config: Configuration dictionary for the connection
+            config_dic: Configuration dictionary for the connection, "name" selects the connection class
         """
+        name = config_dic.get("name")
+        if name not in CONNECTION_REGISTRY:
+            logging.error(f"Failed to initialize connection {name}: unknown connection type")
+            return
+        self.connections.declare(name, config_dic)
+
+    def _build_connection(self, config_dic: Dict[str, Any]) -> Optional[BaseConnection]:
+        """Import the connection module and instantiate the connection, None on failure"""
+        name = config_dic["name"]
         try:
-            name = config_dic["name"]
             connection_class = self._class_name_to_type(name)
-            connection = connection_class(config_dic)
-            self.connections[name] = connection
+            started = time.perf_counter()
+            if getattr(connection_class, "needs_connection_manager", False):
+                # Wraps other connections of this agent, so it cannot come from the shared pool
+                connection = connection_class(config_dic)
+                connection.bind_connection_manager(self)
+            elif self.connection_pool is not None and not getattr(connection_class, "needs_state_store", False):
+                connection = self.connection_pool.get_or_create(config_dic, connection_class)
+            else:
+                connection = connection_class(config_dic)
+            if getattr(connection_class, "needs_state_store", False) and self.state_store is not None:
+                connection.bind_state_store(self.state_store)
+            self.startup_profile.setdefault(name, {})["construct"] = time.perf_counter() - started
+            return connection
         except Exception as e:
             logging.error(f"Failed to initialize connection {name}: {e}")
+            self.startup_profile.setdefault(name, {})["error"] = f"{type(e).__name__}: {e}"
+            return None
+
+    def is_llm_provider(self, connection_name: str) -> bool:
+        entry = CONNECTION_REGISTRY.get(connection_name)
+        if entry is not None and not self.connections.is_built(connection_name):
+            return entry[2]
+        return bool(getattr(self.connections.get(connection_name), "is_llm_provider", False))
+
+    def build_all(self) -> None:
+        """Instantiate every declared connection up front"""
+        for name in list(self.connections):
+            self.connections.get(name)
+
+    def profile_startup(self) -> List[Dict[str, Any]]:
+        """Build all connections and return import/construction time for each"""
+        self.build_all()
+        return [
+            {
+                "name": name,
+                "import": timings.get("import", 0.0),
+                "construct": timings.get("construct", 0.0),
+                "built": self.connections.is_built(name),
+                "error": timings.get("error"),
+            }
+            for name, timings in self.startup_profile.items()
+        ]
 
     def _check_connection(self, connection_string: str) -> bool:
         try:
-            connection = self.connections[connection_string]
-            return connection.is_configured(verbose=True)
+            return self.is_connection_configured(connection_string, verbose=True)
         except KeyError:
             logging.error(
                 "\nUnknown connection. Try 'list-connections' to see all supported connections."
@@ -113,6 +285,7 @@ class ConnectionManager:
         try:
             connection = self.connections[connection_name]
             success = connection.configure()
+            self.health.invalidate(connection_name)
 
             if success:
                 logging.info(
@@ -134,10 +307,16 @@ class ConnectionManager:
     def list_connections(self) -> None:
         """List all available connections and their status"""
         logging.info("\nAVAILABLE CONNECTIONS:")
-        for name, connection in self.connections.items():
-            status = (
-                "✅ Configured" if connection.is_configured() else "❌ Not Configured"
-            )
+        for name in self.connections:
+            try:
+                configured = self.is_connection_configured(name)
+            except KeyError:
+                # Failed to build, the error has already been logged
+                continue
+            status = "✅ Configured" if configured else "❌ Not Configured"
+            health = self.health.snapshot().get(name, {})
+            if health.get("age_seconds") is not None:
+                status += f" (checked {health['age_seconds']:.0f}s ago)"
             logging.info(f"- {name}: {status}")
 
     def list_actions(self, connection_name: str) -> None:
@@ -145,7 +324,7 @@ class ConnectionManager:
         try:
             connection = self.connections[connection_name]
 
-            if connection.is_configured():
+            if self.is_connection_configured(connection_name):
                 logging.info(
                     f"\n✅ {connection_name} is configured. You can use any of its actions."
                 )
@@ -170,13 +349,15 @@ class ConnectionManager:
             logging.error(f"\nAn error occurred: {e}")
 
     def perform_action(
-        self, connection_name: str, action_name: str, params: List[Any]
+        self, connection_name: str, action_name: str, params: Union[List[Any], Dict[str, Any]]
     ) -> Optional[Any]:
-        """Perform an action on a specific connection with given parameters"""
+        """Perform an action on a specific connection with given parameters, either positional
+        or a dict by parameter name. Names the action does not take are dropped, so one dict
+        fits providers whose parameters differ."""
         try:
             connection = self.connections[connection_name]
 
-            if not connection.is_configured():
+            if not self.is_connection_configured(connection_name):
                 logging.error(
                     f"\nError: Connection '{connection_name}' is not configured"
                 )
@@ -194,10 +375,19 @@ class ConnectionManager:
             kwargs = {}
             param_index = 0
 
+            if isinstance(params, dict):
+                for param in action.parameters:
+                    if param.name in params and (params[param.name] is not None or param.required):
+                        kwargs[param.name] = params[param.name]
+                params = []
+
             # Add provided parameters up to the number provided
             for i, param in enumerate(action.parameters):
                 if param_index < len(params):
-                    kwargs[param.name] = params[param_index]
+                    # Unset optional params fall back to the method defaults instead of
+                    # failing validate_params type coercion
+                    if params[param_index] is not None or param.required:
+                        kwargs[param.name] = params[param_index]
                     param_index += 1
 
             # Validate all required parameters are present
@@ -213,8 +403,30 @@ class ConnectionManager:
                 )
                 return None
 
-            return connection.perform_action(action_name, kwargs)
+            # LLM SDKs retry on their own, the router fails over between providers
+            policy = NO_RETRY if connection.is_llm_provider else self.retry_policy
+            breaker = get_breaker(connection_name)
+            started = time.perf_counter()
+            with span(f"connection:{connection_name}", action=action_name):
+                try:
+                    result = policy.call(breaker.call, connection.perform_action, action_name, kwargs,
+                                         target=connection_name, idempotent=action.idempotent)
+                except Exception as e:
+                    CONNECTION_ACTION_SECONDS.observe(time.perf_counter() - started, connection=connection_name,
+                                                      action=action_name, status="error")
+                    if not isinstance(e, CircuitOpen):
+                        self.health.record_failure(connection_name, e)
+                    raise
+            if is_stream(result):
+                # Timed and settled when the stream ends, not when it was opened
+                return MeteredStream(result, self, connection_name, action_name, breaker, started)
+            CONNECTION_ACTION_SECONDS.observe(time.perf_counter() - started, connection=connection_name,
+                                              action=action_name, status="ok")
+            return result
 
+        except CircuitOpen as e:
+            logging.error(f"\nSkipped action {action_name}: {e}")
+            return None
         except Exception as e:
             logging.error(
                 f"\nAn error occurred while trying action {action_name} for {connection_name} connection: {e}"
@@ -223,8 +435,13 @@ class ConnectionManager:
 
     def get_model_providers(self) -> List[str]:
         """Get a list of all LLM provider connections"""
-        return [
-            name
-            for name, conn in self.connections.items()
-            if conn.is_configured() and getattr(conn, "is_llm_provider", lambda: False)
-        ]
+        providers = []
+        for name in self.connections:
+            if not self.is_llm_provider(name):
+                continue
+            try:
+                if self.is_connection_configured(name):
+                    providers.append(name)
+            except KeyError:
+                continue
+        return providers
@@ -1,9 +1,11 @@
 import logging
 import os
-from typing import Dict, Any
+from typing import Any, Dict, Iterator, List, Optional
 from dotenv import load_dotenv, set_key
 from anthropic import Anthropic, NotFoundError
 from src.connections.base_connection import BaseConnection, Action, ActionParameter
+from src.helpers.streaming import stream_until
+from src.usage import CallUsage
 
 logger = logging.getLogger("connections.anthropic_connection")
 
@@ -20,6 +22,9 @@ class AnthropicAPIError(AnthropicConnectionError):
     pass
 
 class AnthropicConnection(BaseConnection):
+    # Requests have always been sent at temperature 0
+    default_temperature = 0.0
+
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
         self._client = None
@@ -49,10 +54,23 @@ class AnthropicConnection(BaseConnection):
                 parameters=[
                     ActionParameter("prompt", True, str, "The input prompt for text generation"),
                     ActionParameter("system_prompt", True, str, "System prompt to guide the model"),
-                    ActionParameter("model", False, str, "Model to use for generation")
+                    ActionParameter("model", False, str, "Model to use for generation"),
+                    ActionParameter("temperature", False, float, "Sampling temperature, the connection's default when unset"),
                 ],
                 description="Generate text using Anthropic models"
             ),
+            "generate-text-stream": Action(
+                name="generate-text-stream",
+                parameters=[
+                    ActionParameter("prompt", True, str, "The input prompt for text generation"),
+                    ActionParameter("system_prompt", True, str, "System prompt to guide the model"),
+                    ActionParameter("stop", False, list, "Stop sequences"),
+                    ActionParameter("response_format", False, dict, "Response format to use"),
+                    ActionParameter("model", False, str, "Model to use for generation"),
+                    ActionParameter("temperature", False, float, "Sampling temperature, the connection's default when unset"),
+                ],
+                description="Stream generated text from Anthropic models as it is produced"
+            ),
             "check-model": Action(
                 name="check-model",
                 parameters=[
@@ -128,8 +146,15 @@ class AnthropicConnection(BaseConnection):
                 logger.debug(f"Configuration check failed: {e}")
             return False
 
-    def generate_text(self, prompt: str, system_prompt: str, model: str = None, **kwargs) -> str:
+    def generate_text(self, prompt: str, system_prompt: str, model: str = None,
+                      temperature: Optional[float] = None, **kwargs) -> str:
         """Generate text using Anthropic models"""
+        return "".join(self.generate_text_stream(prompt, system_prompt, model=model, temperature=temperature))
+
+    def generate_text_stream(self, prompt: str, system_prompt: str, stop: Optional[List[str]] = None,
+                             response_format: Any = None, model: str = None,
+                             temperature: Optional[float] = None, **kwargs) -> Iterator[str]:
+        """Stream generated text from Anthropic models, stops early at any stop sequence"""
         try:
             client = self._get_client()
             
@@ -137,28 +162,44 @@ class AnthropicConnection(BaseConnection):
             if not model:
                 model = self.config["model"]
 
-            message = client.messages.create(
-                model=model,
-                max_tokens=1000,
-                temperature=0,
-                system=system_prompt,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": prompt
-                            }
-                        ]
-                    }
-                ]
-            )
-            return message.content[0].text
+            with CallUsage("anthropic", model, system_prompt, prompt) as usage:
+                # Stop sequences are matched client side, the API rejects whitespace-only ones like "\n"
+                with client.messages.stream(
+                    model=model,
+                    max_tokens=1000,
+                    temperature=self.effective_temperature(temperature),
+                    system=system_prompt,
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": [
+                                {
+                                    "type": "text",
+                                    "text": prompt
+                                }
+                            ]
+                        }
+                    ]
+                ) as stream:
+                    try:
+                        yield from usage.track(stream_until(stream.text_stream, stop))
+                    finally:
+                        self._report_usage(stream, usage)
             
         except Exception as e:
             raise AnthropicAPIError(f"Text generation failed: {e}")
 
+    @staticmethod
+    def _report_usage(stream, usage: CallUsage) -> None:
+        # The snapshot holds input tokens from the start and output tokens up to the last event read
+        try:
+            snapshot = stream.current_message_snapshot.usage
+        except Exception:
+            # No message_start received, the call is estimated instead
+            return
+        usage.report(snapshot.input_tokens, snapshot.output_tokens,
+                     getattr(snapshot, "cache_read_input_tokens", None))
+
     def check_model(self, model: str, **kwargs) -> bool:
         """Check if a specific model is available"""
         try:
@@ -1,6 +1,6 @@
 import logging
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Callable
+from typing import Any, Dict, List, Callable, Optional
 from dataclasses import dataclass
 
 @dataclass
@@ -15,6 +15,8 @@ class Action:
     name: str
     parameters: List[ActionParameter]
     description: str
+    # False for writes (posts, replies, transfers) that a retry after a timeout could repeat
+    idempotent: bool = True
     
     def validate_params(self, params: Dict[str, Any]) -> List[str]:
         errors = []
@@ -29,6 +31,10 @@ class Action:
         return errors
 
 class BaseConnection(ABC):
+    # Temperature an LLM provider samples at when neither the call nor the connection's
+    # "temperature" setting gives one, None when it is not known
+    default_temperature: Optional[float] = None
+
     def __init__(self, config):
         try:
             # Dictionary to store action name -> handler method mapping
@@ -46,6 +52,17 @@ class BaseConnection(ABC):
     def is_llm_provider(self):
         pass
 
+    def effective_temperature(self, temperature: Optional[float] = None) -> Optional[float]:
+        """Temperature a generate-text call passing temperature runs at, None if unknown"""
+        if temperature is not None:
+            return temperature
+        return self.config.get("temperature", self.default_temperature)
+
+    def sampling_options(self, temperature: Optional[float] = None) -> Dict[str, float]:
+        """Request options for temperature, empty to leave the provider's own default"""
+        temperature = self.effective_temperature(temperature)
+        return {} if temperature is None else {"temperature": temperature}
+
     @abstractmethod
     def validate_config(self, config) -> Dict[str, Any]:
         """
@@ -84,6 +101,9 @@ class BaseConnection(ABC):
         """
         pass
 
+    def close(self) -> None:
+        """Stop the connection's background threads, if it has any"""
+
     @abstractmethod
     def register_actions(self) -> None:
         """
@@ -1,10 +1,11 @@
 import os
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from dotenv import set_key, load_dotenv
 from src.connections.base_connection import BaseConnection, Action, ActionParameter
+from src.discord_gateway import DEFAULT_QUEUE_SIZE, DEFAULT_WORKERS, DiscordGateway
+from src.http_session import get_session
 from src.helpers import print_h_bar
-import requests
 import json
 
 logger = logging.getLogger("connections.discord_connection")
@@ -33,6 +34,8 @@ class DiscordConnection(BaseConnection):
         super().__init__(config)
         self.base_url = "https://discord.com/api/v10"
         self.bot_username = None
+        self.bot_user_id = None
+        self.gateway: Optional[DiscordGateway] = None
 
     @property
     def is_llm_provider(self) -> bool:
@@ -81,6 +84,12 @@ class DiscordConnection(BaseConnection):
                         int,
                         "Number of messages to retrieve",
                     ),
+                    ActionParameter(
+                        "after",
+                        False,
+                        str,
+                        "Only get messages newer than this message id",
+                    ),
                 ],
                 description="Get the latest messages from a channel",
             ),
@@ -116,6 +125,7 @@ class DiscordConnection(BaseConnection):
                     ),
                 ],
                 description="Post a new message",
+                idempotent=False,
             ),
             "reply-to-message": Action(
                 name="reply-to-message",
@@ -132,6 +142,7 @@ class DiscordConnection(BaseConnection):
                     ActionParameter("message", True, str, "Reply message content"),
                 ],
                 description="Reply to an existing message",
+                idempotent=False,
             ),
             "react-to-message": Action(
                 name="react-to-message",
@@ -258,10 +269,12 @@ class DiscordConnection(BaseConnection):
         logger.info(f"Retrieved {len(formatted_response)} channels")
         return formatted_response
 
-    def read_messages(self, channel_id: str, count: int, **kwargs) -> dict:
-        """Reading messages in a channel"""
-        logger.debug("Sending a new message")
+    def read_messages(self, channel_id: str, count: int, after: Optional[str] = None, **kwargs) -> dict:
+        """Reading messages in a channel, the ones after a message id when after is given"""
+        logger.debug("Reading messages")
         request_path = f"/channels/{channel_id}/messages?limit={count}"
+        if after:
+            request_path += f"&after={after}"
         response = self._get_request(request_path)
         formatted_response = self._format_messages(response)
 
@@ -324,6 +337,26 @@ class DiscordConnection(BaseConnection):
         logger.info("Reacted to message successfully")
         return
 
+    def start_gateway(self, key: str, handler) -> DiscordGateway:
+        """Listen for messages that mention the bot on the Discord Gateway and hand each
+        one to handler, an async callable subscribed under key. The client is started once
+        per connection and dispatches to every subscriber."""
+        if self.gateway is None:
+            self.gateway = DiscordGateway(
+                self,
+                workers=self.config.get("gateway_workers", DEFAULT_WORKERS),
+                queue_size=self.config.get("gateway_queue_size", DEFAULT_QUEUE_SIZE),
+            )
+            self.gateway.start()
+        self.gateway.subscribe(key, handler)
+        return self.gateway
+
+    def close(self) -> None:
+        """Stop the gateway client, subscribers start a new one on their next call"""
+        gateway, self.gateway = self.gateway, None
+        if gateway is not None:
+            gateway.stop()
+
     def _format_reply_message(self, reply_message: dict) -> dict:
         """Helper method to format reply messages"""
         mentions = []
@@ -390,7 +423,7 @@ class DiscordConnection(BaseConnection):
             "Accept": "application/json",
             "Authorization": self._get_request_auth_token(),
         }
-        response = requests.request("PUT", url, headers=headers, data={})
+        response = get_session("discord").request("PUT", url, headers=headers, data={})
         if response.status_code != 204:
             raise DiscordAPIError(
                 f"Failed to called PUT to Discord: {response.status_code} - {response.text}"
@@ -405,7 +438,7 @@ class DiscordConnection(BaseConnection):
             "Accept": "application/json",
             "Authorization": self._get_request_auth_token(),
         }
-        response = requests.request("POST", url, headers=headers, data=payload)
+        response = get_session("discord").request("POST", url, headers=headers, data=payload)
         if response.status_code != 200:
             raise DiscordAPIError(
                 f"Failed to call POST to Discord: {response.status_code} - {response.text}"
@@ -420,28 +453,33 @@ class DiscordConnection(BaseConnection):
             "Authorization": self._get_request_auth_token(),
         }
         print(headers)
-        response = requests.request("GET", url, headers=headers, data={})
+        response = get_session("discord").request("GET", url, headers=headers, data={})
         if response.status_code != 200:
             raise DiscordAPIError(
                 f"Failed to call GET to Discord: {response.status_code} - {response.text}"
             )
         return json.loads(response.text)
 
+    def _get_token(self) -> str:
+        return os.getenv("DISCORD_TOKEN")
+
     def _get_request_auth_token(self) -> str:
-        return f"Bot {os.getenv('DISCORD_TOKEN')}"
+        return f"Bot {self._get_token()}"
 
     def _test_connection(self, api_key: str) -> None:
         """Helper method to check if Discord is reachable"""
         try:
             url = f"{self.base_url}/users/@me"
             headers = {"Accept": "application/json", "Authorization": f"Bot {api_key}"}
-            response = requests.request("GET", url, headers=headers, data={})
+            response = get_session("discord").request("GET", url, headers=headers, data={})
             if response.status_code != 200:
                 raise DiscordAPIError(
                     f"Failed to call GET to Discord: {response.status_code} - {response.text}"
                 )
 
-            self.bot_username = json.loads(response.text)["username"]
+            bot_user = json.loads(response.text)
+            self.bot_username = bot_user["username"]
+            self.bot_user_id = bot_user["id"]
 
         except Exception as e:
             raise DiscordConnectionError(f"Connection test failed: {e}")
@@ -6,9 +6,14 @@ from collections import deque
 import requests
 from dotenv import load_dotenv
 from src.connections.base_connection import BaseConnection, Action, ActionParameter
+from src.http_session import get_session
+from src.metrics import REGISTRY
 
 logger = logging.getLogger("connections.echochambers_connection")
 
+ECHOCHAMBERS_MESSAGES = REGISTRY.counter(
+    "zerepy_echochambers_messages_total", "Messages posted to Echochambers rooms", ["status"])
+
 class EchochambersConnectionError(Exception):
     """Base exception for Echochambers connection errors"""
     pass
@@ -45,6 +50,7 @@ class EchochambersConnection(BaseConnection):
 
         # Initialize message queue and tracking
         self.message_queue: List[Dict[str, Any]] = []
+        # In memory until the connection manager binds the agent's state store
         self.processed_messages = set()
         self.max_queue_size = 100
         
@@ -55,7 +61,7 @@ class EchochambersConnection(BaseConnection):
         self.metrics = {
             'messages_sent': 0,
             'messages_failed': 0,
-            'api_latency': [],
+            'api_latency': deque(maxlen=100),
             'last_error': None,
             'last_metrics_log': time.time()
         }
@@ -67,6 +73,14 @@ class EchochambersConnection(BaseConnection):
     def is_llm_provider(self) -> bool:
         return False
 
+    # Built with the agent's state store, never shared between agents
+    needs_state_store = True
+
+    def bind_state_store(self, state_store) -> None:
+        # Persisted so a restarted agent does not queue the same messages again
+        self.processed_messages = state_store.seen_set(
+            f"echochambers:{self.room}:{self.sender_username}", "processed")
+
     def validate_config(self, config: Dict[str, Any]) -> Dict[str, Any]:
         """Validate Echochambers configuration from JSON"""
         required_fields = ["api_url", "api_key", "room", "history_read_count", "sender_username", "sender_model"]
@@ -95,6 +109,7 @@ class EchochambersConnection(BaseConnection):
             Action(
                 name="send-message",
                 description="Send a message to the Echochambers room",
+                idempotent=False,
                 parameters=[
                     ActionParameter(
                         name="content",
@@ -168,6 +183,7 @@ class EchochambersConnection(BaseConnection):
             }
             response = self._make_request("POST", url, json=data)
             self.metrics['messages_sent'] += 1
+            ECHOCHAMBERS_MESSAGES.inc(status="sent")
             
             # Add to sent messages history
             self.sent_messages.append({
@@ -178,6 +194,7 @@ class EchochambersConnection(BaseConnection):
             return response
         except Exception as e:
             self.metrics['messages_failed'] += 1
+            ECHOCHAMBERS_MESSAGES.inc(status="failed")
             self._handle_error("Failed to send message", e)
             raise
 
@@ -202,31 +219,22 @@ class EchochambersConnection(BaseConnection):
             raise
 
     def _make_request(self, method: str, url: str, **kwargs) -> Any:
-        """Make HTTP request with retries and error handling"""
+        """Make one HTTP request. Failed actions are retried with backoff by the
+        ConnectionManager, retrying here as well would multiply the attempts."""
         headers = {
             "Content-Type": "application/json",
             "x-api-key": self.api_key
         }
         kwargs['headers'] = headers
 
-        for attempt in range(3):
-            try:
-                response = requests.request(method, url, timeout=10, **kwargs)
-                if response.status_code == 429:  # Rate limit
-                    retry_after = int(response.headers.get('Retry-After', 60))
-                    logger.warning(f"Rate limit hit, waiting {retry_after}s")
-                    time.sleep(retry_after)
-                    continue
-                response.raise_for_status()
-                return response.json()
-            except requests.Timeout:
-                logger.error(f"Timeout on attempt {attempt + 1}")
-                time.sleep(2 ** attempt)  # Exponential backoff
-            except requests.RequestException as e:
-                if attempt == 2:
-                    raise EchochambersAPIError(f"Failed after 3 attempts: {str(e)}")
-                logger.warning(f"Attempt {attempt + 1} failed: {str(e)}")
-                time.sleep(2 ** attempt)
+        try:
+            started = time.perf_counter()
+            response = get_session("echochambers").request(method, url, timeout=10, **kwargs)
+            self.metrics['api_latency'].append((time.perf_counter() - started) * 1000)
+            response.raise_for_status()
+            return response.json()
+        except requests.RequestException as e:
+            raise EchochambersAPIError(f"Request failed: {str(e)}")
 
     def _handle_error(self, message: str, error: Exception) -> None:
         """Handle and log errors"""
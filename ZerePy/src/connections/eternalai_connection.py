@@ -1,12 +1,14 @@
 import logging
 import os
 import json
-from typing import Dict, Any
+from typing import Any, Dict, Iterator, List, Optional
 from dotenv import load_dotenv, set_key
 from openai import OpenAI
 from src.connections.base_connection import BaseConnection, Action, ActionParameter
+from src.http_session import get_session
+from src.helpers.streaming import close_stream, stream_until
+from src.usage import CallUsage
 from web3 import Web3
-import requests
 
 logger = logging.getLogger("connections.eternalai_connection")
 IPFS = "ipfs://"
@@ -59,10 +61,23 @@ class EternalAIConnection(BaseConnection):
                 parameters=[
                     ActionParameter("prompt", True, str, "The input prompt for text generation"),
                     ActionParameter("system_prompt", True, str, "System prompt to guide the model"),
-                    ActionParameter("model", False, str, "Model to use for generation")
+                    ActionParameter("model", False, str, "Model to use for generation"),
+                    ActionParameter("temperature", False, float, "Sampling temperature, the connection's default when unset"),
                 ],
                 description="Generate text using EternalAI models"
             ),
+            "generate-text-stream": Action(
+                name="generate-text-stream",
+                parameters=[
+                    ActionParameter("prompt", True, str, "The input prompt for text generation"),
+                    ActionParameter("system_prompt", True, str, "System prompt to guide the model"),
+                    ActionParameter("stop", False, list, "Stop sequences"),
+                    ActionParameter("response_format", False, dict, "Response format to use"),
+                    ActionParameter("model", False, str, "Model to use for generation"),
+                    ActionParameter("temperature", False, float, "Sampling temperature, the connection's default when unset"),
+                ],
+                description="Stream generated text from EternalAI models as it is produced"
+            ),
             "check-model": Action(
                 name="check-model",
                 parameters=[
@@ -147,12 +162,12 @@ class EternalAIConnection(BaseConnection):
     def get_on_chain_system_prompt_content(on_chain_data: str) -> str:
         if IPFS in on_chain_data:
             light_house = on_chain_data.replace(IPFS, LIGHTHOUSE_IPFS)
-            response = requests.get(light_house)
+            response = get_session("eternalai").get(light_house)
             if response.status_code == 200:
                 return response.text
             else:
                 gcs = on_chain_data.replace(IPFS, GCS_ETERNAL_AI_BASE_URL)
-                response = requests.get(gcs)
+                response = get_session("eternalai").get(gcs)
                 if response.status_code == 200:
                     return response.text
                 else:
@@ -163,81 +178,122 @@ class EternalAIConnection(BaseConnection):
             else:
                 raise Exception(f"invalid on-chain system prompt")
 
-    def generate_text(self, prompt: str, system_prompt: str, model: str = None, chain_id: str = None, **kwargs) -> str:
+    def _resolve_request(self, system_prompt: str, model: str = None, chain_id: str = None):
+        """Model, chain id and system prompt to use, the on-chain system prompt wins when configured"""
+        model = model or self.config["model"]
+        logger.info(f"model {model}")
+
+        chain_id = chain_id or self.config["chain_id"]
+        if not chain_id or chain_id == "":
+            chain_id = "45762"
+        logger.info(f"chain_id {chain_id}")
+
+        agent_id = self.config["agent_id"] or None
+        contract_address = self.config["contract_address"] or None
+        rpc = self.config["rpc_url"] or None
+
+        if agent_id and contract_address and rpc:
+            logger.info(f"agent_id: {agent_id}, contract_address: {contract_address}")
+            # call on-chain system prompt
+            web3 = Web3(Web3.HTTPProvider(rpc))
+            logger.info(f"web3 connected to {rpc} {web3.is_connected()}")
+            contract = web3.eth.contract(address=contract_address, abi=AGENT_CONTRACT_ABI)
+            result = contract.functions.getAgentSystemPrompt(agent_id).call()
+            logger.info(f"on-chain system_prompt: {result}")
+            if len(result) > 0:
+                try:
+                    system_prompt = self.get_on_chain_system_prompt_content(result[0].decode("utf-8"))
+                    logging.info(f"new system_prompt: {system_prompt}")
+                except Exception as e:
+                    logger.error(f"get on-chain system_prompt fail {e}")
+        return model, chain_id, system_prompt
+
+    def generate_text(self, prompt: str, system_prompt: str, model: str = None, chain_id: str = None,
+                      temperature: Optional[float] = None, **kwargs) -> str:
         """Generate text using EternalAI models"""
+        if self.config["stream"]:
+            content = "".join(self.generate_text_stream(prompt, system_prompt, model=model, chain_id=chain_id,
+                                                        temperature=temperature))
+            logger.info(f"end call completions api with content:\n\n {content} \n\n\n\n")
+            return content
         try:
             client = self._get_client()
-            model = model or self.config["model"]
-            logger.info(f"model {model}")
-
-            chain_id = chain_id or self.config["chain_id"]
-            if not chain_id or chain_id == "":
-                chain_id = "45762"
-            logger.info(f"chain_id {chain_id}")
-
-            agent_id = self.config["agent_id"] or None
-            contract_address = self.config["contract_address"] or None
-            rpc = self.config["rpc_url"] or None
-
-            if agent_id and contract_address and rpc:
-                logger.info(f"agent_id: {agent_id}, contract_address: {contract_address}")
-                # call on-chain system prompt
-                web3 = Web3(Web3.HTTPProvider(rpc))
-                logger.info(f"web3 connected to {rpc} {web3.is_connected()}")
-                contract = web3.eth.contract(address=contract_address, abi=AGENT_CONTRACT_ABI)
-                result = contract.functions.getAgentSystemPrompt(agent_id).call()
-                logger.info(f"on-chain system_prompt: {result}")
-                if len(result) > 0:
-                    try:
-                        system_prompt = self.get_on_chain_system_prompt_content(result[0].decode("utf-8"))
-                        logging.info(f"new system_prompt: {system_prompt}")
-                    except Exception as e:
-                        logger.error(f"get on-chain system_prompt fail {e}")
-
-            stream = self.config["stream"]
-            logger.info(f"call completions api stream {stream}")
-            completion = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt},
-                ],
-                extra_body={"chain_id": chain_id},
-                stream=stream,
-            )
-            if not stream:
-                if completion.choices is None:
-                    raise EternalAIAPIError(f"Text generation failed: completion.choices is None")
-                try:
-                    if completion.onchain_data is not None:
-                        logger.info(f"response onchain data: {json.dumps(completion.onchain_data, indent=4)}")
-                except:
-                    logger.info(f"response onchain data object: {completion.onchain_data}", )
-                logger.info(
-                    f"end call completions api with content:\n\n {completion.choices[0].message.content} \n\n\n\n")
-                return completion.choices[0].message.content
-            else:
-                content = ""
-                # logger.info(f"completion {str(completion)}")
-                for chunk in completion:
-                    if chunk.choices is not None:
-                        delta = chunk.choices[0].delta
-                        if delta is not None and delta.content is not None:
-                            content += delta.content
-                            # logger.info(f"content -> {delta.content}")
-                    else:
-                        try:
-                            if chunk.onchain_data is not None and chunk.onchain_data.infer_id is not None and chunk.onchain_data.infer_id != "":
-                                logger.info(f"response onchain data: {json.dumps(chunk.onchain_data, indent=4)}")
-                        except:
-                            logger.info(f"response onchain data object: {chunk.onchain_data}", )
-                        break
-                logger.info(f"end call completions api with content:\n\n {content} \n\n\n\n")
-                return content
+            model, chain_id, system_prompt = self._resolve_request(system_prompt, model, chain_id)
+
+            logger.info(f"call completions api stream False")
+            with CallUsage("eternalai", model, system_prompt, prompt) as usage:
+                completion = client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt},
+                    ],
+                    extra_body={"chain_id": chain_id},
+                    stream=False,
+                    **self.sampling_options(temperature),
+                )
+                usage.report_openai(getattr(completion, "usage", None))
+            if completion.choices is None:
+                raise EternalAIAPIError(f"Text generation failed: completion.choices is None")
+            try:
+                if completion.onchain_data is not None:
+                    logger.info(f"response onchain data: {json.dumps(completion.onchain_data, indent=4)}")
+            except:
+                logger.info(f"response onchain data object: {completion.onchain_data}", )
+            logger.info(
+                f"end call completions api with content:\n\n {completion.choices[0].message.content} \n\n\n\n")
+            return completion.choices[0].message.content
 
         except Exception as e:
             raise EternalAIAPIError(f"Text generation failed: {e}")
 
+    def generate_text_stream(self, prompt: str, system_prompt: str, stop: Optional[List[str]] = None,
+                             response_format: Any = None, model: str = None, chain_id: str = None,
+                             temperature: Optional[float] = None,
+                             **kwargs) -> Iterator[str]:
+        """Stream generated text from EternalAI models, stops early at any stop sequence"""
+        try:
+            client = self._get_client()
+            model, chain_id, system_prompt = self._resolve_request(system_prompt, model, chain_id)
+
+            logger.info(f"call completions api stream True")
+            with CallUsage("eternalai", model, system_prompt, prompt) as usage:
+                completion = client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt},
+                    ],
+                    extra_body={"chain_id": chain_id},
+                    stream=True,
+                    **self.sampling_options(temperature),
+                )
+                yield from usage.track(stream_until(self._iter_deltas(completion, usage), stop))
+
+        except Exception as e:
+            raise EternalAIAPIError(f"Text generation failed: {e}")
+
+    @staticmethod
+    def _iter_deltas(completion, usage: Optional[CallUsage] = None) -> Iterator[str]:
+        # Content chunks are followed by a final chunk without choices that carries the on-chain data
+        try:
+            for chunk in completion:
+                if usage is not None:
+                    usage.report_openai(getattr(chunk, "usage", None))
+                if chunk.choices is not None:
+                    delta = chunk.choices[0].delta
+                    if delta is not None and delta.content is not None:
+                        yield delta.content
+                else:
+                    try:
+                        if chunk.onchain_data is not None and chunk.onchain_data.infer_id is not None and chunk.onchain_data.infer_id != "":
+                            logger.info(f"response onchain data: {json.dumps(chunk.onchain_data, indent=4)}")
+                    except:
+                        logger.info(f"response onchain data object: {chunk.onchain_data}", )
+                    break
+        finally:
+            close_stream(completion)
+
     def check_model(self, model: str, **kwargs) -> bool:
         """Check if a specific model is available"""
         try:
@@ -1,7 +1,6 @@
 import logging
 import os
 import time
-import requests
 from typing import Dict, Any, Optional, Union
 from dotenv import load_dotenv, set_key
 from web3 import Web3
@@ -9,6 +8,7 @@ from web3.middleware import geth_poa_middleware
 from src.constants.networks import EVM_NETWORKS
 from src.constants.abi import ERC20_ABI
 from src.connections.base_connection import BaseConnection, Action, ActionParameter
+from src.http_session import get_session
 
 logger = logging.getLogger("connections.ethereum_connection")
 
@@ -100,7 +100,8 @@ class EthereumConnection(BaseConnection):
                     ActionParameter("amount", True, float, "Amount to transfer"),
                     ActionParameter("token_address", False, str, "Token address (optional, native token if not provided)")
                 ],
-                description="Send ETH or tokens"
+                description="Send ETH or tokens",
+                idempotent=False
             ),
             "get-address": Action(
             name="get-address",
@@ -115,7 +116,8 @@ class EthereumConnection(BaseConnection):
                     ActionParameter("amount", True, float, "Amount to swap"),
                     ActionParameter("slippage", False, float, "Max slippage percentage (default 0.5%)")
                 ],
-                description="Swap tokens using Kyberswap aggregator"
+                description="Swap tokens using Kyberswap aggregator",
+                idempotent=False
             )
         }
 
@@ -202,7 +204,7 @@ class EthereumConnection(BaseConnection):
     def _get_token_address(self, ticker: str) -> Optional[str]:
         """Helper function to get token address from DEXScreener"""
         try:
-            response = requests.get(
+            response = get_session("ethereum").get(
                 f"https://api.dexscreener.com/latest/dex/search?q={ticker}"
             )
             response.raise_for_status()
@@ -308,7 +310,7 @@ class EthereumConnection(BaseConnection):
             # Try to get ETH value using Kyberswap price API
             try:
                 kyber_url = f"{self.aggregator_api}/tokens/rates"
-                response = requests.get(kyber_url, params={
+                response = get_session("ethereum").get(kyber_url, params={
                     "tokenIn": token_address, 
                     "tokenOut": self.NATIVE_TOKEN, 
                     "amount": str(raw_balance) 
@@ -441,7 +443,7 @@ class EthereumConnection(BaseConnection):
                 "gasInclude": "true"
             }
             
-            response = requests.get(url, headers=headers, params=params)
+            response = get_session("ethereum").get(url, headers=headers, params=params)
             response.raise_for_status()
             
             data = response.json()
@@ -479,7 +481,7 @@ class EthereumConnection(BaseConnection):
                 "source": "zerepy"
             }
             
-            response = requests.post(url, headers=headers, json=payload)
+            response = get_session("ethereum").post(url, headers=headers, json=payload)
             response.raise_for_status()
             
             data = response.json()
@@ -1,7 +1,6 @@
 import logging
 import os
 import time
-import requests
 from typing import Dict, Any, Optional, Union
 from dotenv import load_dotenv, set_key
 from web3 import Web3
@@ -9,6 +8,7 @@ from web3.middleware import geth_poa_middleware
 from src.constants.networks import EVM_NETWORKS
 from src.constants.abi import ERC20_ABI
 from src.connections.base_connection import BaseConnection, Action, ActionParameter
+from src.http_session import get_session
 
 logger = logging.getLogger("connections.evm_connection")
 
@@ -107,7 +107,8 @@ class EVMConnection(BaseConnection):
                     ActionParameter("amount", True, float, "Amount to transfer"),
                     ActionParameter("token_address", False, str, "Token address (optional, native token if not provided)")
                 ],
-                description="Send ETH or tokens"
+                description="Send ETH or tokens",
+                idempotent=False
             ),
             "get-address": Action(
                 name="get-address",
@@ -122,7 +123,8 @@ class EVMConnection(BaseConnection):
                     ActionParameter("amount", True, float, "Amount to swap"),
                     ActionParameter("slippage", False, float, "Max slippage percentage (default 0.5%)")
                 ],
-                description="Swap tokens using Kyberswap aggregator"
+                description="Swap tokens using Kyberswap aggregator",
+                idempotent=False
             )
         }
 
@@ -205,7 +207,7 @@ class EVMConnection(BaseConnection):
     def _get_token_address(self, ticker: str) -> Optional[str]:
         """Helper function to get token address from DEXScreener"""
         try:
-            response = requests.get(f"https://api.dexscreener.com/latest/dex/search?q={ticker}")
+            response = get_session("evm").get(f"https://api.dexscreener.com/latest/dex/search?q={ticker}")
             response.raise_for_status()
             data = response.json()
             if not data.get('pairs'):
@@ -367,7 +369,7 @@ class EVMConnection(BaseConnection):
                 "to": sender,
                 "gasInclude": "true"
             }
-            response = requests.get(url, headers=headers, params=params)
+            response = get_session("evm").get(url, headers=headers, params=params)
             response.raise_for_status()
             data = response.json()
             if data.get("code") != 0:
@@ -393,7 +395,7 @@ class EVMConnection(BaseConnection):
                 "deadline": int(time.time() + 1200),
                 "source": "zerepy"
             }
-            response = requests.post(url, headers=headers, json=payload)
+            response = get_session("evm").post(url, headers=headers, json=payload)
             response.raise_for_status()
             data = response.json()
             if data.get("code") != 0:
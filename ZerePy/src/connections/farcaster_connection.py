@@ -65,7 +65,8 @@ class FarcasterConnection(BaseConnection):
                     ActionParameter("embeds", False, List[str], "List of embeds, defaults to None"),
                     ActionParameter("channel_key", False, str, "Channel key, defaults to None"),
                 ],
-                description="Post a new cast"
+                description="Post a new cast",
+                idempotent=False
             ),
             "read-timeline": Action(
                 name="read-timeline",
@@ -87,7 +88,8 @@ class FarcasterConnection(BaseConnection):
                 parameters=[
                     ActionParameter("cast_hash", True, str, "Hash of the cast to requote")
                 ],
-                description="Requote a cast (recast)"
+                description="Requote a cast (recast)",
+                idempotent=False
             ),
             "reply-to-cast": Action(
                 name="reply-to-cast",
@@ -98,7 +100,8 @@ class FarcasterConnection(BaseConnection):
                     ActionParameter("embeds", False, List[str], "List of embeds, defaults to None"),
                     ActionParameter("channel_key", False, str, "Channel of the cast, defaults to None"),
                 ],
-                description="Reply to a cast"
+                description="Reply to a cast",
+                idempotent=False
             ),
             "get-cast-replies": Action(
                 name="get-cast-replies", # get_all_casts_in_thread
@@ -1,11 +1,13 @@
 import logging
 import os
-from typing import Dict, Any
+from typing import Any, Dict, Iterator, List, Optional
 
-import requests
 from dotenv import load_dotenv, set_key
 from openai import OpenAI
 from src.connections.base_connection import BaseConnection, Action, ActionParameter
+from src.http_session import get_session
+from src.helpers.streaming import iter_chat_deltas, stream_until
+from src.usage import CallUsage
 
 logger = logging.getLogger("connections.galadriel_connection")
 
@@ -54,10 +56,23 @@ class GaladrielConnection(BaseConnection):
                 parameters=[
                     ActionParameter("prompt", True, str, "The input prompt for text generation"),
                     ActionParameter("system_prompt", True, str, "System prompt to guide the model"),
-                    ActionParameter("model", False, str, "Model to use for generation")
+                    ActionParameter("model", False, str, "Model to use for generation"),
+                    ActionParameter("temperature", False, float, "Sampling temperature, the connection's default when unset"),
                 ],
                 description="Generate text using Galadriel models"
             ),
+            "generate-text-stream": Action(
+                name="generate-text-stream",
+                parameters=[
+                    ActionParameter("prompt", True, str, "The input prompt for text generation"),
+                    ActionParameter("system_prompt", True, str, "System prompt to guide the model"),
+                    ActionParameter("stop", False, list, "Stop sequences"),
+                    ActionParameter("response_format", False, dict, "Response format to use"),
+                    ActionParameter("model", False, str, "Model to use for generation"),
+                    ActionParameter("temperature", False, float, "Sampling temperature, the connection's default when unset"),
+                ],
+                description="Stream generated text from Galadriel models as it is produced"
+            ),
         }
 
     def _get_client(self) -> OpenAI:
@@ -127,7 +142,7 @@ class GaladrielConnection(BaseConnection):
             return False
 
     def _is_api_key_valid(self, api_key):
-        response = requests.get(
+        response = get_session("galadriel").get(
             f"{API_BASE_URL}/chat/completions",
             headers={
                 "Authorization": f"Bearer {api_key}"
@@ -136,8 +151,15 @@ class GaladrielConnection(BaseConnection):
         )
         return response.status_code != 401
 
-    def generate_text(self, prompt: str, system_prompt: str, model: str = None, **kwargs) -> str:
+    def generate_text(self, prompt: str, system_prompt: str, model: str = None,
+                      temperature: Optional[float] = None, **kwargs) -> str:
         """Generate text using Galadriel models"""
+        return "".join(self.generate_text_stream(prompt, system_prompt, model=model, temperature=temperature))
+
+    def generate_text_stream(self, prompt: str, system_prompt: str, stop: Optional[List[str]] = None,
+                             response_format: Any = None, model: str = None,
+                             temperature: Optional[float] = None, **kwargs) -> Iterator[str]:
+        """Stream generated text from Galadriel models, stops early at any stop sequence"""
         try:
             client = self._get_client()
 
@@ -145,15 +167,17 @@ class GaladrielConnection(BaseConnection):
             if not model:
                 model = self.config["model"]
 
-            completion = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt},
-                ],
-            )
-
-            return completion.choices[0].message.content
+            with CallUsage("galadriel", model, system_prompt, prompt) as usage:
+                completion = client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt},
+                    ],
+                    stream=True,
+                    **self.sampling_options(temperature),
+                )
+                yield from usage.track(stream_until(iter_chat_deltas(completion, usage.report_openai), stop))
 
         except Exception as e:
             raise GaladrielAPIError(f"Text generation failed: {e}")
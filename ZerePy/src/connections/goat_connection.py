@@ -244,10 +244,12 @@ class GoatConnection(BaseConnection):
                 tool.parameters
             )
 
+            # Tools can sign and send transactions, they are not retried after a timeout
             self.actions[tool.name] = Action(  # type: ignore
                 name=tool.name,
                 description=tool.description,
                 parameters=action_parameters,
+                idempotent=False,
             )
             self._action_registry[tool.name] = tool
 
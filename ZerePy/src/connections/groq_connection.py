@@ -1,9 +1,11 @@
 import logging
 import os
-from typing import Dict, Any
+from typing import Any, Dict, Iterator, List, Optional
 from dotenv import load_dotenv, set_key
 from openai import OpenAI
 from src.connections.base_connection import BaseConnection, Action, ActionParameter
+from src.helpers.streaming import iter_chat_deltas, stream_until
+from src.usage import CallUsage
 
 logger = logging.getLogger("connections.groq_connection")
 
@@ -20,6 +22,9 @@ class GroqAPIError(GroqConnectionError):
     pass
 
 class GroqConnection(BaseConnection):
+    # Groq's own default when a request leaves the temperature out
+    default_temperature = 1.0
+
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
         self._client = None
@@ -54,6 +59,18 @@ class GroqConnection(BaseConnection):
                 ],
                 description="Generate text using Groq models"
             ),
+            "generate-text-stream": Action(
+                name="generate-text-stream",
+                parameters=[
+                    ActionParameter("prompt", True, str, "The input prompt for text generation"),
+                    ActionParameter("system_prompt", True, str, "System prompt to guide the model"),
+                    ActionParameter("stop", False, list, "Stop sequences"),
+                    ActionParameter("response_format", False, dict, "Response format to use"),
+                    ActionParameter("model", False, str, "Model to use for generation"),
+                    ActionParameter("temperature", False, float, "Sampling temperature, the connection's default when unset"),
+                ],
+                description="Stream generated text from Groq models as it is produced"
+            ),
             "check-model": Action(
                 name="check-model",
                 parameters=[
@@ -137,26 +154,34 @@ class GroqConnection(BaseConnection):
                 logger.debug(f"Configuration check failed: {e}")
             return False
 
-    def generate_text(self, prompt: str, system_prompt: str, model: str = None, **kwargs) -> str:
+    def generate_text(self, prompt: str, system_prompt: str, model: str = None,
+                      temperature: Optional[float] = None, **kwargs) -> str:
         """Generate text using Groq models"""
+        return "".join(self.generate_text_stream(prompt, system_prompt, model=model, temperature=temperature))
+
+    def generate_text_stream(self, prompt: str, system_prompt: str, stop: Optional[List[str]] = None,
+                             response_format: Any = None, model: str = None,
+                             temperature: Optional[float] = None, **kwargs) -> Iterator[str]:
+        """Stream generated text from Groq models, stops early at any stop sequence"""
         try:
             client = self._get_client()
-            
+
             # Use configured model if none provided
             if not model:
                 model = self.config["model"]
 
-            completion = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt},
-                ],
-                
-            )
+            with CallUsage("groq", model, system_prompt, prompt) as usage:
+                completion = client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt},
+                    ],
+                    stream=True,
+                    **self.sampling_options(temperature),
+                )
+                yield from usage.track(stream_until(iter_chat_deltas(completion, usage.report_openai), stop))
 
-            return completion.choices[0].message.content
-            
         except Exception as e:
             raise GroqAPIError(f"Text generation failed: {e}")
 
@@ -1,9 +1,11 @@
 import logging
 import os
-from typing import Dict, Any
+from typing import Any, Dict, Iterator, List, Optional
 from dotenv import load_dotenv, set_key
 from openai import OpenAI
 from src.connections.base_connection import BaseConnection, Action, ActionParameter
+from src.helpers.streaming import iter_chat_deltas, stream_until
+from src.usage import CallUsage
 
 logger = logging.getLogger("connections.hyperbolic_connection")
 
@@ -55,6 +57,18 @@ class HyperbolicConnection(BaseConnection):
                 ],
                 description="Generate text using Hyperbolic models"
             ),
+            "generate-text-stream": Action(
+                name="generate-text-stream",
+                parameters=[
+                    ActionParameter("prompt", True, str, "The input prompt for text generation"),
+                    ActionParameter("system_prompt", True, str, "System prompt to guide the model"),
+                    ActionParameter("stop", False, list, "Stop sequences"),
+                    ActionParameter("response_format", False, dict, "Response format to use"),
+                    ActionParameter("model", False, str, "Model to use for generation"),
+                    ActionParameter("temperature", False, float, "Sampling temperature, the connection's default when unset"),
+                ],
+                description="Stream generated text from Hyperbolic models as it is produced"
+            ),
             "check-model": Action(
                 name="check-model",
                 parameters=[
@@ -141,25 +155,34 @@ class HyperbolicConnection(BaseConnection):
                 logger.debug(f"Configuration check failed: {e}")
             return False
 
-    def generate_text(self, prompt: str, system_prompt: str, model: str = None, **kwargs) -> str:
+    def generate_text(self, prompt: str, system_prompt: str, model: str = None,
+                      temperature: Optional[float] = None, **kwargs) -> str:
         """Generate text using Hyperbolic models"""
+        return "".join(self.generate_text_stream(prompt, system_prompt, model=model, temperature=temperature))
+
+    def generate_text_stream(self, prompt: str, system_prompt: str, stop: Optional[List[str]] = None,
+                             response_format: Any = None, model: str = None,
+                             temperature: Optional[float] = None, **kwargs) -> Iterator[str]:
+        """Stream generated text from Hyperbolic models, stops early at any stop sequence"""
         try:
             client = self._get_client()
-            
+
             # Use configured model if none provided
             if not model:
                 model = self.config["model"]
 
-            completion = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt},
-                ],
-            )
+            with CallUsage("hyperbolic", model, system_prompt, prompt) as usage:
+                completion = client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt},
+                    ],
+                    stream=True,
+                    **self.sampling_options(temperature),
+                )
+                yield from usage.track(stream_until(iter_chat_deltas(completion, usage.report_openai), stop))
 
-            return completion.choices[0].message.content
-            
         except Exception as e:
             raise HyperbolicAPIError(f"Text generation failed: {e}")
 
@@ -1,8 +1,10 @@
 import logging
-import requests
 import json
-from typing import Dict, Any
+from typing import Any, Dict, Iterator, List, Optional
 from src.connections.base_connection import BaseConnection, Action, ActionParameter
+from src.http_session import SLOW_TIMEOUT, get_session
+from src.helpers.streaming import stream_until
+from src.usage import CallUsage
 
 logger = logging.getLogger("connections.ollama_connection")
 
@@ -18,6 +20,9 @@ class OllamaAPIError(OllamaConnectionError):
 
 
 class OllamaConnection(BaseConnection):
+    # Ollama's own default when a request leaves the temperature out
+    default_temperature = 0.8
+
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
         self.base_url = config.get("base_url", "http://localhost:11434")  # Default to local Ollama setup
@@ -50,9 +55,22 @@ class OllamaConnection(BaseConnection):
                     ActionParameter("prompt", True, str, "The input prompt for text generation"),
                     ActionParameter("system_prompt", True, str, "System prompt to guide the model"),
                     ActionParameter("model", False, str, "Model to use for generation"),
+                    ActionParameter("temperature", False, float, "Sampling temperature, the connection's default when unset"),
                 ],
                 description="Generate text using Ollama's running model"
             ),
+            "generate-text-stream": Action(
+                name="generate-text-stream",
+                parameters=[
+                    ActionParameter("prompt", True, str, "The input prompt for text generation"),
+                    ActionParameter("system_prompt", True, str, "System prompt to guide the model"),
+                    ActionParameter("stop", False, list, "Stop sequences"),
+                    ActionParameter("response_format", False, dict, "Response format to use"),
+                    ActionParameter("model", False, str, "Model to use for generation"),
+                    ActionParameter("temperature", False, float, "Sampling temperature, the connection's default when unset"),
+                ],
+                description="Stream generated text from Ollama's running model as it is produced"
+            ),
         }
 
     def configure(self) -> bool:
@@ -79,7 +97,7 @@ class OllamaConnection(BaseConnection):
         """Test if Ollama is reachable"""
         try:
             url = f"{self.base_url}/v1/models"
-            response = requests.get(url)
+            response = get_session("ollama").get(url)
             if response.status_code != 200:
                 raise OllamaAPIError(f"Failed to connect to Ollama: {response.status_code} - {response.text}")
         except Exception as e:
@@ -95,8 +113,15 @@ class OllamaConnection(BaseConnection):
                 logger.error(f"Ollama configuration check failed: {e}")
             return False
 
-    def generate_text(self, prompt: str, system_prompt: str, model: str = None, **kwargs) -> str:
-        """Generate text using Ollama API with streaming support"""
+    def generate_text(self, prompt: str, system_prompt: str, model: str = None,
+                      temperature: Optional[float] = None, **kwargs) -> str:
+        """Generate text using Ollama API"""
+        return "".join(self.generate_text_stream(prompt, system_prompt, model=model, temperature=temperature))
+
+    def generate_text_stream(self, prompt: str, system_prompt: str, stop: Optional[List[str]] = None,
+                             response_format: Any = None, model: str = None,
+                             temperature: Optional[float] = None, **kwargs) -> Iterator[str]:
+        """Stream generated text from the Ollama API, stops early at any stop sequence"""
         try:
             url = f"{self.base_url}/api/generate"
             payload = {
@@ -104,30 +129,39 @@ class OllamaConnection(BaseConnection):
                 "prompt": prompt,
                 "system": system_prompt,
             }
-            response = requests.post(url, json=payload, stream=True)
-
-            if response.status_code != 200:
-                raise OllamaAPIError(f"API error: {response.status_code} - {response.text}")
-
-            # Initialize an empty string to store the complete response
-            full_response = ""
-
-            # Process each line of the response as a JSON object
-            for line in response.iter_lines():
-                if line:
-                    try:
-                        # Parse the JSON object
-                        data = json.loads(line.decode("utf-8"))
-                        # Append the "response" field to the full response
-                        full_response += data.get("response", "")
-                    except json.JSONDecodeError as e:
-                        raise OllamaAPIError(f"Failed to parse JSON: {e}")
-
-            return full_response
+            temperature = self.effective_temperature(temperature)
+            if temperature is not None:
+                payload["options"] = {"temperature": temperature}
+            with CallUsage("ollama", payload["model"], system_prompt, prompt) as usage:
+                response = get_session("ollama").post(url, json=payload, stream=True, timeout=SLOW_TIMEOUT)
+                try:
+                    if response.status_code != 200:
+                        raise OllamaAPIError(f"API error: {response.status_code} - {response.text}")
+                    yield from usage.track(stream_until(self._iter_response(response, usage), stop))
+                finally:
+                    # Closing the response early makes Ollama stop generating
+                    response.close()
 
         except Exception as e:
             raise OllamaAPIError(f"Text generation failed: {e}")
 
+    @staticmethod
+    def _iter_response(response, usage: Optional[CallUsage] = None) -> Iterator[str]:
+        # Each line of the response is a JSON object holding the next piece of text, the last
+        # one also carries the token counts
+        for line in response.iter_lines():
+            if line:
+                try:
+                    data = json.loads(line.decode("utf-8"))
+                except json.JSONDecodeError as e:
+                    raise OllamaAPIError(f"Failed to parse JSON: {e}")
+                if data.get("response"):
+                    yield data["response"]
+                if data.get("done"):
+                    if usage is not None:
+                        usage.report(data.get("prompt_eval_count"), data.get("eval_count"))
+                    return
+
     def perform_action(self, action_name: str, kwargs) -> Any:
         if action_name not in self.actions:
             raise KeyError(f"Unknown action: {action_name}")
@@ -1,9 +1,11 @@
 import logging
 import os
-from typing import Dict, Any
+from typing import Any, Dict, Iterator, List, Optional
 from dotenv import load_dotenv, set_key
 from openai import OpenAI
 from src.connections.base_connection import BaseConnection, Action, ActionParameter
+from src.helpers.streaming import iter_chat_deltas, stream_until
+from src.usage import CallUsage
 
 logger = logging.getLogger("connections.openai_connection")
 
@@ -24,6 +26,9 @@ class OpenAIAPIError(OpenAIConnectionError):
 
 
 class OpenAIConnection(BaseConnection):
+    # OpenAI's own default when a request leaves the temperature out
+    default_temperature = 1.0
+
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
         self._client = None
@@ -64,9 +69,22 @@ class OpenAIConnection(BaseConnection):
                                     "Response format to use"),
                     ActionParameter("model", False, str,
                                     "Model to use for generation"),
+                    ActionParameter("temperature", False, float, "Sampling temperature, the connection's default when unset"),
                 ],
                 description="Generate text using OpenAI models"
             ),
+            "generate-text-stream": Action(
+                name="generate-text-stream",
+                parameters=[
+                    ActionParameter("prompt", True, str, "The input prompt for text generation"),
+                    ActionParameter("system_prompt", True, str, "System prompt to guide the model"),
+                    ActionParameter("stop", False, list, "Stop sequences"),
+                    ActionParameter("response_format", False, dict, "Response format to use"),
+                    ActionParameter("model", False, str, "Model to use for generation"),
+                    ActionParameter("temperature", False, float, "Sampling temperature, the connection's default when unset"),
+                ],
+                description="Stream generated text from OpenAI models as it is produced"
+            ),
             "check-model": Action(
                 name="check-model",
                 parameters=[
@@ -153,39 +171,46 @@ class OpenAIConnection(BaseConnection):
             model: str = None,
             stop: list[str] = None,
             response_format: Any = None,
+            temperature: Optional[float] = None,
             **kwargs
     ) -> str:
         """Generate text using OpenAI models"""
+        return "".join(self.generate_text_stream(prompt, system_prompt, stop=stop, response_format=response_format,
+                                                 model=model, temperature=temperature))
+
+    def generate_text_stream(self, prompt: str, system_prompt: str, stop: Optional[List[str]] = None,
+                             response_format: Any = None, model: str = None,
+                             temperature: Optional[float] = None, **kwargs) -> Iterator[str]:
+        """Stream generated text from OpenAI models, stops early at any stop sequence"""
         try:
             client = self._get_client()
 
             # Use configured model if none provided
             if not model:
                 model = self.config["model"]
-            # logger.info(f"start requesting model: {model} with prompt {prompt} and system_prompt {system_prompt} and with stop {stop}")
-            if response_format:
-                logger.info(
-                    f"start requesting model: {model} with prompt {prompt} and system_prompt {system_prompt} and with stop {stop}")
-
-                completion = client.chat.completions.create(
-                    model=model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": prompt},
-                    ],
-                    response_format=response_format,
-                )
-                return completion.choices[0].message.content
-            completion = client.chat.completions.create(
-                model=model,
-                messages=[
+            request = {
+                "model": model,
+                "messages": [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": prompt},
                 ],
-                stop=stop
-            )
-
-            return completion.choices[0].message.content
+                "stream": True,
+                # Adds a final chunk carrying the token usage
+                "stream_options": {"include_usage": True},
+                **self.sampling_options(temperature),
+            }
+            if response_format:
+                logger.info(
+                    f"start requesting model: {model} with prompt {prompt} and system_prompt {system_prompt} and with stop {stop}")
+                # Structured output is never cut short by stop sequences
+                request["response_format"] = response_format
+                stop = None
+            else:
+                request["stop"] = stop
+
+            with CallUsage("openai", model, system_prompt, prompt) as usage:
+                completion = client.chat.completions.create(**request)
+                yield from usage.track(stream_until(iter_chat_deltas(completion, usage.report_openai), stop))
 
         except Exception as e:
             raise OpenAIAPIError(f"Text generation failed: {e}")
@@ -0,0 +1,372 @@
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.connections.base_connection import BaseConnection, Action, ActionParameter
+
+logger = logging.getLogger("connections.router_connection")
+
+# Error rate is only judged once a provider has this many recent outcomes
+MIN_ERROR_SAMPLES = 10
+
+
+class RouterConnectionError(Exception):
+    """Base exception for router connection errors"""
+    pass
+
+
+class RouterConfigurationError(RouterConnectionError):
+    """Raised when the router is misconfigured"""
+    pass
+
+
+class RouterAPIError(RouterConnectionError):
+    """Raised when every provider failed a request"""
+    pass
+
+
+class ProviderStats:
+    """Rolling latency and error statistics of one provider.
+
+    A provider is put in cooldown after `failure_threshold` consecutive failures or when
+    its recent error rate exceeds `max_error_rate`. Its outcomes are then forgotten so it
+    is judged afresh once the cooldown is over.
+    """
+
+    def __init__(self, window: int, failure_threshold: int, max_error_rate: float, cooldown: float):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.failure_threshold = failure_threshold
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.hedged_wins = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, success: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            self.outcomes.append(success)
+            if success:
+                self.latencies.append(latency)
+                self.consecutive_failures = 0
+                return
+            self.consecutive_failures += 1
+            error_rate = 1 - sum(self.outcomes) / len(self.outcomes)
+            if (self.consecutive_failures >= self.failure_threshold
+                    or (len(self.outcomes) >= MIN_ERROR_SAMPLES and error_rate > self.max_error_rate)):
+                self.cooldown_until = time.monotonic() + self.cooldown
+                self.consecutive_failures = 0
+                self.outcomes.clear()
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self.latencies)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, math.ceil(q / 100 * len(samples)) - 1))
+        return samples[index]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self.outcomes:
+                return 0.0
+            return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def in_cooldown(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            "requests": self.requests,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "error_rate": round(self.error_rate(), 3),
+            "cooling_down": self.in_cooldown(),
+            "hedged_wins": self.hedged_wins,
+        }
+
+
+class RouterConnection(BaseConnection):
+    """LLM provider that spreads generate-text over several other LLM connections.
+
+    Each call goes to the healthy provider with the lowest rolling median latency and
+    fails over to the next one on error. With hedging enabled a backup request is sent
+    to the runner-up once the primary has been running longer than its own p95
+    latency, and the first answer wins. Provider SDK calls are blocking, so the losing
+    request is cancelled only if it has not started yet; otherwise its answer is dropped.
+    """
+
+    # Built by the ConnectionManager with a reference to itself, never shared between agents
+    needs_connection_manager = True
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.connection_manager = None
+        self.stats = {
+            name: ProviderStats(self.config["window"], self.config["failure_threshold"],
+                                self.config["max_error_rate"], self.config["cooldown"])
+            for name in self.config["providers"]
+        }
+        self._executor = ThreadPoolExecutor(max_workers=2 * len(self.config["providers"]),
+                                            thread_name_prefix="llm-router")
+
+    @property
+    def is_llm_provider(self) -> bool:
+        return True
+
+    def bind_connection_manager(self, connection_manager) -> None:
+        self.connection_manager = connection_manager
+
+    def validate_config(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate router configuration from JSON"""
+        providers = config.get("providers")
+        if not providers or not isinstance(providers, list):
+            raise ValueError("providers must be a non-empty list of LLM connection names")
+        if "router" in providers:
+            raise ValueError("router cannot route to itself")
+        config.setdefault("hedge", True)
+        config.setdefault("hedge_percentile", 95)
+        config.setdefault("min_hedge_delay", 0.05)
+        config.setdefault("window", 100)
+        config.setdefault("max_error_rate", 0.5)
+        config.setdefault("failure_threshold", 3)
+        config.setdefault("cooldown", 30)
+        return config
+
+    def register_actions(self) -> None:
+        """Register available router actions"""
+        self.actions = {
+            "generate-text": Action(
+                name="generate-text",
+                parameters=[
+                    ActionParameter("prompt", True, str, "The input prompt for text generation"),
+                    ActionParameter("system_prompt", True, str, "System prompt to guide the model"),
+                    ActionParameter("stop", False, list, "Stop sequences"),
+                    ActionParameter("response_format", False, dict, "Response format to use"),
+                    ActionParameter("temperature", False, float, "Sampling temperature, each provider's default when unset"),
+                ],
+                description="Generate text on the fastest healthy provider"
+            ),
+            "generate-text-stream": Action(
+                name="generate-text-stream",
+                parameters=[
+                    ActionParameter("prompt", True, str, "The input prompt for text generation"),
+                    ActionParameter("system_prompt", True, str, "System prompt to guide the model"),
+                    ActionParameter("stop", False, list, "Stop sequences"),
+                    ActionParameter("response_format", False, dict, "Response format to use"),
+                    ActionParameter("temperature", False, float, "Sampling temperature, each provider's default when unset"),
+                ],
+                description="Stream generated text from the fastest healthy provider"
+            ),
+            "provider-stats": Action(
+                name="provider-stats",
+                parameters=[],
+                description="Show rolling latency and error rate of every routed provider"
+            ),
+        }
+
+    def configure(self) -> bool:
+        """The router has no credentials of its own"""
+        logger.info("\n🔀 The router uses the providers listed in its config: "
+                    f"{', '.join(self.config['providers'])}")
+        logger.info("Configure those connections to use the router.")
+        return self.is_configured(verbose=True)
+
+    def is_configured(self, verbose=False) -> bool:
+        """Configured when at least one of the routed providers is"""
+        if self.connection_manager is None:
+            return False
+        configured = self._configured_providers()
+        if verbose and not configured:
+            logger.debug("None of the routed providers is configured")
+        return bool(configured)
+
+    def effective_temperature(self, temperature: Optional[float] = None) -> Optional[float]:
+        """The highest temperature any routed provider could run the call at, None if one is unknown"""
+        temperature = super().effective_temperature(temperature)
+        if temperature is not None or self.connection_manager is None:
+            return temperature
+        temperatures = []
+        for name in self.config["providers"]:
+            connection = self.connection_manager.connections.get(name)
+            if connection is None:
+                return None
+            temperatures.append(connection.effective_temperature())
+        if None in temperatures:
+            return None
+        return max(temperatures)
+
+    def _configured_providers(self) -> List[str]:
+        providers = []
+        for name in self.config["providers"]:
+            try:
+                if self.connection_manager.is_connection_configured(name):
+                    providers.append(name)
+            except KeyError:
+                continue
+        return providers
+
+    def _ranked_providers(self) -> List[str]:
+        """Healthy providers fastest first, then the unhealthy ones as a last resort"""
+        def score(name: str):
+            stats = self.stats[name]
+            # Providers without samples rank first so they get measured
+            return (stats.in_cooldown(), stats.percentile(50) or 0.0)
+
+        return sorted(self._configured_providers(), key=score)
+
+    def _action_for(self, name: str, arguments: Dict[str, Any], streaming: bool = True):
+        """The provider connection, the action to call on it and the arguments it accepts.
+        Streaming actions are preferred as they apply stop sequences on every provider."""
+        connection = self.connection_manager.connections[name]
+        action_name = "generate-text-stream" if streaming and "generate-text-stream" in connection.actions \
+            else "generate-text"
+        accepted = {param.name for param in connection.actions[action_name].parameters}
+        kwargs = {key: value for key, value in arguments.items() if key in accepted and value is not None}
+        return connection, action_name, kwargs
+
+    def _call(self, name: str, arguments: Dict[str, Any]) -> str:
+        connection, action_name, kwargs = self._action_for(name, arguments)
+        started = time.monotonic()
+        try:
+            result = connection.perform_action(action_name, kwargs)
+            if action_name == "generate-text-stream":
+                result = "".join(result)
+            if not isinstance(result, str):
+                raise RouterAPIError(f"{name} returned no text")
+        except Exception as e:
+            self.stats[name].record(time.monotonic() - started, False)
+            self.connection_manager.health.record_failure(name, e)
+            raise
+        self.stats[name].record(time.monotonic() - started, True)
+        return result
+
+    def _hedge_delay(self, name: str) -> Optional[float]:
+        p = self.stats[name].percentile(self.config["hedge_percentile"])
+        if p is None:
+            return None
+        return max(self.config["min_hedge_delay"], p)
+
+    def _hedged_call(self, primary: str, backup: str, arguments: Dict[str, Any]) -> str:
+        # Each attempt runs in the caller's context so its token usage is attributed to the caller
+        futures = {self._executor.submit(contextvars.copy_context().run, self._call, primary, arguments): primary}
+        done, _ = wait(futures, timeout=self._hedge_delay(primary))
+        if not done:
+            logger.debug(f"{primary} slower than its p{self.config['hedge_percentile']}, hedging on {backup}")
+            futures[self._executor.submit(contextvars.copy_context().run, self._call, backup, arguments)] = backup
+
+        errors = []
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors.append(f"{futures[future]}: {e}")
+                    continue
+                for loser in pending:
+                    loser.cancel()
+                if futures[future] == backup:
+                    self.stats[backup].hedged_wins += 1
+                return result
+        raise RouterAPIError("; ".join(errors))
+
+    def generate_text(self, prompt: str, system_prompt: str, stop: Optional[List[str]] = None,
+                      response_format: Any = None, temperature: Optional[float] = None, **kwargs) -> str:
+        """Generate text on the fastest healthy provider, failing over on errors"""
+        if self.connection_manager is None:
+            raise RouterConfigurationError("Router is not bound to a connection manager")
+        arguments = {"prompt": prompt, "system_prompt": system_prompt, "stop": stop,
+                     "response_format": response_format, "temperature": temperature}
+        ranked = self._ranked_providers()
+        if not ranked:
+            raise RouterConfigurationError("No configured provider to route to")
+
+        errors = []
+        index = 0
+        while index < len(ranked):
+            primary = ranked[index]
+            backup = ranked[index + 1] if index + 1 < len(ranked) else None
+            try:
+                if self.config["hedge"] and backup is not None and self._hedge_delay(primary) is not None:
+                    # A failed hedged pair consumed both providers
+                    index += 2
+                    return self._hedged_call(primary, backup, arguments)
+                index += 1
+                return self._call(primary, arguments)
+            except Exception as e:
+                logger.warning(f"Provider {primary} failed, failing over: {e}")
+                errors.append(str(e))
+        raise RouterAPIError(f"All providers failed: {'; '.join(errors)}")
+
+    def generate_text_stream(self, prompt: str, system_prompt: str, stop: Optional[List[str]] = None,
+                             response_format: Any = None, temperature: Optional[float] = None,
+                             **kwargs) -> Iterator[str]:
+        """Stream from the fastest healthy provider. Fails over until the first delta has been
+        produced; requests are not hedged since two streams cannot be merged."""
+        if self.connection_manager is None:
+            raise RouterConfigurationError("Router is not bound to a connection manager")
+        arguments = {"prompt": prompt, "system_prompt": system_prompt, "stop": stop,
+                     "response_format": response_format, "temperature": temperature}
+        ranked = self._ranked_providers()
+        if not ranked:
+            raise RouterConfigurationError("No configured provider to route to")
+
+        errors = []
+        for name in ranked:
+            connection, action_name, kwargs = self._action_for(name, arguments)
+            started = time.monotonic()
+            try:
+                result = connection.perform_action(action_name, kwargs)
+                deltas = iter([result] if isinstance(result, str) else result)
+                first = next(deltas, "")
+            except Exception as e:
+                self.stats[name].record(time.monotonic() - started, False)
+                self.connection_manager.health.record_failure(name, e)
+                logger.warning(f"Provider {name} failed, failing over: {e}")
+                errors.append(str(e))
+                continue
+
+            failed = False
+            try:
+                if first:
+                    yield first
+                yield from deltas
+            except GeneratorExit:
+                raise
+            except Exception as e:
+                failed = True
+                self.connection_manager.health.record_failure(name, e)
+                raise
+            finally:
+                self.stats[name].record(time.monotonic() - started, not failed)
+            return
+        raise RouterAPIError(f"All providers failed: {'; '.join(errors)}")
+
+    def provider_stats(self, **kwargs) -> Dict[str, Dict[str, Any]]:
+        """Rolling statistics of every routed provider"""
+        stats = {name: provider.snapshot() for name, provider in self.stats.items()}
+        for name, snapshot in stats.items():
+            logger.info(f"{name}: p50={snapshot['p50_ms']}ms p95={snapshot['p95_ms']}ms "
+                        f"errors={snapshot['error_rate']:.0%} requests={snapshot['requests']}")
+        return stats
+
+    def perform_action(self, action_name: str, kwargs) -> Any:
+        """Execute a router action"""
+        if action_name not in self.actions:
+            raise KeyError(f"Unknown action: {action_name}")
+
+        # No validate_params here: prompt_llm passes None for unset stop/response_format
+        method_name = action_name.replace('-', '_')
+        method = getattr(self, method_name)
+        return method(**kwargs)
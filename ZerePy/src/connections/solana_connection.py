@@ -126,6 +126,7 @@ class SolanaConnection(BaseConnection):
                     ),
                 ],
                 description="Transfer SOL or SPL tokens",
+                idempotent=False,
             ),
             "trade": Action(
                 name="trade",
@@ -142,6 +143,7 @@ class SolanaConnection(BaseConnection):
                     ),
                 ],
                 description="Swap tokens using Jupiter",
+                idempotent=False,
             ),
             "get-balance": Action(
                 name="get-balance",
@@ -161,16 +163,19 @@ class SolanaConnection(BaseConnection):
                     ActionParameter("amount", True, float, "Amount of SOL to stake")
                 ],
                 description="Stake SOL",
+                idempotent=False,
             ),
             "lend-assets": Action(
                 name="lend-assets",
                 parameters=[ActionParameter("amount", True, float, "Amount to lend")],
                 description="Lend assets",
+                idempotent=False,
             ),
             "request-faucet": Action(
                 name="request-faucet",
                 parameters=[],
                 description="Request funds from faucet for testing",
+                idempotent=False,
             ),
             "deploy-token": Action(
                 name="deploy-token",
@@ -180,6 +185,7 @@ class SolanaConnection(BaseConnection):
                     )
                 ],
                 description="Deploy a new token",
+                idempotent=False,
             ),
             "fetch-price": Action(
                 name="fetch-price",
@@ -215,6 +221,7 @@ class SolanaConnection(BaseConnection):
                     ActionParameter("options", False, dict, "Additional token options"),
                 ],
                 description="Launch a Pump & Fun token",
+                idempotent=False,
             ),
         }
 
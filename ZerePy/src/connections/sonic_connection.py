@@ -1,6 +1,5 @@
 import logging
 import os
-import requests
 import time
 from typing import Dict, Any, Optional
 from dotenv import load_dotenv, set_key
@@ -8,6 +7,7 @@ from web3 import Web3
 from web3.middleware import geth_poa_middleware
 from src.constants.abi import ERC20_ABI
 from src.connections.base_connection import BaseConnection, Action, ActionParameter
+from src.http_session import get_session
 from src.constants.networks import SONIC_NETWORKS
 
 logger = logging.getLogger("connections.sonic_connection")
@@ -78,7 +78,7 @@ class SonicConnection(BaseConnection):
             if ticker.lower() in ["s", "S"]:
                 return "0xEeeeeEeeeEeEeeEeEeEeeEEEeeeeEeeeeeeeEEeE"
                 
-            response = requests.get(
+            response = get_session("sonic").get(
                 f"https://api.dexscreener.com/latest/dex/search?q={ticker}"
             )
             response.raise_for_status()
@@ -130,7 +130,8 @@ class SonicConnection(BaseConnection):
                     ActionParameter("amount", True, float, "Amount to transfer"),
                     ActionParameter("token_address", False, str, "Optional token address")
                 ],
-                description="Send $S or tokens"
+                description="Send $S or tokens",
+                idempotent=False
             ),
             "swap": Action(
                 name="swap",
@@ -140,7 +141,8 @@ class SonicConnection(BaseConnection):
                     ActionParameter("amount", True, float, "Amount to swap"),
                     ActionParameter("slippage", False, float, "Max slippage percentage")
                 ],
-                description="Swap tokens"
+                description="Swap tokens",
+                idempotent=False
             )
         }
 
@@ -289,7 +291,7 @@ class SonicConnection(BaseConnection):
                 "gasInclude": "true"
             }
             
-            response = requests.get(url, headers=headers, params=params)
+            response = get_session("sonic").get(url, headers=headers, params=params)
             response.raise_for_status()
             
             data = response.json()
@@ -320,7 +322,7 @@ class SonicConnection(BaseConnection):
                 "source": "ZerePyBot"
             }
             
-            response = requests.post(url, headers=headers, json=payload)
+            response = get_session("sonic").post(url, headers=headers, json=payload)
             response.raise_for_status()
             
             data = response.json()
@@ -1,5 +1,7 @@
 import logging
-from typing import Any, Dict, List
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Tuple
 from src.connections.base_connection import BaseConnection, Action, ActionParameter
 import os
 from dotenv import load_dotenv, set_key
@@ -8,6 +10,12 @@ from supabase import create_client, Client
 
 logger = logging.getLogger("connections.supabase_connection")
 
+DEFAULT_SUBSCRIBER_TTL = 300
+# Non-subscribers are kept briefly, so a new subscription is noticed on the next page
+DEFAULT_NON_SUBSCRIBER_TTL = 15
+# Account ids per "in" filter, keeps the PostgREST query string short
+SUBSCRIBER_BATCH_SIZE = 100
+
 
 class SupabaseConnectionError(Exception):
     """Base exception for Supabase connection errors"""
@@ -29,6 +37,14 @@ class SupabaseConnection(BaseConnection):
         logger.info("Initializing Supabase connection...")
         super().__init__(config)
         self._client = None
+        # account_id -> (subscribed, checked at), see check_subscribed_users()
+        self.subscriber_ttl = config.get("subscriber_ttl", DEFAULT_SUBSCRIBER_TTL)
+        self.non_subscriber_ttl = config.get("non_subscriber_ttl", DEFAULT_NON_SUBSCRIBER_TTL)
+        self.subscriber_refresh_interval = config.get("subscriber_refresh_interval", self.subscriber_ttl / 5)
+        self._subscribers: Dict[str, Tuple[bool, float]] = {}
+        self._subscribers_lock = threading.Lock()
+        self._refresher = None
+        self._stop_refresher = threading.Event()
 
     @property
     def is_llm_provider(self):
@@ -148,6 +164,14 @@ class SupabaseConnection(BaseConnection):
                                     "User id to check if subscribed"),
                 ],
                 description="Returns True if user is subscribed"
+            ),
+            "check-subscribed-users": Action(
+                name="check-subscribed-users",
+                parameters=[
+                    ActionParameter("user_ids", True, list,
+                                    "User ids to check, e.g. the authors of a page of mentions"),
+                ],
+                description="Returns the user ids that are subscribed"
             )
         }
 
@@ -219,16 +243,84 @@ class SupabaseConnection(BaseConnection):
             raise SupabaseAPIError(f"Query failed: {e}")
 
     def check_subscribed_user(self, user_id: str) -> bool:
-        """Get user mentions"""
-        try:
-            client = self._get_client()
+        """Check whether a user is subscribed"""
+        return str(user_id) in self.check_subscribed_users([user_id])
 
-            response = client.table('x_users') \
-                .select('account_id') \
-                .eq('account_id', user_id) \
-                .eq('is_active', True) \
-                .execute()
+    def check_subscribed_users(self, user_ids: List[str]) -> List[str]:
+        """The subscribed ones among user_ids.
 
-            return len(response.data) > 0
+        Subscribers are cached for subscriber_ttl seconds, non-subscribers only for
+        non_subscriber_ttl. Ids that are not cached are resolved
+        with one "in" query per SUBSCRIBER_BATCH_SIZE ids. A background thread re-polls the
+        cached subscribers before they expire, so cancelled subscriptions show up without a
+        query per check.
+        """
+        user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids if user_id))
+        now = time.monotonic()
+        with self._subscribers_lock:
+            cached = {user_id: self._subscribers.get(user_id) for user_id in user_ids}
+        missing = [user_id for user_id, entry in cached.items()
+                   if entry is None or now - entry[1] >= self._ttl(entry[0])]
+        if missing:
+            self._fetch_subscribers(missing)
+        # Also revives a refresher stopped by close(), pooled connections outlive one agent
+        self._start_refresher()
+        with self._subscribers_lock:
+            return [user_id for user_id in user_ids if self._subscribers.get(user_id, (False, 0))[0]]
+
+    def _ttl(self, subscribed: bool) -> float:
+        return self.subscriber_ttl if subscribed else self.non_subscriber_ttl
+
+    def _fetch_subscribers(self, user_ids: Iterable[str]) -> None:
+        user_ids = list(user_ids)
+        try:
+            client = self._get_client()
+            for start in range(0, len(user_ids), SUBSCRIBER_BATCH_SIZE):
+                batch = user_ids[start:start + SUBSCRIBER_BATCH_SIZE]
+                response = client.table('x_users') \
+                    .select('account_id') \
+                    .in_('account_id', batch) \
+                    .eq('is_active', True) \
+                    .execute()
+                subscribed = {str(row['account_id']) for row in response.data}
+                checked_at = time.monotonic()
+                with self._subscribers_lock:
+                    for user_id in batch:
+                        self._subscribers[user_id] = (user_id in subscribed, checked_at)
         except Exception as e:
             raise SupabaseAPIError(f"Query failed: {e}")
+
+    def _start_refresher(self) -> None:
+        """Start a daemon thread that re-checks cached subscribers before they expire"""
+        if not self.subscriber_refresh_interval or self._refresher is not None:
+            return
+        with self._subscribers_lock:
+            if self._refresher is not None:
+                return
+            # Each thread has its own stop event, so a stopped one cannot be revived by a restart
+            stop = self._stop_refresher = threading.Event()
+
+            def refresh_loop():
+                while not stop.wait(self.subscriber_refresh_interval):
+                    now = time.monotonic()
+                    with self._subscribers_lock:
+                        # Expired non-subscribers are dropped, they are looked up again if they come back
+                        for user_id, (subscribed, checked_at) in list(self._subscribers.items()):
+                            if not subscribed and now - checked_at >= self.non_subscriber_ttl:
+                                del self._subscribers[user_id]
+                        due = [user_id for user_id, (subscribed, checked_at) in self._subscribers.items()
+                               if subscribed and now - checked_at >= self.subscriber_ttl - self.subscriber_refresh_interval]
+                    if due:
+                        try:
+                            self._fetch_subscribers(due)
+                        except SupabaseAPIError as e:
+                            logger.debug(f"Background subscriber refresh failed: {e}")
+
+            self._refresher = threading.Thread(target=refresh_loop, name="supabase-subscribers", daemon=True)
+            self._refresher.start()
+
+    def close(self) -> None:
+        """Stop the subscriber refresher, the next check starts it again"""
+        with self._subscribers_lock:
+            self._stop_refresher.set()
+            self._refresher = None
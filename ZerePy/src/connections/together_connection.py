@@ -1,11 +1,13 @@
 import logging
 import os
-from typing import Dict, Any
+from typing import Any, Dict, Iterator, List, Optional
 from dotenv import load_dotenv, set_key
 from together import Together
 from together.types.models import ModelObject, ModelType
 
 from src.connections.base_connection import BaseConnection, Action, ActionParameter
+from src.helpers.streaming import iter_chat_deltas, stream_until
+from src.usage import CallUsage
 
 logger = logging.getLogger("connections.together_ai_connection")
 
@@ -51,10 +53,23 @@ class TogetherAIConnection(BaseConnection):
                 parameters=[
                     ActionParameter("prompt", True, str, "The input prompt for text generation"),
                     ActionParameter("system_prompt", True, str, "System prompt to guide the model"),
-                    ActionParameter("model", False, str, "Model to use for generation")
+                    ActionParameter("model", False, str, "Model to use for generation"),
+                    ActionParameter("temperature", False, float, "Sampling temperature, the connection's default when unset"),
                 ],
                 description="Generate text using Together AI models"
             ),
+            "generate-text-stream": Action(
+                name="generate-text-stream",
+                parameters=[
+                    ActionParameter("prompt", True, str, "The input prompt for text generation"),
+                    ActionParameter("system_prompt", True, str, "System prompt to guide the model"),
+                    ActionParameter("stop", False, list, "Stop sequences"),
+                    ActionParameter("response_format", False, dict, "Response format to use"),
+                    ActionParameter("model", False, str, "Model to use for generation"),
+                    ActionParameter("temperature", False, float, "Sampling temperature, the connection's default when unset"),
+                ],
+                description="Stream generated text from Together AI models as it is produced"
+            ),
             "check-model": Action(
                 name="check-model",
                 parameters=[
@@ -130,24 +145,31 @@ class TogetherAIConnection(BaseConnection):
                 logger.debug(f"Configuration check failed: {e}")
             return False
 
-    def generate_text(self, prompt: str, system_prompt: str, model: str = None, **kwargs) -> str:
+    def generate_text(self, prompt: str, system_prompt: str, model: str = None,
+                      temperature: Optional[float] = None, **kwargs) -> str:
         """Generate text using Together AI models"""
+        return "".join(self.generate_text_stream(prompt, system_prompt, model=model, temperature=temperature))
+
+    def generate_text_stream(self, prompt: str, system_prompt: str, stop: Optional[List[str]] = None,
+                             response_format: Any = None, model: str = None,
+                             temperature: Optional[float] = None, **kwargs) -> Iterator[str]:
+        """Stream generated text from Together AI models, stops early at any stop sequence"""
         try:
             client = self._get_client()
-            
+
             # Use configured model if none provided
             if not model:
                 model = self.config["model"]
 
-            messages = [{"role": "user", "content": prompt},{"role": "system", "content": system_prompt},] 
+            with CallUsage("together", model, system_prompt, prompt) as usage:
+                completion = client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt},{"role": "system", "content": system_prompt},],
+                    stream=True,
+                    **self.sampling_options(temperature),
+                )
+                yield from usage.track(stream_until(iter_chat_deltas(completion, usage.report_openai), stop))
 
-            completion = client.chat.completions.create(
-                model=model,
-                messages=messages,
-            )
-
-            return completion.choices[0].message.content
-            
         except Exception as e:
             raise TogetherAIAPIError(f"Text generation failed: {e}")
 
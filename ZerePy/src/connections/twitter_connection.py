@@ -1,17 +1,22 @@
 import os
 import logging
-from typing import Dict, Any, List, Tuple, Iterator
+from typing import Dict, Any, List, Optional, Tuple, Iterator
 from requests_oauthlib import OAuth1Session
 from dotenv import set_key, load_dotenv
 from src.connections.base_connection import BaseConnection, Action, ActionParameter
+from src.http_session import get_session, pooled_adapter
 from src.helpers import print_h_bar
+from src.twitter_users import UNKNOWN_USER, USER_CACHE
 import json
-import requests
 import datetime
 from datetime import timedelta
 
 logger = logging.getLogger("connections.twitter_connection")
 
+# Mentions are read 100 per request (the API maximum), 8 pages cover the 800 the endpoint keeps
+MENTION_PAGE_SIZE = 100
+MENTION_PAGES = 8
+
 
 class TwitterConnectionError(Exception):
     """Base exception for Twitter connection errors"""
@@ -74,7 +79,8 @@ class TwitterConnection(BaseConnection):
                     ActionParameter("message", True, str,
                                     "Text content of the tweet")
                 ],
-                description="Post a new tweet"
+                description="Post a new tweet",
+                idempotent=False
             ),
             "read-timeline": Action(
                 name="read-timeline",
@@ -100,7 +106,8 @@ class TwitterConnection(BaseConnection):
                     ActionParameter("message", True, str,
                                     "Reply message content")
                 ],
-                description="Reply to an existing tweet"
+                description="Reply to an existing tweet",
+                idempotent=False
             ),
             "get-tweet-replies": Action(
                 name="get-tweet-replies",
@@ -120,8 +127,14 @@ class TwitterConnection(BaseConnection):
             ),
             "get-mentioned-tweets": Action(
                 name="get-mentioned-tweets",
-                parameters=[],
-                description="Get mentioned tweets for the past 20 minutes"
+                parameters=[
+                    ActionParameter("since_id", False, str,
+                                    "Only return mentions newer than this tweet ID"),
+                    ActionParameter("pagination_token", False, str,
+                                    "next_token of an earlier read, to read on from its last page")
+                ],
+                description="Get mentioned tweets newer than since_id, or for the past 20 minutes, "
+                            "and the next_token of the pages left unread"
             )
         }
 
@@ -177,7 +190,7 @@ class TwitterConnection(BaseConnection):
             full_url = f"https://api.twitter.com/2/{endpoint.lstrip('/')}"
 
             if use_bearer:
-                response = requests.request(
+                response = get_session("twitter").request(
                     method=method.lower(),
                     url=full_url,
                     auth=self._bearer_oauth,
@@ -219,6 +232,8 @@ class TwitterConnection(BaseConnection):
                     resource_owner_secret=credentials[
                         'TWITTER_ACCESS_TOKEN_SECRET'],
                 )
+                # Shares the rate limit buckets of the bearer token requests
+                self._oauth_session.mount("https://", pooled_adapter("twitter"))
                 logger.debug("OAuth session created successfully")
             except Exception as e:
                 logger.error(f"Failed to create OAuth session: {str(e)}")
@@ -440,29 +455,35 @@ class TwitterConnection(BaseConnection):
             params=params
         )
 
-        tweets = response.get("data", [])
-        user_info = response.get("includes", {}).get("users", [])
-
-        user_dict = {
-            user['id']: {
-                'name': user['name'],
-                'username': user['username']
-            }
-            for user in user_info
-        }
+        tweets = self._add_authors(response.get("data", []), response.get("includes"))
+        logger.debug(f"Retrieved {len(tweets)} tweets")
+        return tweets
 
-        for tweet in tweets:
-            author_id = tweet['author_id']
-            author_info = user_dict.get(author_id, {
-                'name': "Unknown",
-                'username': "Unknown"
+    def _lookup_users(self, user_ids: List[str]) -> List[Dict[str, Any]]:
+        """Look up to 100 users by id in one request"""
+        try:
+            response = self._make_request('get', 'users', params={
+                "ids": ",".join(user_ids),
+                "user.fields": "name,username"
             })
+        except TwitterAPIError as e:
+            logger.warning(f"User lookup failed: {e}")
+            return []
+        return response.get("data", [])
+
+    def _add_authors(self, tweets: List[dict], includes: Optional[dict] = None) -> List[dict]:
+        """Set author_name and author_username on tweets, from the user cache or one lookup
+        for the authors it does not know yet. Users expanded in the response (includes)
+        are cached first, so only authors missing from it are looked up."""
+        if includes:
+            USER_CACHE.put(includes.get("users", []))
+        users = USER_CACHE.resolve((tweet.get('author_id') for tweet in tweets), self._lookup_users)
+        for tweet in tweets:
+            author_info = users.get(tweet.get('author_id'), UNKNOWN_USER)
             tweet.update({
                 'author_name': author_info['name'],
                 'author_username': author_info['username']
             })
-
-        logger.debug(f"Retrieved {len(tweets)} tweets")
         return tweets
 
     def get_latest_tweets(self,
@@ -533,12 +554,14 @@ class TwitterConnection(BaseConnection):
         params = {
             "query": f"conversation_id:{tweet_id} is:reply",
             "tweet.fields": "author_id,created_at,text",
+            "expansions": "author_id",
+            "user.fields": "name,username",
             "max_results": min(count, 100)
         }
 
         response = self._make_request(
             'get', 'tweets/search/recent', params=params)
-        replies = response.get("data", [])
+        replies = self._add_authors(response.get("data", []), response.get("includes"))
 
         logger.info(f"Retrieved {len(replies)} replies")
         return replies
@@ -595,21 +618,40 @@ class TwitterConnection(BaseConnection):
             logger.error(f"Error streaming tweets: {str(e)}")
             raise TwitterAPIError(f"Error streaming tweets: {str(e)}")
 
-    def get_mentioned_tweets(self) -> List[Dict]:
+    def get_mentioned_tweets(self, since_id: Optional[str] = None, pagination_token: Optional[str] = None,
+                             max_pages: int = MENTION_PAGES) -> Dict[str, Any]:
+        """Get mentions newer than since_id, newest first, following next_token pagination.
+        Without since_id only the past 20 minutes are read. At most max_pages pages are
+        read, next_token is then set and reads on from the first unread page."""
         method = 'get'
         credentials = self._get_credentials()
         endpoint = f"users/{credentials['TWITTER_USER_ID']}/mentions"
-        current_time = datetime.datetime.utcnow()
-        start_time = current_time - timedelta(minutes=20)
 
         querystring = {
             "tweet.fields": "author_id,created_at,id,text",
-            "end_time": current_time.strftime("%Y-%m-%dT%H:%M:%SZ"),
-            "start_time": start_time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "expansions": "author_id",
+            "user.fields": "name,username",
+            "max_results": MENTION_PAGE_SIZE,
         }
-
-        response = self._make_request(
-            method=method, endpoint=endpoint, use_bearer=True, params=querystring)
-        tweets = response.get("data", [])
-        logger.debug(f"Retrieved {len(tweets)} tweets")
-        return tweets
+        if since_id:
+            querystring["since_id"] = since_id
+        else:
+            start_time = datetime.datetime.utcnow() - timedelta(minutes=20)
+            querystring["start_time"] = start_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+        if pagination_token:
+            querystring["pagination_token"] = pagination_token
+
+        # Every page is read here, so the requests run inside perform_action's retries and timing
+        tweets = []
+        for _ in range(max_pages):
+            response = self._make_request(
+                method=method, endpoint=endpoint, use_bearer=True, params=querystring)
+            page = self._add_authors(response.get("data", []), response.get("includes"))
+            logger.debug(f"Retrieved {len(page)} tweets")
+            tweets.extend(page)
+            next_token = response.get("meta", {}).get("next_token")
+            if not next_token:
+                return {"tweets": tweets, "next_token": None}
+            querystring["pagination_token"] = next_token
+        logger.warning(f"Stopped reading mentions after {max_pages} pages, the next read goes on from there")
+        return {"tweets": tweets, "next_token": next_token}
@@ -0,0 +1,213 @@
+import asyncio
+import json
+import logging
+import random
+import sys
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from src.background_stream import DEFAULT_QUEUE_SIZE, DEFAULT_WORKERS, BackgroundStream, BackoffPolicy
+from src.http_session import get_async_session
+from src.metrics import REGISTRY
+
+logger = logging.getLogger("discord_gateway")
+
+GATEWAY_URL = "wss://gateway.discord.gg"
+GATEWAY_QUERY = "?v=10&encoding=json"
+# Guild messages only. Discord sends the content of messages that mention the bot without
+# the privileged MESSAGE_CONTENT intent.
+GUILD_MESSAGES_INTENT = 1 << 9
+
+# Reconnect waits start at 1 second and double up to a minute
+RECONNECT_BACKOFF = (1.0, "exponential", 60.0)
+
+# Gateway opcodes
+DISPATCH = 0
+HEARTBEAT = 1
+IDENTIFY = 2
+RESUME = 6
+RECONNECT = 7
+INVALID_SESSION = 9
+HELLO = 10
+HEARTBEAT_ACK = 11
+
+# Close codes that reconnecting cannot fix: bad token, shard or intents
+FATAL_CLOSE_CODES = {4004, 4010, 4011, 4012, 4013, 4014}
+# Close codes after which the session cannot be resumed and a new one is identified
+SESSION_CLOSE_CODES = {4007, 4009}
+# Code the client closes with when it wants to resume afterwards, 1000 would end the session
+RESUMABLE_CLOSE_CODE = 4000
+
+GATEWAY_MESSAGES = REGISTRY.counter(
+    "zerepy_discord_gateway_messages_total", "Bot mentions received from the Discord Gateway and their outcome",
+    ["status"])
+GATEWAY_RECONNECTS = REGISTRY.counter(
+    "zerepy_discord_gateway_reconnects_total", "Discord Gateway reconnects by cause", ["reason"])
+GATEWAY_QUEUE_DEPTH = REGISTRY.gauge(
+    "zerepy_discord_gateway_queue_depth", "Mentions waiting for a gateway worker")
+
+
+class GatewayClosed(Exception):
+    """The gateway connection ended, reason says why"""
+
+    def __init__(self, reason: str, code: Optional[int] = None):
+        super().__init__(f"Discord Gateway connection closed ({reason}, code {code})")
+        self.reason = reason
+        self.code = code
+
+
+class DiscordGateway(BackgroundStream):
+    """Listens for MESSAGE_CREATE on the Discord Gateway and feeds the messages of the
+    connection's server that mention the bot to a pool of workers. Each worker hands a
+    mention to every subscribed handler, so agents sharing the connection all see it.
+
+    The client heartbeats at the interval from HELLO and treats a heartbeat left without
+    an ACK as a dead connection. After a disconnect it resumes the session, so events sent
+    in between are replayed, or identifies again when Discord says it cannot be resumed.
+    Mentions go into a queue of queue_size, the reader waits for room when the workers fall
+    behind. Close codes that mean bad credentials or intents stop the client for good,
+    running is then False and callers fall back to REST.
+    """
+
+    logger = logger
+    label = "Discord Gateway"
+    item_label = "Discord message"
+    thread_name = "discord-gateway"
+    items_metric = GATEWAY_MESSAGES
+    reconnects_metric = GATEWAY_RECONNECTS
+    queue_depth_metric = GATEWAY_QUEUE_DEPTH
+
+    def __init__(self, connection, workers: int = DEFAULT_WORKERS, queue_size: int = DEFAULT_QUEUE_SIZE):
+        super().__init__(self._dispatch, workers=workers, queue_size=queue_size)
+        self.connection = connection
+        # Subscriber key -> async handler, every mention goes to all of them
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], Awaitable[Any]]] = {}
+        self.server_id = str(connection.config["server_id"])
+        self.bot_user_id: Optional[str] = None
+        self.session_id: Optional[str] = None
+        self.sequence: Optional[int] = None
+        self.resume_url: Optional[str] = None
+        self._acked = True
+        self._zombie = False
+
+    def subscribe(self, key: str, handler: Callable[[Dict[str, Any]], Awaitable[Any]]) -> None:
+        """Hand every mention to handler, replacing the handler subscribed under key"""
+        self.handlers[key] = handler
+
+    def unsubscribe(self, key: str) -> None:
+        self.handlers.pop(key, None)
+
+    async def _dispatch(self, message: Dict[str, Any]) -> None:
+        handlers = list(self.handlers.values())
+        results = await asyncio.gather(*(handler(message) for handler in handlers), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise RuntimeError(f"{len(errors)} of {len(handlers)} subscribers failed, first: {errors[0]}")
+
+    def _on_disconnect(self, error: Optional[BaseException]) -> Optional[Tuple[str, BackoffPolicy]]:
+        if error is None:
+            return "closed", RECONNECT_BACKOFF
+        if isinstance(error, GatewayClosed):
+            if error.code in FATAL_CLOSE_CODES:
+                logger.error(f"{error}, falling back to REST")
+                return None
+            if error.code in SESSION_CLOSE_CODES:
+                self.session_id = self.sequence = None
+            logger.warning(str(error))
+            return error.reason, RECONNECT_BACKOFF
+        logger.warning(f"Discord Gateway disconnected: {error}")
+        return "network", RECONNECT_BACKOFF
+
+    async def _connect(self) -> None:
+        import aiohttp
+
+        url = (self.resume_url if self.session_id and self.resume_url else GATEWAY_URL) + GATEWAY_QUERY
+        heartbeat = None
+        self._zombie = False
+        async with get_async_session("discord_gateway").ws_connect(url, max_msg_size=0) as ws:
+            try:
+                async for message in ws:
+                    if message.type == aiohttp.WSMsgType.ERROR:
+                        raise ws.exception()
+                    if message.type != aiohttp.WSMsgType.TEXT:
+                        continue
+                    payload = json.loads(message.data)
+                    if payload["op"] == HELLO:
+                        interval = payload["d"]["heartbeat_interval"] / 1000
+                        heartbeat = asyncio.create_task(self._heartbeat(ws, interval))
+                        await ws.send_json(self._resume() if self.session_id else self._identify())
+                    else:
+                        await self._on_payload(ws, payload)
+            finally:
+                if heartbeat is not None:
+                    heartbeat.cancel()
+            if self._zombie:
+                raise GatewayClosed("zombie", RESUMABLE_CLOSE_CODE)
+            raise GatewayClosed("closed", ws.close_code)
+
+    async def _heartbeat(self, ws, interval: float) -> None:
+        """Heartbeat every interval seconds, return when a heartbeat was never acknowledged"""
+        # Discord asks for a random first delay so clients reconnecting together spread out
+        await asyncio.sleep(interval * random.random())
+        while True:
+            if not self._acked:
+                logger.warning("Discord Gateway heartbeat not acknowledged, reconnecting")
+                self._zombie = True
+                await ws.close(code=RESUMABLE_CLOSE_CODE)
+                return
+            self._acked = False
+            await ws.send_json({"op": HEARTBEAT, "d": self.sequence})
+            await asyncio.sleep(interval)
+
+    def _identify(self) -> Dict[str, Any]:
+        self._acked = True
+        return {"op": IDENTIFY, "d": {
+            "token": self.connection._get_token(),
+            "intents": GUILD_MESSAGES_INTENT,
+            "properties": {"os": sys.platform, "browser": "zerepy", "device": "zerepy"},
+        }}
+
+    def _resume(self) -> Dict[str, Any]:
+        self._acked = True
+        return {"op": RESUME, "d": {
+            "token": self.connection._get_token(),
+            "session_id": self.session_id,
+            "seq": self.sequence,
+        }}
+
+    async def _on_payload(self, ws, payload: Dict[str, Any]) -> None:
+        op = payload["op"]
+        if payload.get("s") is not None:
+            self.sequence = payload["s"]
+        if op == HEARTBEAT_ACK:
+            self._acked = True
+        elif op == HEARTBEAT:
+            await ws.send_json({"op": HEARTBEAT, "d": self.sequence})
+        elif op == RECONNECT:
+            await ws.close(code=RESUMABLE_CLOSE_CODE)
+            raise GatewayClosed("reconnect", RESUMABLE_CLOSE_CODE)
+        elif op == INVALID_SESSION:
+            if not payload.get("d"):
+                self.session_id = self.sequence = None
+            # Discord asks for a 1 to 5 second wait before identifying again
+            await asyncio.sleep(random.uniform(1, 5))
+            await ws.send_json(self._resume() if self.session_id else self._identify())
+        elif op == DISPATCH:
+            event, data = payload.get("t"), payload.get("d") or {}
+            if event == "READY":
+                self.session_id = data["session_id"]
+                self.resume_url = data.get("resume_gateway_url")
+                self.bot_user_id = data["user"]["id"]
+                self.connected = True
+                logger.info(f"Connected to the Discord Gateway as {data['user'].get('username')}")
+            elif event == "RESUMED":
+                self.connected = True
+                logger.info("Resumed the Discord Gateway session")
+            elif event == "MESSAGE_CREATE":
+                await self._on_message(data)
+
+    async def _on_message(self, data: Dict[str, Any]) -> None:
+        if str(data.get("guild_id")) != self.server_id or data.get("author", {}).get("id") == self.bot_user_id:
+            return
+        if not any(mention.get("id") == self.bot_user_id for mention in data.get("mentions", [])):
+            return
+        await self._enqueue(self.connection._format_messages([data])[0])
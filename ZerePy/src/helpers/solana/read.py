@@ -9,7 +9,7 @@ from src.types import JupiterTokenData
 
 from solders.keypair import Keypair  # type: ignore
 from solders.pubkey import Pubkey  # type: ignore
-import requests
+from src.http_session import get_session
 
 from spl.token.async_client import AsyncToken
 from spl.token.instructions import get_associated_token_address
@@ -58,7 +58,7 @@ class SolanaReadHelper:
         url = f"https://api.jup.ag/price/v2?ids={token_address}"
 
         try:
-            with requests.get(url) as response:
+            with get_session("solana").get(url) as response:
                 response.raise_for_status()
                 data = response.json()
                 price = data.get("data", {}).get(token_address, {}).get("price")
@@ -75,7 +75,7 @@ class SolanaReadHelper:
         ticker: str,
     ) -> str:
         try:
-            response = requests.get(
+            response = get_session("solana").get(
                 f"https://api.dexscreener.com/latest/dex/search?q={ticker}"
             )
             response.raise_for_status()
@@ -110,7 +110,7 @@ class SolanaReadHelper:
         address: str,
     ) -> str:
         try:
-            response = requests.get(
+            response = get_session("solana").get(
                 "https://tokens.jup.ag/tokens?tags=verified",
                 headers={"Content-Type": "application/json"},
             )
@@ -0,0 +1,116 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import threading
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator, List, Optional
+
+_DONE = object()
+
+
+def close_stream(stream) -> None:
+    """Close a provider stream or generator if it supports it, releasing the HTTP response"""
+    close = getattr(stream, "close", None)
+    if close is not None:
+        close()
+
+
+def iter_chat_deltas(completion, on_usage: Optional[Callable[[Any], None]] = None) -> Iterator[str]:
+    """Text deltas of an OpenAI style streamed chat completion. Token usage, sent with the
+    last chunk by providers that support it, is passed to on_usage."""
+    try:
+        for chunk in completion:
+            if on_usage is not None:
+                # Groq reports usage under x_groq
+                usage = getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None)
+                if usage is not None:
+                    on_usage(usage)
+            choices = getattr(chunk, "choices", None)
+            if not choices:
+                continue
+            delta = choices[0].delta
+            if delta is not None and delta.content:
+                yield delta.content
+    finally:
+        close_stream(completion)
+
+
+def stream_until(deltas: Iterable[str], stop: Optional[List[str]] = None) -> Iterator[str]:
+    """Pass deltas through until one of the stop sequences appears.
+
+    The stop sequence itself is not emitted and the underlying stream is closed as soon as
+    it is seen, so the provider stops generating. A stop sequence can span several deltas,
+    so up to len(longest stop) - 1 characters are held back until they can be ruled out.
+    """
+    stop = [sequence for sequence in (stop or []) if sequence]
+    if not stop:
+        yield from deltas
+        return
+    keep = max(len(sequence) for sequence in stop) - 1
+    pending = ""
+    try:
+        for delta in deltas:
+            pending += delta
+            hits = [index for index in (pending.find(sequence) for sequence in stop) if index >= 0]
+            if hits:
+                if min(hits):
+                    yield pending[:min(hits)]
+                return
+            if len(pending) > keep:
+                cut = len(pending) - keep
+                yield pending[:cut]
+                pending = pending[cut:]
+        if pending:
+            yield pending
+    finally:
+        close_stream(deltas)
+
+
+async def aiter_in_thread(factory: Callable[[], Iterable[str]], max_buffered: int = 256) -> AsyncIterator[str]:
+    """Consume a blocking iterator in a worker thread and yield its items on the event loop.
+
+    Closing the async iterator, or cancelling the task consuming it, closes the blocking
+    iterator from the worker thread at the next item it produces.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(max_buffered)
+    cancelled = threading.Event()
+
+    def put(item) -> bool:
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            try:
+                future.result(timeout=0.1)
+                return True
+            except concurrent.futures.TimeoutError:
+                if cancelled.is_set():
+                    future.cancel()
+                    return False
+
+    def produce() -> None:
+        iterator = None
+        try:
+            iterator = iter(factory())
+            for item in iterator:
+                if cancelled.is_set() or not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            if not cancelled.is_set():
+                put(e)
+        finally:
+            close_stream(iterator)
+
+    # The worker sees the caller's context variables, like asyncio.to_thread
+    producer = loop.run_in_executor(None, contextvars.copy_context().run, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        cancelled.set()
+        if not producer.done():
+            producer.add_done_callback(lambda future: future.exception())
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import os
+import threading
+import weakref
+from typing import Dict, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.rate_limit import GovernedAdapter, aiohttp_trace_config
+
+logger = logging.getLogger("http_session")
+
+# (connect, read) seconds, used when a call does not pass its own timeout
+DEFAULT_TIMEOUT: Tuple[float, float] = (5.0, 30.0)
+# For local models that may load from disk before the first byte
+SLOW_TIMEOUT: Tuple[float, float] = (5.0, 600.0)
+# Hosts kept in a session's pool and idle keep-alive connections kept per host
+POOL_HOSTS = 32
+POOL_CONNECTIONS_PER_HOST = 32
+# Seconds an idle async connection is kept open
+ASYNC_KEEPALIVE = 60
+
+Timeout = Union[None, float, Tuple[float, float]]
+
+
+def pooled_adapter(api: Optional[str] = None) -> HTTPAdapter:
+    """Adapter with keep-alive pools sized for concurrent actions, rate limited as api when given"""
+    if api is None:
+        return HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_CONNECTIONS_PER_HOST)
+    return GovernedAdapter(api, pool_connections=POOL_HOSTS, pool_maxsize=POOL_CONNECTIONS_PER_HOST)
+
+
+class PooledSession(requests.Session):
+    """requests.Session with keep-alive pools sized for concurrent actions and a default timeout.
+    Requests of a named session go through the rate limit governor under that name."""
+
+    def __init__(self, timeout: Timeout = DEFAULT_TIMEOUT, api: Optional[str] = None):
+        super().__init__()
+        self.timeout = timeout
+        adapter = pooled_adapter(api)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+_sessions: Dict[str, PooledSession] = {}
+_sessions_lock = threading.Lock()
+# event loop -> name -> aiohttp.ClientSession, aiohttp sessions are bound to the loop that created them
+_async_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+
+
+def get_session(name: str = "default") -> PooledSession:
+    """Process wide session for name, e.g. a connection's name.
+
+    Reusing it keeps TCP and TLS connections open between calls instead of setting up a
+    new one per request like requests.get() does. Sessions are thread safe for the way
+    the connections use them and are shared by all agents of the process. Their requests
+    share the rate limit buckets of name, see src/rate_limit.py.
+    """
+    session = _sessions.get(name)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(name)
+            if session is None:
+                session = _sessions[name] = PooledSession(api=name)
+    return session
+
+
+def close_sessions() -> None:
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+def get_async_session(name: str = "default"):
+    """aiohttp session for name on the running event loop, with the same keep-alive pools,
+    timeouts and rate limits as get_session(). Close them with close_async_sessions() before the loop
+    shuts down."""
+    import aiohttp
+
+    loop = asyncio.get_running_loop()
+    sessions = _async_sessions.setdefault(loop, {})
+    session = sessions.get(name)
+    if session is None or session.closed:
+        connect, read = DEFAULT_TIMEOUT
+        session = sessions[name] = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=POOL_HOSTS * POOL_CONNECTIONS_PER_HOST,
+                                           limit_per_host=POOL_CONNECTIONS_PER_HOST,
+                                           keepalive_timeout=ASYNC_KEEPALIVE),
+            timeout=aiohttp.ClientTimeout(sock_connect=connect, sock_read=read),
+            trace_configs=[aiohttp_trace_config(name)],
+        )
+    return session
+
+
+async def close_async_sessions() -> None:
+    """Close the aiohttp sessions of the running event loop"""
+    sessions = _async_sessions.pop(asyncio.get_running_loop(), {})
+    for session in sessions.values():
+        try:
+            await session.close()
+        except Exception as e:
+            logger.debug(f"Could not close HTTP session: {e}")
+
+
+def _reset_after_fork() -> None:
+    # Pooled sockets belong to the parent, a forked worker opens its own
+    _sessions.clear()
+    _async_sessions.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("llm_cache")
+
+DEFAULT_CACHE_TTL = 3600
+DEFAULT_CACHE_MAX_ENTRIES = 1024
+DEFAULT_CACHE_PATH = ".zerepy/llm_cache.sqlite"
+
+
+def _json_default(value: Any) -> Any:
+    # Pydantic models (server requests) and classes used as response formats
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if hasattr(value, "dict"):
+        return value.dict()
+    return repr(value)
+
+
+def llm_cache_key(provider: str, model: Optional[str], system_prompt: str, prompt: Any,
+                  stop: Optional[list] = None, response_format: Any = None) -> str:
+    """Content address of a generate-text request"""
+    payload = json.dumps(
+        [provider, model, system_prompt, prompt, stop, response_format],
+        sort_keys=True, default=_json_default, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache(ABC):
+    """Base class for generate-text response caches.
+
+    Entries expire after `ttl` seconds and at most `max_entries` are kept, the least
+    recently used entry is evicted first. Subclasses implement _get, _set and _clear.
+    """
+
+    backend = "none"
+
+    def __init__(self, ttl: float = DEFAULT_CACHE_TTL, max_entries: int = DEFAULT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._get(key, time.time())
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self.evictions += self._set(key, value, time.time())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self),
+        }
+
+    @abstractmethod
+    def _get(self, key: str, now: float) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def _set(self, key: str, value: str, now: float) -> int:
+        """Store value and return the number of evicted entries"""
+        pass
+
+    @abstractmethod
+    def _clear(self) -> None:
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+
+class MemoryLLMCache(LLMCache):
+    """In process LRU cache"""
+
+    backend = "memory"
+
+    def __init__(self, ttl: float = DEFAULT_CACHE_TTL, max_entries: int = DEFAULT_CACHE_MAX_ENTRIES):
+        super().__init__(ttl, max_entries)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def _get(self, key: str, now: float) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set(self, key: str, value: str, now: float) -> int:
+        self._entries[key] = (value, now + self.ttl)
+        self._entries.move_to_end(key)
+        evicted = 0
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def _clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteLLMCache(LLMCache):
+    """On disk cache, survives restarts and can be shared by several processes"""
+
+    backend = "sqlite"
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = DEFAULT_CACHE_TTL,
+                 max_entries: int = DEFAULT_CACHE_MAX_ENTRIES):
+        super().__init__(ttl, max_entries)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used)")
+        self._db.commit()
+
+    def _get(self, key: str, now: float) -> Optional[str]:
+        row = self._db.execute(
+            "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at <= now:
+            self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._db.commit()
+            return None
+        self._db.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+        self._db.commit()
+        return value
+
+    def _set(self, key: str, value: str, now: float) -> int:
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, now + self.ttl, now),
+            )
+            self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+            excess = self._count() - self.max_entries
+            if excess > 0:
+                self._db.execute(
+                    "DELETE FROM llm_cache WHERE key IN "
+                    "(SELECT key FROM llm_cache ORDER BY last_used ASC LIMIT ?)",
+                    (excess,),
+                )
+        return max(0, excess)
+
+    def _clear(self) -> None:
+        with self._db:
+            self._db.execute("DELETE FROM llm_cache")
+
+    def _count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count()
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def create_llm_cache(config: Optional[Dict[str, Any]]) -> Optional[LLMCache]:
+    """Build a cache from the "llm_cache" section of an agent JSON, None disables caching"""
+    if not config or not config.get("enabled", True):
+        return None
+    backend = config.get("backend", "memory")
+    ttl = config.get("ttl", DEFAULT_CACHE_TTL)
+    max_entries = config.get("max_entries", DEFAULT_CACHE_MAX_ENTRIES)
+    if backend == "memory":
+        return MemoryLLMCache(ttl=ttl, max_entries=max_entries)
+    if backend == "sqlite":
+        return SQLiteLLMCache(path=config.get("path", DEFAULT_CACHE_PATH), ttl=ttl, max_entries=max_entries)
+    raise ValueError(f"Unknown llm_cache backend: {backend}")
@@ -0,0 +1,310 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from src.tracing import span
+
+# Seconds, from fast cache hits to slow LLM completions
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """A named metric with a fixed set of label names, one series per label combination"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return super().render() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Cumulative bucket histogram, quantile() interpolates within buckets like
+    Prometheus' histogram_quantile()"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> [per bucket counts, sum, count]
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[Dict[str, str]]:
+        """Observe the duration of the block. The yielded dict holds the labels, so the
+        block can fill in ones only known at the end, such as the status."""
+        labels = dict(labels)
+        started = time.perf_counter()
+        try:
+            yield labels
+        except BaseException:
+            labels.setdefault("status", "error")
+            raise
+        finally:
+            labels.setdefault("status", "ok")
+            self.observe(time.perf_counter() - started, **{name: labels[name] for name in self.labelnames})
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[2] if series else 0
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            if not series or not series[2]:
+                return None
+            counts, total = list(series[0]), series[2]
+        return self._quantile(q, counts, total)
+
+    def _quantile(self, q: float, counts: List[int], total: int) -> float:
+        rank = q * total
+        cumulative, lower = 0, 0.0
+        for upper, count in zip(self.buckets, counts):
+            if cumulative + count >= rank and count:
+                if upper == math.inf:
+                    return lower
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = upper if upper != math.inf else lower
+        return lower
+
+    def summary(self) -> List[Dict[str, object]]:
+        """p50/p99, count and mean of every series"""
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        return [
+            dict(zip(self.labelnames, key), count=count, mean=round(total / count, 6),
+                 p50=round(self._quantile(0.5, counts, count), 6), p99=round(self._quantile(0.99, counts, count), 6))
+            for key, counts, total, count in sorted(series) if count
+        ]
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            series = sorted((key, list(counts), total, count) for key, (counts, total, count) in self._series.items())
+        for key, counts, total, count in series:
+            cumulative = 0
+            for upper, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(upper)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process wide set of metrics, rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name: str, documentation: str, labelnames: Sequence[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, metric_class) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with a different type or labels")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def latency_summary(self) -> Dict[str, List[Dict[str, object]]]:
+        """p50/p99 of every histogram, keyed by metric name"""
+        with self._lock:
+            histograms = [metric for metric in self._metrics.values() if isinstance(metric, Histogram)]
+        return {histogram.name: histogram.summary() for histogram in histograms}
+
+
+REGISTRY = MetricsRegistry()
+
+CONNECTION_ACTION_SECONDS = REGISTRY.histogram(
+    "zerepy_connection_action_seconds", "Time spent in ConnectionManager.perform_action",
+    ["connection", "action", "status"])
+AGENT_ACTION_SECONDS = REGISTRY.histogram(
+    "zerepy_agent_action_seconds", "Time spent in registered agent action handlers", ["action", "status"])
+PROMPT_LLM_SECONDS = REGISTRY.histogram(
+    "zerepy_prompt_llm_seconds", "Time spent in ZerePyAgent.prompt_llm", ["provider", "cache", "status"])
+LLM_CALL_SECONDS = REGISTRY.histogram(
+    "zerepy_llm_call_seconds", "Duration of LLM provider calls, streams included", ["provider", "status"])
+LLM_TOKENS = REGISTRY.counter(
+    "zerepy_llm_tokens_total", "Tokens used by LLM provider calls", ["provider", "kind"])
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "zerepy_http_request_seconds", "Outbound HTTP and RPC requests", ["client", "host", "method", "status"])
+
+_http_instrumented = False
+_http_lock = threading.Lock()
+
+
+def _host(url) -> str:
+    try:
+        return urlsplit(str(url)).netloc or "unknown"
+    except ValueError:
+        return "unknown"
+
+
+def instrument_http_clients() -> None:
+    """Time every request sent through requests and httpx, which covers the Twitter,
+    Discord, Supabase and Ollama connections, web3 RPC and the LLM SDKs, and trace it
+    when tracing is on. Safe to call more than once, clients that are not installed are
+    skipped."""
+    global _http_instrumented
+    with _http_lock:
+        if _http_instrumented:
+            return
+        _http_instrumented = True
+
+    try:
+        import requests
+    except ImportError:
+        requests = None
+    if requests is not None:
+        send = requests.Session.send
+
+        def timed_send(session, request, **kwargs):
+            host = _host(request.url)
+            with HTTP_REQUEST_SECONDS.time(client="requests", host=host, method=request.method) as labels, \
+                    span(f"http:{request.method}", host=host) as current:
+                response = send(session, request, **kwargs)
+                labels["status"] = str(response.status_code)
+                if current is not None:
+                    current.set(status_code=response.status_code)
+                return response
+
+        requests.Session.send = timed_send
+
+    try:
+        import httpx
+    except ImportError:
+        return
+    client_send = httpx.Client.send
+    async_send = httpx.AsyncClient.send
+
+    def timed_client_send(client, request, *args, **kwargs):
+        host = _host(request.url)
+        with HTTP_REQUEST_SECONDS.time(client="httpx", host=host, method=request.method) as labels, \
+                span(f"http:{request.method}", host=host) as current:
+            response = client_send(client, request, *args, **kwargs)
+            labels["status"] = str(response.status_code)
+            if current is not None:
+                current.set(status_code=response.status_code)
+            return response
+
+    async def timed_async_send(client, request, *args, **kwargs):
+        host = _host(request.url)
+        with HTTP_REQUEST_SECONDS.time(client="httpx", host=host, method=request.method) as labels, \
+                span(f"http:{request.method}", host=host) as current:
+            response = await async_send(client, request, *args, **kwargs)
+            labels["status"] = str(response.status_code)
+            if current is not None:
+                current.set(status_code=response.status_code)
+            return response
+
+    httpx.Client.send = timed_client_send
+    httpx.AsyncClient.send = timed_async_send
@@ -3,6 +3,9 @@ This file contains the prompt templates used for generating content in various t
 These templates are formatted strings that will be populated with dynamic data at runtime.
 """
 
+#Agent loop prompts
+TASK_EPISODE_PROMPT = "Your current task is {task_name}. {task_description}\n"
+
 #Twitter prompts
 POST_TWEET_PROMPT =  ("Generate an engaging tweet. Don't include any hashtags, links or emojis. Keep it under 280 characters."
                       "The tweets should be pure commentary, do not shill any coins or projects apart from {agent_name}. Do not repeat any of the"
@@ -0,0 +1,410 @@
+import asyncio
+import email.utils
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Mapping, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+from src.metrics import REGISTRY
+
+logger = logging.getLogger("rate_limit")
+
+# Longest a request waits for its bucket before RateLimited is raised, so the caller can move on
+DEFAULT_MAX_WAIT = 30.0
+# Below this share of a window's requests left, the rest are spread over the window
+PACING_THRESHOLD = 0.1
+# Backoff after a 429 that did not say how long to wait, doubled per consecutive 429
+INITIAL_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+RATE_LIMIT_WAIT_SECONDS = REGISTRY.histogram(
+    "zerepy_rate_limit_wait_seconds", "Time requests waited for their rate limit bucket", ["api"],
+    buckets=(0.01, 0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0))
+RATE_LIMITED = REGISTRY.counter(
+    "zerepy_rate_limited_total", "429 responses and requests deferred by the rate limit governor",
+    ["api", "reason"])
+
+
+class RateLimited(requests.exceptions.RequestException):
+    """The request's bucket will not have room within max_wait seconds"""
+
+    def __init__(self, api: str, bucket: str, retry_after: float):
+        super().__init__(f"{api} rate limit {bucket} exhausted, retry in {retry_after:.1f}s")
+        self.api = api
+        self.bucket = bucket
+        self.retry_after = retry_after
+
+
+class Bucket:
+    """One rate limit as the API reports it: `limit` requests per window, `remaining`
+    of them left until `reset_at`, plus an optional steady token bucket for APIs that
+    publish their limits but do not send headers."""
+
+    def __init__(self, rate: Optional[float] = None, burst: Optional[float] = None):
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+        self.blocked_until = 0.0
+        self.next_allowed = 0.0
+        self.backoff = 0.0
+        self.rate = rate
+        self.burst = burst or rate or 0.0
+        self.tokens = self.burst
+        self.refilled_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self, now: float) -> float:
+        """Seconds until the bucket has room, 0 when it has room now"""
+        with self.lock:
+            if self.remaining is not None and now >= self.reset_at:
+                # A new window, assume it is full until a response says otherwise
+                self.remaining = self.limit
+            wait = max(self.blocked_until, self.next_allowed) - now
+            if self.remaining is not None and self.remaining <= 0:
+                wait = max(wait, self.reset_at - now)
+            if self.rate:
+                self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+                self.refilled_at = now
+                if self.tokens < 1:
+                    wait = max(wait, (1 - self.tokens) / self.rate)
+            return max(0.0, wait)
+
+    def take(self, now: float) -> None:
+        with self.lock:
+            if self.rate:
+                self.tokens -= 1
+            if self.remaining is not None:
+                self.remaining -= 1
+                if self.limit and self.remaining < self.limit * PACING_THRESHOLD:
+                    # Spread what is left of the window instead of draining it and stalling
+                    self.next_allowed = now + (self.reset_at - now) / max(self.remaining, 1)
+
+    def learn(self, now: float, limit: Optional[int], remaining: Optional[int], reset_after: Optional[float]) -> None:
+        with self.lock:
+            if reset_after is not None:
+                self.reset_at = now + reset_after
+            if limit is not None:
+                self.limit = limit
+            if remaining is not None:
+                self.remaining = remaining
+                if self.limit is None:
+                    self.limit = remaining
+            self.backoff = 0.0
+
+    def block(self, now: float, retry_after: Optional[float]) -> float:
+        with self.lock:
+            if retry_after is None:
+                self.backoff = min(MAX_BACKOFF, self.backoff * 2 or INITIAL_BACKOFF)
+                retry_after = self.backoff
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+            return retry_after
+
+    def snapshot(self, now: float) -> Dict[str, object]:
+        with self.lock:
+            return {
+                "limit": self.limit,
+                "remaining": self.remaining,
+                "reset_in": round(max(0.0, self.reset_at - now), 3) if self.remaining is not None else None,
+                "blocked_for": round(max(0.0, self.blocked_until - now), 3),
+            }
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if value is None:
+        return None
+    seconds = _number(value)
+    if seconds is not None:
+        return max(0.0, seconds)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _header(headers: Mapping[str, str], *names: str) -> Optional[str]:
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            return value
+    return None
+
+
+def _reset_after(value) -> Optional[float]:
+    """Reset headers are epoch seconds for some APIs and seconds from now for others"""
+    reset = _number(value)
+    if reset is None:
+        return None
+    return max(0.0, reset - time.time()) if reset > 1e9 else reset
+
+
+_ID = re.compile(r"^\d{5,}$")
+
+
+def _route_path(path: str, major: Tuple[str, ...] = ()) -> str:
+    """Path with ids replaced, except ids that follow a segment in major"""
+    segments = path.strip("/").split("/")
+    for i, segment in enumerate(segments):
+        previous = segments[i - 1] if i else ""
+        if previous == "reactions":
+            segments[i] = ":emoji"
+        elif _ID.match(segment) and previous not in major:
+            segments[i] = ":id"
+    return "/" + "/".join(segments)
+
+
+class RateLimitPolicy:
+    """How an API names its buckets and reports its limits. The default works for APIs
+    that send X-RateLimit-* or RateLimit-* headers and Retry-After on 429, with one
+    bucket per host."""
+
+    def route(self, method: str, url: str) -> str:
+        return urlsplit(url).netloc
+
+    def bucket(self, route: str, headers: Mapping[str, str]) -> Optional[str]:
+        """Bucket a response assigns the route to, when the API says so"""
+        return None
+
+    def limits(self, headers: Mapping[str, str]) -> Tuple[Optional[int], Optional[int], Optional[float]]:
+        """(limit, remaining, seconds until reset) from response headers"""
+        limit = _number(_header(headers, "X-RateLimit-Limit", "x-ratelimit-limit", "RateLimit-Limit",
+                                "ratelimit-limit"))
+        remaining = _number(_header(headers, "X-RateLimit-Remaining", "x-ratelimit-remaining",
+                                    "RateLimit-Remaining", "ratelimit-remaining"))
+        reset = _reset_after(_header(headers, "X-RateLimit-Reset", "x-ratelimit-reset", "RateLimit-Reset",
+                                     "ratelimit-reset"))
+        return (int(limit) if limit is not None else None, int(remaining) if remaining is not None else None,
+                reset if remaining is not None else None)
+
+    def is_global(self, headers: Mapping[str, str]) -> bool:
+        """Whether a 429 applies to every bucket of the API"""
+        return False
+
+
+class TwitterPolicy(RateLimitPolicy):
+    """x-rate-limit-* headers per endpoint, reset in epoch seconds"""
+
+    def route(self, method: str, url: str) -> str:
+        return f"{method.upper()} {_route_path(urlsplit(url).path)}"
+
+    def limits(self, headers):
+        limit = _number(headers.get("x-rate-limit-limit"))
+        remaining = _number(headers.get("x-rate-limit-remaining"))
+        reset = _reset_after(headers.get("x-rate-limit-reset"))
+        return (int(limit) if limit is not None else None, int(remaining) if remaining is not None else None,
+                reset if remaining is not None else None)
+
+
+class DiscordPolicy(RateLimitPolicy):
+    """Routes share the bucket named by X-RateLimit-Bucket, split by their channel, guild
+    or webhook id. A 429 with X-RateLimit-Global stops every route."""
+
+    MAJOR = ("channels", "guilds", "webhooks")
+
+    def route(self, method: str, url: str) -> str:
+        path = re.sub(r"^/api/v\d+", "", urlsplit(url).path)
+        return f"{method.upper()} {_route_path(path, self.MAJOR)}"
+
+    def bucket(self, route: str, headers):
+        bucket = headers.get("X-RateLimit-Bucket") or headers.get("x-ratelimit-bucket")
+        if not bucket:
+            return None
+        major = re.search(r"/(?:channels|guilds|webhooks)/(\d+)", route)
+        return f"{bucket}:{major.group(1)}" if major else bucket
+
+    def limits(self, headers):
+        limit, remaining, _ = super().limits(headers)
+        reset = _number(_header(headers, "X-RateLimit-Reset-After", "x-ratelimit-reset-after"))
+        return limit, remaining, reset if remaining is not None else None
+
+    def is_global(self, headers):
+        return str(_header(headers, "X-RateLimit-Global", "x-ratelimit-global")).lower() == "true"
+
+
+GLOBAL_BUCKET = "*"
+
+
+class RateLimitGovernor:
+    """Token buckets per API and bucket, learned from response headers.
+
+    Requests reserve a slot in their bucket before they are sent. An exhausted bucket only
+    holds back requests to that bucket: they wait in their own thread (or task) when room
+    comes back within max_wait, and raise RateLimited otherwise so the agent can carry on
+    with other work. Other buckets, APIs and agents are not affected.
+    """
+
+    def __init__(self):
+        self._policies: Dict[str, RateLimitPolicy] = {"twitter": TwitterPolicy(), "discord": DiscordPolicy()}
+        self._buckets: Dict[Tuple[str, str], Bucket] = {}
+        self._routes: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+
+    def set_policy(self, api: str, policy: RateLimitPolicy) -> None:
+        self._policies[api] = policy
+
+    def configure(self, api: str, rate: float, burst: Optional[float] = None) -> None:
+        """Also pace all of api at rate requests per second, for limits the API documents
+        but does not report in headers"""
+        bucket = self._bucket(api, GLOBAL_BUCKET)
+        with bucket.lock:
+            bucket.rate, bucket.burst = rate, burst or rate
+            bucket.tokens = min(bucket.tokens, bucket.burst) if bucket.tokens else bucket.burst
+
+    def policy(self, api: str) -> RateLimitPolicy:
+        return self._policies.get(api) or self._policies.setdefault(api, RateLimitPolicy())
+
+    def _bucket(self, api: str, name: str) -> Bucket:
+        key = (api, name)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = Bucket()
+        return bucket
+
+    def _buckets_for(self, api: str, route: str) -> Tuple[Bucket, ...]:
+        name = self._routes.get((api, route), route)
+        return self._bucket(api, GLOBAL_BUCKET), self._bucket(api, name)
+
+    def _reserve(self, api: str, route: str) -> float:
+        """Take a slot in the API wide and the route's bucket, or return how long to wait"""
+        now = time.monotonic()
+        buckets = self._buckets_for(api, route)
+        wait = max(bucket.wait(now) for bucket in buckets)
+        if wait <= 0:
+            for bucket in buckets:
+                bucket.take(now)
+        return wait
+
+    def acquire(self, api: str, method: str, url: str, max_wait: Optional[float] = DEFAULT_MAX_WAIT) -> str:
+        """Wait for a slot in the request's bucket and return the route to pass to observe()"""
+        route = self.policy(api).route(method, url)
+        self._acquire_route(api, route, max_wait)
+        return route
+
+    def _acquire_route(self, api: str, route: str, max_wait: Optional[float]) -> None:
+        started = time.monotonic()
+        while True:
+            wait = self._reserve(api, route)
+            if wait <= 0:
+                break
+            self._check_wait(api, route, started, wait, max_wait)
+            time.sleep(wait)
+        self._record_wait(api, started)
+
+    async def aacquire(self, api: str, method: str, url: str, max_wait: Optional[float] = DEFAULT_MAX_WAIT) -> str:
+        """acquire() for coroutines, waits without blocking the event loop"""
+        route = self.policy(api).route(method, url)
+        started = time.monotonic()
+        while True:
+            wait = self._reserve(api, route)
+            if wait <= 0:
+                break
+            self._check_wait(api, route, started, wait, max_wait)
+            await asyncio.sleep(wait)
+        self._record_wait(api, started)
+        return route
+
+    def _check_wait(self, api: str, route: str, started: float, wait: float, max_wait: Optional[float]) -> None:
+        if max_wait is not None and time.monotonic() - started + wait > max_wait:
+            RATE_LIMITED.inc(api=api, reason="deferred")
+            raise RateLimited(api, self._routes.get((api, route), route), wait)
+
+    def _record_wait(self, api: str, started: float) -> None:
+        waited = time.monotonic() - started
+        if waited > 0.001:
+            RATE_LIMIT_WAIT_SECONDS.observe(waited, api=api)
+
+    def observe(self, api: str, route: str, status: int, headers: Mapping[str, str]) -> None:
+        """Learn from the response to a request sent after acquire()"""
+        policy = self.policy(api)
+        now = time.monotonic()
+        name = policy.bucket(route, headers)
+        if name is not None:
+            self._routes[(api, route)] = name
+        bucket = self._bucket(api, name or self._routes.get((api, route), route))
+        limit, remaining, reset_after = policy.limits(headers)
+        if remaining is not None or limit is not None:
+            bucket.learn(now, limit, remaining, reset_after)
+        if status != 429:
+            bucket.backoff = 0.0
+        else:
+            RATE_LIMITED.inc(api=api, reason="429")
+            if policy.is_global(headers):
+                bucket = self._bucket(api, GLOBAL_BUCKET)
+            retry_after = _retry_after(headers)
+            if retry_after is None and remaining == 0 and reset_after is not None:
+                retry_after = reset_after
+            waited = bucket.block(now, retry_after)
+            logger.warning(f"{api} rate limited on {route}, holding it back for {waited:.1f}s")
+
+    @contextmanager
+    def guard(self, api: str, route: str, max_wait: Optional[float] = DEFAULT_MAX_WAIT):
+        """Govern an SDK call that does not go through a governed session. A 429 raised by
+        the SDK, as an exception with a status attribute, blocks the bucket."""
+        self._acquire_route(api, route, max_wait)
+        try:
+            yield
+        except Exception as e:
+            if getattr(e, "status", None) == 429 or getattr(e, "status_code", None) == 429:
+                self.observe(api, route, 429, getattr(e, "headers", None) or {})
+            raise
+        self.observe(api, route, 200, {})
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        now = time.monotonic()
+        with self._lock:
+            buckets = list(self._buckets.items())
+        return {f"{api} {name}": bucket.snapshot(now) for (api, name), bucket in sorted(buckets)}
+
+
+GOVERNOR = RateLimitGovernor()
+
+
+class GovernedAdapter(requests.adapters.HTTPAdapter):
+    """HTTPAdapter that sends every request through GOVERNOR under one API name"""
+
+    def __init__(self, api: str, max_wait: Optional[float] = DEFAULT_MAX_WAIT,
+                 governor: Optional[RateLimitGovernor] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.api = api
+        self.max_wait = max_wait
+        self.governor = governor or GOVERNOR
+
+    def send(self, request, *args, **kwargs):
+        route = self.governor.acquire(self.api, request.method, request.url, self.max_wait)
+        response = super().send(request, *args, **kwargs)
+        self.governor.observe(self.api, route, response.status_code, response.headers)
+        return response
+
+
+def aiohttp_trace_config(api: str, max_wait: Optional[float] = DEFAULT_MAX_WAIT,
+                         governor: Optional[RateLimitGovernor] = None):
+    """aiohttp TraceConfig that sends every request of a ClientSession through the governor"""
+    import aiohttp
+
+    governor = governor or GOVERNOR
+    config = aiohttp.TraceConfig()
+
+    async def on_request_start(session, context, params):
+        context.route = await governor.aacquire(api, params.method, str(params.url), max_wait)
+
+    async def on_request_end(session, context, params):
+        governor.observe(api, context.route, params.response.status, params.response.headers)
+
+    config.on_request_start.append(on_request_start)
+    config.on_request_end.append(on_request_end)
+    return config
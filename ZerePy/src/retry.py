@@ -0,0 +1,289 @@
+import asyncio
+import logging
+import random
+import re
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import requests
+
+from src.connection_health import is_auth_error
+from src.metrics import REGISTRY
+from src.rate_limit import RateLimited
+
+logger = logging.getLogger("retry")
+
+RETRYABLE = "retryable"
+RATE_LIMITED = "rate_limited"
+FATAL = "fatal"
+
+# Circuit states, also the values of the zerepy_circuit_state gauge
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+STATE_NAMES = {CLOSED: "closed", HALF_OPEN: "half_open", OPEN: "open"}
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+
+RETRIES = REGISTRY.counter(
+    "zerepy_retries_total", "Retried calls by target and error class", ["target", "kind"])
+CIRCUIT_STATE = REGISTRY.gauge(
+    "zerepy_circuit_state", "Circuit breaker state per connection, 0 closed, 1 half open, 2 open", ["connection"])
+CIRCUIT_OPENED = REGISTRY.counter(
+    "zerepy_circuit_opened_total", "Times a connection's circuit breaker opened", ["connection"])
+CIRCUIT_REJECTED = REGISTRY.counter(
+    "zerepy_circuit_rejected_total", "Calls failed fast by an open circuit breaker", ["connection"])
+
+# Messages of wrapped errors, connections often re-raise with only the text of the original
+_RATE_LIMIT_MESSAGE = re.compile(r"\b429\b|rate.?limit|too many requests", re.IGNORECASE)
+_TRANSIENT_MESSAGE = re.compile(r"\b50[0234]\b|timed? ?out|temporar|unavailable|connection (?:reset|refused|aborted)"
+                                r"|max retries exceeded", re.IGNORECASE)
+# Failures to reach the server at all, the request was never sent
+_UNSENT_MESSAGE = re.compile(r"connection refused|failed to establish a new connection|connect ?timeout"
+                             r"|name or service not known|nodename nor servname|temporary failure in name resolution",
+                             re.IGNORECASE)
+
+
+class CircuitOpen(Exception):
+    """A connection's circuit breaker is open, the call was not attempted"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Circuit for {name} is open, failing fast for another {retry_in:.1f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def _status(error: BaseException) -> Optional[int]:
+    for value in (getattr(error, "status_code", None), getattr(error, "status", None),
+                  getattr(getattr(error, "response", None), "status_code", None)):
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def _chain(error: BaseException):
+    """error and the errors it was raised from or while handling"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def classify(error: BaseException) -> str:
+    """RETRYABLE for transient failures (connection errors, timeouts, 5xx), RATE_LIMITED for
+    429s and governor deferrals, FATAL for everything a retry cannot fix: bad credentials,
+    invalid parameters, other 4xx, bugs and open circuits."""
+    for current in _chain(error):
+        if isinstance(current, CircuitOpen):
+            return FATAL
+        if isinstance(current, RateLimited):
+            return RATE_LIMITED
+        status = _status(current)
+        if status == 429:
+            return RATE_LIMITED
+        if status is not None:
+            return RETRYABLE if status >= 500 or status == 408 else FATAL
+        if isinstance(current, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                                ConnectionError, TimeoutError, asyncio.TimeoutError)):
+            return RETRYABLE
+    if is_auth_error(error):
+        return FATAL
+    message = " ".join(str(current) for current in _chain(error))
+    if _RATE_LIMIT_MESSAGE.search(message):
+        return RATE_LIMITED
+    if _TRANSIENT_MESSAGE.search(message):
+        return RETRYABLE
+    return FATAL
+
+
+def is_unsent(error: BaseException) -> bool:
+    """True when the failed call cannot have reached the server: the connection was never
+    established, or a rate limit turned it away. Only these are safe to retry for writes."""
+    for current in _chain(error):
+        if isinstance(current, RateLimited) or _status(current) == 429:
+            return True
+        if isinstance(current, (requests.exceptions.ConnectTimeout, ConnectionRefusedError, socket.gaierror)):
+            return True
+    return bool(_UNSENT_MESSAGE.search(" ".join(str(current) for current in _chain(error))))
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    for current in _chain(error):
+        retry_after = getattr(current, "retry_after", None)
+        if isinstance(retry_after, (int, float)):
+            return float(retry_after)
+    return None
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter for RETRYABLE and RATE_LIMITED errors.
+
+    Attempt n waits a random time up to min(max_delay, base_delay * 2**n). Rate limited
+    errors that say when to come back wait that long instead, or are not retried when it
+    is longer than max_delay. FATAL errors are raised at once. Calls that are not
+    idempotent, like posting or transferring, are only retried when is_unsent() says the
+    request never left: after a timeout or a 5xx it may have been carried out.
+    """
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 10.0
+
+    def delay(self, attempt: int, error: BaseException, kind: str) -> Optional[float]:
+        """Seconds to wait before the next attempt, None to give up"""
+        if kind == FATAL or attempt + 1 >= self.max_attempts:
+            return None
+        if kind == RATE_LIMITED:
+            retry_after = _retry_after(error)
+            if retry_after is not None:
+                return retry_after if retry_after <= self.max_delay else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, func: Callable[..., Any], *args, target: str = "call", idempotent: bool = True,
+             **kwargs) -> Any:
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                kind = classify(e)
+                wait = self.delay(attempt, e, kind)
+                if wait is None or not (idempotent or is_unsent(e)):
+                    raise
+                RETRIES.inc(target=target, kind=kind)
+                logger.warning(f"{target} failed ({kind}: {e}), attempt {attempt + 2} in {wait:.2f}s")
+                time.sleep(wait)
+                attempt += 1
+
+    async def acall(self, func: Callable[..., Any], *args, target: str = "call", idempotent: bool = True,
+                    **kwargs) -> Any:
+        """call() for coroutine functions, waits without blocking the event loop"""
+        attempt = 0
+        while True:
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                kind = classify(e)
+                wait = self.delay(attempt, e, kind)
+                if wait is None or not (idempotent or is_unsent(e)):
+                    raise
+                RETRIES.inc(target=target, kind=kind)
+                logger.warning(f"{target} failed ({kind}: {e}), attempt {attempt + 2} in {wait:.2f}s")
+                await asyncio.sleep(wait)
+                attempt += 1
+
+
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+
+def is_stream(result: Any) -> bool:
+    """Whether an action returned an iterator that is read after the call returns"""
+    return isinstance(result, Iterator)
+
+
+class CircuitBreaker:
+    """Fails calls to a connection fast after failure_threshold consecutive transient
+    failures. After reset_timeout one trial call is let through (half open), its success
+    closes the circuit and its failure opens it again. Rate limits and fatal errors count
+    as successes, the API answered in both cases."""
+
+    def __init__(self, name: str, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(CLOSED, connection=name)
+
+    def _set_state(self, state: int) -> None:
+        if state != self.state:
+            logger.warning(f"Circuit for {self.name} is now {STATE_NAMES[state]}")
+        self.state = state
+        CIRCUIT_STATE.set(state, connection=self.name)
+
+    def before_call(self) -> None:
+        """Raise CircuitOpen unless the call may go ahead"""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == OPEN and retry_in <= 0:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+        CIRCUIT_REJECTED.inc(connection=self.name)
+        raise CircuitOpen(self.name, max(0.0, retry_in))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._trial_running = False
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+
+    def record_failure(self, error: BaseException) -> None:
+        if classify(error) != RETRYABLE:
+            # The API answered, a rate limit or a rejected request says nothing about an outage
+            self.record_success()
+            return
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self) -> None:
+        self.opened_at = time.monotonic()
+        if self.state != OPEN:
+            CIRCUIT_OPENED.inc(connection=self.name)
+        self._set_state(OPEN)
+
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        self.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        # A stream can still fail while it is read, its reader settles it, see MeteredStream
+        if not is_stream(result):
+            self.record_success()
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": STATE_NAMES[self.state],
+                "failures": self.failures,
+                "retry_in": (round(max(0.0, self.opened_at + self.reset_timeout - time.monotonic()), 1)
+                             if self.state == OPEN else None),
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Process wide breaker for a connection, shared by every agent using it"""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+
+def breaker_snapshot() -> Dict[str, Dict[str, Any]]:
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {name: breaker.snapshot() for name, breaker in sorted(breakers.items())}
@@ -0,0 +1,199 @@
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("scheduler")
+
+# Draws from the alias table before falling back to a pass over the ready tasks
+MAX_DRAWS = 4
+
+# Connections the built-in actions call, a task can list its own under "connections"
+ACTION_CONNECTIONS = {
+    "post-tweet": ("twitter",),
+    "reply-to-tweet": ("twitter",),
+    "like-tweet": ("twitter",),
+    "respond-to-mentions": ("twitter",),
+    "get-mentioned-tweets": ("twitter", "supabase"),
+    "deploy-token": ("twitter", "supabase"),
+    "deploy-token-discord": ("discord",),
+    "read-mentioned-messages": ("discord",),
+    "list-channels": ("discord",),
+    "rug-detect": ("discord",),
+    "post-echochambers": ("echochambers",),
+    "reply-echochambers": ("echochambers",),
+}
+
+# Minimum interval of an action taken from its connection's config, e.g. tweet_interval
+CONNECTION_INTERVALS = {
+    "post-tweet": ("twitter", "tweet_interval"),
+    "post-cast": ("farcaster", "cast_interval"),
+}
+
+
+class AliasTable:
+    """Walker's alias method, samples an index with probability weights[i] / sum(weights)
+    in O(1) after an O(n) build"""
+
+    def __init__(self, weights: Sequence[float]):
+        n = len(weights)
+        total = float(sum(weights))
+        if n == 0 or total <= 0:
+            raise ValueError("Alias table needs at least one positive weight")
+        scaled = [weight * n / total for weight in weights]
+        self.probability = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Whatever is left is 1.0 up to rounding error
+
+    def sample(self, rng: random.Random = random) -> int:
+        draw = rng.random() * len(self.probability)
+        column = int(draw)
+        return column if draw - column < self.probability[column] else self.alias[column]
+
+
+@dataclass
+class ScheduledTask:
+    name: str
+    weight: float
+    # Registered action run directly, None runs a ReAct episode that picks its own tools
+    action: Optional[str] = None
+    # Seconds that must pass between two runs
+    min_interval: float = 0.0
+    # Seconds after which the task is due and runs before any sampled task
+    max_interval: Optional[float] = None
+    connections: Tuple[str, ...] = ()
+    # What a ReAct episode run for the task should do, given to the model with its name
+    description: Optional[str] = None
+
+    @classmethod
+    def from_config(cls, task: Dict[str, Any], connection_configs: Dict[str, Dict[str, Any]]) -> "ScheduledTask":
+        action = task.get("action")
+        key = action or task["name"]
+        min_interval = task.get("min_interval")
+        if min_interval is None and key in CONNECTION_INTERVALS:
+            connection, option = CONNECTION_INTERVALS[key]
+            min_interval = connection_configs.get(connection, {}).get(option)
+        return cls(
+            name=task["name"],
+            weight=float(task.get("weight", 0)),
+            action=action,
+            min_interval=float(min_interval or 0),
+            max_interval=task.get("max_interval"),
+            connections=tuple(task.get("connections", ACTION_CONNECTIONS.get(key, ()))),
+            description=task.get("description"),
+        )
+
+
+class TaskScheduler:
+    """Picks the agent's next task from the "tasks" of its JSON.
+
+    Weights, with the time_based_multipliers applied, are turned into one alias table per
+    hour of the day when the agent is loaded, so a pick costs a couple of random numbers.
+    Tasks still inside their min_interval, or needing a connection whose last health
+    check failed, are skipped. Tasks past their max_interval run first, the most overdue
+    one wins. Last run times live in last_run (the agent's persisted state).
+    """
+
+    def __init__(self, tasks: List[Dict[str, Any]], connection_configs: Optional[Dict[str, Dict[str, Any]]] = None,
+                 use_time_based_weights: bool = False, time_based_multipliers: Optional[Dict[str, float]] = None,
+                 last_run: Optional[Dict[str, float]] = None, on_record: Optional[Callable[[], None]] = None,
+                 is_healthy: Optional[Callable[[str], bool]] = None, rng: Optional[random.Random] = None):
+        connection_configs = connection_configs or {}
+        self.tasks = [ScheduledTask.from_config(task, connection_configs) for task in tasks]
+        self._by_name = {task.name: task for task in self.tasks}
+        self.use_time_based_weights = use_time_based_weights
+        self.time_based_multipliers = time_based_multipliers or {}
+        self.last_run = last_run if last_run is not None else {}
+        # Called after last_run changed, lets the agent's state persist it
+        self.on_record = on_record or (lambda: None)
+        self.is_healthy = is_healthy or (lambda connection: True)
+        self.rng = rng or random.Random()
+        self._deadline_tasks = [task for task in self.tasks if task.max_interval]
+        # Hours with the same weights share a table, there are three distinct ones at most
+        tables: Dict[Tuple[float, ...], Optional[AliasTable]] = {}
+        self.hour_weights: List[List[float]] = []
+        self.hour_tables: List[Optional[AliasTable]] = []
+        for hour in range(24):
+            weights = self.weights_for_hour(hour)
+            key = tuple(weights)
+            if key not in tables:
+                tables[key] = AliasTable(weights) if any(weight > 0 for weight in weights) else None
+            self.hour_weights.append(weights)
+            self.hour_tables.append(tables[key])
+
+    @property
+    def is_empty(self) -> bool:
+        """True when no task has a weight, the agent then runs a ReAct episode every iteration"""
+        return all(table is None for table in self.hour_tables) and not self._deadline_tasks
+
+    def weights_for_hour(self, hour: int) -> List[float]:
+        weights = [task.weight for task in self.tasks]
+        if not self.use_time_based_weights:
+            return weights
+        # Reduce tweet frequency during night hours (1 AM - 5 AM)
+        if 1 <= hour <= 5:
+            night = self.time_based_multipliers.get("tweet_night_multiplier", 0.4)
+            weights = [weight * night if task.name == "post-tweet" else weight
+                       for weight, task in zip(weights, self.tasks)]
+        # Increase engagement frequency during day hours (8 AM - 8 PM)
+        if 8 <= hour <= 20:
+            day = self.time_based_multipliers.get("engagement_day_multiplier", 1.5)
+            weights = [weight * day if task.name in ("reply-to-tweet", "like-tweet") else weight
+                       for weight, task in zip(weights, self.tasks)]
+        return weights
+
+    def _wait(self, task: ScheduledTask, now: float) -> float:
+        """Seconds until task's min_interval has passed"""
+        last = self.last_run.get(task.name)
+        return 0.0 if last is None else max(0.0, last + task.min_interval - now)
+
+    def is_ready(self, task: ScheduledTask, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        return self._wait(task, now) <= 0 and all(self.is_healthy(name) for name in task.connections)
+
+    def ready(self, name: str, now: Optional[float] = None) -> bool:
+        """Whether the task called name may run now, tasks the scheduler does not know always may"""
+        task = self._by_name.get(name)
+        return task is None or self.is_ready(task, now)
+
+    def next_task(self, now: Optional[float] = None) -> Tuple[Optional[ScheduledTask], float]:
+        """(task to run, 0) or (None, seconds until a skipped task may become ready)"""
+        now = time.time() if now is None else now
+        overdue = [task for task in self._deadline_tasks
+                   if now - self.last_run.get(task.name, 0.0) >= task.max_interval and self.is_ready(task, now)]
+        if overdue:
+            return max(overdue, key=lambda task: now - self.last_run.get(task.name, 0.0) - task.max_interval), 0.0
+
+        hour = time.localtime(now).tm_hour
+        table = self.hour_tables[hour]
+        if table is None:
+            return None, self._next_wakeup(now)
+        for _ in range(MAX_DRAWS):
+            task = self.tasks[table.sample(self.rng)]
+            if self.is_ready(task, now):
+                return task, 0.0
+        # The likely tasks are all blocked, pick among the ready ones directly
+        ready = [(task, weight) for task, weight in zip(self.tasks, self.hour_weights[hour])
+                 if weight > 0 and self.is_ready(task, now)]
+        if ready:
+            candidates, weights = zip(*ready)
+            return self.rng.choices(candidates, weights=weights)[0], 0.0
+        return None, self._next_wakeup(now)
+
+    def _next_wakeup(self, now: float) -> float:
+        waits = [self._wait(task, now) for task in self.tasks if task.weight > 0 or task.max_interval]
+        waits = [wait for wait in waits if wait > 0]
+        return min(waits) if waits else 0.0
+
+    def record_run(self, name: str, now: Optional[float] = None) -> None:
+        self.last_run[name] = time.time() if now is None else now
+        self.on_record()
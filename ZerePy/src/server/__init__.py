@@ -1,7 +1,7 @@
 import uvicorn
 from .app import create_app
 
-def start_server(host: str = "0.0.0.0", port: int = 8000):
-    """Start the ZerePy server"""
-    app = create_app()
-    uvicorn.run(app, host=host, port=port)
\ No newline at end of file
+def start_server(host: str = "0.0.0.0", port: int = 8000, **state_options):
+    """Start the ZerePy server, state_options are passed on to ServerState"""
+    app = create_app(**state_options)
+    uvicorn.run(app, host=host, port=port)
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+logger = logging.getLogger("server/admission")
+
+DEFAULT_MAX_CONCURRENT_REQUESTS = 4
+DEFAULT_MAX_QUEUE = 16
+DEFAULT_QUEUE_TIMEOUT = 30.0
+
+
+@dataclass
+class AgentGate:
+    """Concurrency limit and wait queue of one agent"""
+    max_concurrent: int
+    max_queue: int
+    semaphore: asyncio.Semaphore = field(init=False)
+    in_flight: int = 0
+    waiting: int = 0
+    admitted: int = 0
+    rejected: int = 0
+    timed_out: int = 0
+
+    def __post_init__(self):
+        self.semaphore = asyncio.Semaphore(self.max_concurrent)
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+class AdmissionController:
+    """Per-agent admission control for LLM backed endpoints.
+
+    Each agent runs at most `max_concurrent` requests at a time and queues up to
+    `max_queue` more. A request that finds the queue full is rejected with 429 straight
+    away, one that waits longer than `queue_timeout` seconds gets 503. Both carry a
+    Retry-After header.
+    """
+
+    def __init__(self, max_concurrent: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+                 max_queue: int = DEFAULT_MAX_QUEUE, queue_timeout: float = DEFAULT_QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.gates: Dict[str, AgentGate] = {}
+
+    def gate(self, agent_name: str, max_concurrent: Optional[int] = None) -> AgentGate:
+        gate = self.gates.get(agent_name)
+        if gate is None:
+            gate = AgentGate(max(1, max_concurrent or self.max_concurrent), self.max_queue)
+            self.gates[agent_name] = gate
+        return gate
+
+    async def acquire(self, agent_name: str, max_concurrent: Optional[int] = None) -> AgentGate:
+        gate = self.gate(agent_name, max_concurrent)
+        if gate.semaphore.locked() and gate.waiting >= gate.max_queue:
+            gate.rejected += 1
+            raise HTTPException(status_code=429, detail=f"Too many requests queued for agent {agent_name}",
+                                headers={"Retry-After": "1"})
+        gate.waiting += 1
+        try:
+            await asyncio.wait_for(gate.semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            gate.timed_out += 1
+            logger.warning(f"Request for agent {agent_name} timed out after {self.queue_timeout}s in queue")
+            raise HTTPException(status_code=503, detail=f"Agent {agent_name} is overloaded, try again later",
+                                headers={"Retry-After": str(int(self.queue_timeout))})
+        finally:
+            gate.waiting -= 1
+        gate.in_flight += 1
+        gate.admitted += 1
+        return gate
+
+    @staticmethod
+    def release(gate: AgentGate) -> None:
+        gate.in_flight -= 1
+        gate.semaphore.release()
+
+    @asynccontextmanager
+    async def admit(self, agent_name: str, max_concurrent: Optional[int] = None):
+        gate = await self.acquire(agent_name, max_concurrent)
+        try:
+            yield gate
+        finally:
+            self.release(gate)
+
+    def busy(self, agent_name: str) -> bool:
+        """Whether requests for the agent are running or queued"""
+        gate = self.gates.get(agent_name)
+        return gate is not None and (gate.in_flight > 0 or gate.waiting > 0)
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        return {name: gate.snapshot() for name, gate in self.gates.items()}
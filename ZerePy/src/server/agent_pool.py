@@ -0,0 +1,150 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Set
+
+from src.agent import ZerePyAgent
+from src.supervisor import SharedConnectionPool
+
+logger = logging.getLogger("server/agent_pool")
+
+DEFAULT_MAX_AGENTS = 8
+DEFAULT_IDLE_TIMEOUT = 900.0
+
+
+class AgentPool:
+    """Warm agents keyed by agent file name, e.g. "anti_rug" for agents/anti_rug.json.
+
+    Agents are loaded on first use and kept until the pool holds more than `max_agents`,
+    or they have not been used for `idle_timeout` seconds. The least recently used agent
+    goes first. Pinned agents and agents `is_busy` reports as serving requests are never
+    evicted. Agents share connections with identical config through a SharedConnectionPool.
+    """
+
+    def __init__(self, max_agents: int = DEFAULT_MAX_AGENTS, idle_timeout: Optional[float] = DEFAULT_IDLE_TIMEOUT,
+                 is_busy: Optional[Callable[[str], bool]] = None, agents_dir: str = "agents"):
+        self.max_agents = max(1, max_agents)
+        self.idle_timeout = idle_timeout
+        self.is_busy = is_busy or (lambda name: False)
+        self.agents_dir = Path(agents_dir)
+        self.connection_pool = SharedConnectionPool()
+        self.pinned: Set[str] = set()
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self._agents: "OrderedDict[str, ZerePyAgent]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        self._loading: Dict[str, asyncio.Lock] = {}
+        self._index: Dict[str, str] = {}
+        self._index_mtime: Optional[float] = None
+
+    def _model_index(self) -> Dict[str, str]:
+        """Agent file stems and lower-cased agent names -> file stem, rebuilt when the dir changes"""
+        try:
+            mtime = self.agents_dir.stat().st_mtime
+        except FileNotFoundError:
+            return {}
+        if mtime != self._index_mtime:
+            index = {}
+            for agent_file in self.agents_dir.glob("*.json"):
+                if agent_file.stem == "general":
+                    continue
+                try:
+                    with open(agent_file) as f:
+                        name = json.load(f).get("name")
+                except (OSError, ValueError, AttributeError):
+                    name = None
+                if isinstance(name, str):
+                    index.setdefault(name.lower(), agent_file.stem)
+                index[agent_file.stem] = agent_file.stem
+            self._index, self._index_mtime = index, mtime
+        return self._index
+
+    def resolve(self, model: Optional[str]) -> Optional[str]:
+        """Agent file name for a request's model field, matching either the file name or
+        the agent's name ("anti_rug" or "AntiRugAgent"), None if no agent matches"""
+        if not model:
+            return None
+        if model in self._agents:
+            return model
+        index = self._model_index()
+        return index.get(model) or index.get(model.lower())
+
+    async def get(self, name: str) -> ZerePyAgent:
+        """Warm agent for an agent file name, loading it in a worker thread on first use"""
+        agent = self._agents.get(name)
+        if agent is None:
+            # Concurrent first requests for one agent wait for a single load
+            async with self._loading.setdefault(name, asyncio.Lock()):
+                agent = self._agents.get(name)
+                if agent is None:
+                    started = time.perf_counter()
+                    agent = await asyncio.to_thread(ZerePyAgent, name, self.connection_pool)
+                    self.loads += 1
+                    self._agents[name] = agent
+                    logger.info(f"Loaded agent {agent.name} in {time.perf_counter() - started:.2f}s "
+                                f"({len(self._agents)}/{self.max_agents} warm)")
+                else:
+                    self.hits += 1
+            self._loading.pop(name, None)
+        else:
+            self.hits += 1
+        self._agents.move_to_end(name)
+        self._last_used[name] = time.monotonic()
+        self._evict(keep=name)
+        return agent
+
+    def pin(self, name: str) -> None:
+        self.pinned.add(name)
+
+    def unpin(self, name: str) -> None:
+        self.pinned.discard(name)
+
+    def _evictable(self, name: str, keep: str) -> bool:
+        return name != keep and name not in self.pinned and not self.is_busy(name)
+
+    def _evict(self, keep: str) -> None:
+        now = time.monotonic()
+        if self.idle_timeout:
+            for name in list(self._agents):
+                if now - self._last_used.get(name, now) > self.idle_timeout and self._evictable(name, keep):
+                    self._remove(name, "idle")
+        for name in list(self._agents):
+            if len(self._agents) <= self.max_agents:
+                break
+            if self._evictable(name, keep):
+                self._remove(name, "least recently used")
+
+    def _remove(self, name: str, reason: str) -> None:
+        agent = self._agents.pop(name)
+        self._last_used.pop(name, None)
+        agent.close()
+        self.evictions += 1
+        logger.info(f"Evicted agent {agent.name} ({reason})")
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._agents
+
+    def __len__(self) -> int:
+        return len(self._agents)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "max_agents": self.max_agents,
+            "loads": self.loads,
+            "hits": self.hits,
+            "evictions": self.evictions,
+            "shared_connections": len(self.connection_pool),
+            "agents": {
+                name: {
+                    "agent": agent.name,
+                    "idle_seconds": round(now - self._last_used.get(name, now), 1),
+                    "pinned": name in self.pinned,
+                }
+                for name, agent in self._agents.items()
+            },
+        }
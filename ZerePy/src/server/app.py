@@ -1,20 +1,37 @@
 import asyncio
+import json
 import logging
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
 from pathlib import Path
 from typing import Dict, List, Literal, Optional, Union, Any
 from uuid import uuid4
 
 import shortuuid
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field
 
 from src.cli import ZerePyCLI
+from src.server.admission import (AdmissionController, DEFAULT_MAX_CONCURRENT_REQUESTS, DEFAULT_MAX_QUEUE,
+                                  DEFAULT_QUEUE_TIMEOUT)
+from src.server.agent_pool import AgentPool, DEFAULT_MAX_AGENTS, DEFAULT_IDLE_TIMEOUT
+from src.http_session import close_async_sessions
+from src.metrics import REGISTRY, instrument_http_clients
+from src.usage import TokenUsage, UsageMeter, create_usage_ledger
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("server/app")
 
+SERVER_REQUESTS = REGISTRY.gauge(
+    "zerepy_server_requests", "Completions per agent, by state (in_flight, waiting)", ["agent", "state"])
+SERVER_ADMISSIONS = REGISTRY.gauge(
+    "zerepy_server_admissions", "Completions per agent since start, by outcome", ["agent", "outcome"])
+SERVER_AGENTS_LOADED = REGISTRY.gauge("zerepy_server_agents_loaded", "Agents warm in the agent pool")
+
 
 class Token(BaseModel):
     name: str = Field(..., description="Name token")
@@ -85,7 +102,9 @@ class ChatCompletionRequest(BaseModel):
     seed: Optional[int] = None
     stop: Optional[Union[str, List[str]]] = None
     stream: Optional[bool] = False
-    temperature: Optional[float] = 1.0
+    # Unset uses the provider's configured temperature, which also decides whether the
+    # agent's llm_cache can answer
+    temperature: Optional[float] = None
     top_p: Optional[float] = 1.0
     tools: Optional[List[Dict[str, Union[str, int, float]]]] = None
     tool_choice: Optional[str] = None
@@ -112,11 +131,122 @@ class ChatCompletionResponse(BaseModel):
     usage: UsageInfo
 
 
+def messages_to_prompt(messages: Union[str, List[Dict[str, Any]]]) -> str:
+    """Flatten chat messages into the plain text prompt the agent works with"""
+    if isinstance(messages, str):
+        return messages
+    lines = []
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        lines.append(str(content))
+    return "\n".join(lines) + "\n"
+
+
+def completion_response(model: str, content: Optional[str], usage: TokenUsage) -> Dict[str, Any]:
+    return {
+        "id": f"chatcmpl-{uuid4()}",
+        "object": "chat.completion",
+        "model": model,
+        "created": int(time.time()),
+        "system_fingerprint": "fp_44709d6fcb",
+        "choices": [{
+            "index": 0,
+            "message": {
+                "role": "assistant",
+                "content": content,
+            },
+            "logprobs": None,
+            "finish_reason": "stop"
+        }],
+        "usage": usage.to_openai(),
+    }
+
+
+def sse_event(data: Any) -> str:
+    return f"data: {json.dumps(data)}\n\n"
+
+
+def completion_chunk(completion_id: str, model: str, created: int, delta: Dict[str, Any],
+                     finish_reason: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "logprobs": None, "finish_reason": finish_reason}],
+    }
+
+
+async def stream_completion(http_request: Request, model: str, deltas, meter: Optional[UsageMeter] = None):
+    """Serve an async iterator of chat deltas as OpenAI style server-sent events.
+
+    The iterator is closed as soon as the client disconnects, which cancels the agent
+    work behind it and closes the provider stream. The last chunk carries the token usage
+    of meter.
+    """
+    completion_id = f"chatcmpl-{uuid4()}"
+    created = int(time.time())
+    try:
+        yield sse_event(completion_chunk(completion_id, model, created, {"role": "assistant", "content": ""}))
+        async for delta in deltas:
+            if await http_request.is_disconnected():
+                logger.info(f"Client disconnected, cancelling {completion_id}")
+                return
+            yield sse_event(completion_chunk(completion_id, model, created, delta))
+        final = completion_chunk(completion_id, model, created, {}, "stop")
+        if meter is not None:
+            final["usage"] = meter.usage.to_openai()
+        yield sse_event(final)
+        yield "data: [DONE]\n\n"
+    except Exception as e:
+        logger.error(f"Streaming {completion_id} failed: {e}")
+        yield sse_event({"error": {"message": str(e), "type": "server_error"}})
+    finally:
+        await deltas.aclose()
+
+
+async def episode_deltas(agent, prompt: str, meter: UsageMeter):
+    """ReAct progress as chat deltas: thoughts, actions and observations go to
+    reasoning_content, answer tokens to content"""
+    system_prompt = await asyncio.to_thread(agent._loop_system_prompt)
+    with agent.usage_scope("chat-completion", meter):
+        async with aclosing(agent.astream_react_episode(prompt, system_prompt)) as events:
+            async for event in events:
+                if event["type"] == "thought":
+                    yield {"reasoning_content": event["delta"]}
+                elif event["type"] == "action":
+                    yield {"reasoning_content": f"\nAction {event['step']}: {event['content']}\n"}
+                elif event["type"] == "observation":
+                    yield {"reasoning_content": f"Observation {event['step']}: {event['content']}\n"}
+                elif event["type"] == "answer":
+                    yield {"content": event["delta"]}
+
+
+async def text_deltas(agent, prompt: str, system_prompt: str, meter: UsageMeter, response_format: Any = None,
+                      temperature: Optional[float] = None):
+    with agent.usage_scope("structured-output", meter):
+        async with aclosing(agent.astream_llm(prompt, system_prompt, response_format=response_format,
+                                              temperature=temperature)) as deltas:
+            async for delta in deltas:
+                yield {"content": delta}
+
+
 class ServerState:
     """Simple state management for the server"""
 
-    def __init__(self):
+    def __init__(self, executor_threads: int = 32, max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+                 max_queue: int = DEFAULT_MAX_QUEUE, queue_timeout: float = DEFAULT_QUEUE_TIMEOUT,
+                 max_agents: int = DEFAULT_MAX_AGENTS, agent_idle_timeout: Optional[float] = DEFAULT_IDLE_TIMEOUT):
         self.cli = ZerePyCLI()
+        # Blocking agent work (LLM calls, actions) runs here, installed as the loop's default executor
+        self.executor = ThreadPoolExecutor(max_workers=executor_threads, thread_name_prefix="zerepy-server")
+        self.admission = AdmissionController(max_concurrent_requests, max_queue, queue_timeout)
+        # Warm agents that completions are routed to by their model field
+        self.agents = AgentPool(max_agents, agent_idle_timeout, is_busy=self.admission.busy)
+        # Pool key of the agent loaded through /agents/{name}/load, also self.cli.agent
+        self.default_agent: Optional[str] = None
         self.agent_running = False
         self.agent_task = None
         self._stop_event = threading.Event()
@@ -160,26 +290,77 @@ class ServerState:
         if self.agent_running:
             self._stop_event.set()
             if self.agent_task:
-                self.agent_task.join(timeout=5)
+                await asyncio.to_thread(self.agent_task.join, 5)
             self.agent_running = False
 
 
 class ZerePyServer:
-    def __init__(self):
+    def __init__(self, **state_options):
         self.app = FastAPI(title="ZerePy Server")
-        self.state = ServerState()
+        self.state = ServerState(**state_options)
+        instrument_http_clients()
         self.setup_routes()
 
+    def _update_gauges(self) -> None:
+        for name, gate in self.state.admission.snapshot().items():
+            SERVER_REQUESTS.set(gate["in_flight"], agent=name, state="in_flight")
+            SERVER_REQUESTS.set(gate["waiting"], agent=name, state="waiting")
+            for outcome in ("admitted", "rejected", "timed_out"):
+                SERVER_ADMISSIONS.set(gate[outcome], agent=name, outcome=outcome)
+        SERVER_AGENTS_LOADED.set(len(self.state.agents))
+
+    def _loaded_agent(self):
+        if not self.state.cli.agent:
+            raise HTTPException(status_code=400, detail="No agent loaded")
+        return self.state.cli.agent
+
+    async def _route(self, model: Optional[str]):
+        """(pool key, agent) serving a completion: the agent named by the model field,
+        else the agent loaded through /agents/{name}/load"""
+        name = self.state.agents.resolve(model)
+        if name is None:
+            if not self.state.cli.agent:
+                raise HTTPException(status_code=404, detail=f"No agent matches model {model} and no agent loaded")
+            return self.state.default_agent or self.state.cli.agent.name, self.state.cli.agent
+        try:
+            return name, await self.state.agents.get(name)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Could not load agent {name}: {e}")
+
     def setup_routes(self):
+        @self.app.on_event("startup")
+        async def use_bounded_executor():
+            # asyncio.to_thread and the agent's run_in_thread go through the default executor
+            asyncio.get_running_loop().set_default_executor(self.state.executor)
+
+        @self.app.on_event("shutdown")
+        async def close_http_sessions():
+            await close_async_sessions()
+
         @self.app.get("/")
         async def root():
             """Server status endpoint"""
             return {
                 "status": "running",
                 "agent": self.state.cli.agent.name if self.state.cli.agent else None,
-                "agent_running": self.state.agent_running
+                "agent_running": self.state.agent_running,
+                "llm_cache": (self.state.cli.agent.llm_cache.stats()
+                              if self.state.cli.agent and self.state.cli.agent.llm_cache else None),
+                "admission": self.state.admission.snapshot(),
+                "agent_pool": self.state.agents.snapshot()
             }
 
+        @self.app.get("/metrics")
+        async def metrics():
+            """Prometheus metrics of this process"""
+            self._update_gauges()
+            return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+        @self.app.get("/metrics/latency")
+        async def metrics_latency():
+            """p50/p99 of every latency histogram, per label set"""
+            return REGISTRY.latency_summary()
+
         @self.app.get("/agents")
         async def list_agents():
             """List available agents"""
@@ -194,11 +375,32 @@ class ZerePyServer:
             except Exception as e:
                 raise HTTPException(status_code=500, detail=str(e))
 
+        @self.app.get("/usage")
+        async def usage(agent: Optional[str] = None, provider: Optional[str] = None, action: Optional[str] = None,
+                        since: Optional[float] = None, group_by: str = "agent,provider,action"):
+            """Token usage from the ledger, filtered and grouped by agent, provider, model and action"""
+            ledger = create_usage_ledger(None)
+            try:
+                rows = await asyncio.to_thread(ledger.query, agent=agent, provider=provider, action=action,
+                                               since=since, group_by=[g for g in group_by.split(",") if g])
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            return {"usage": rows}
+
         @self.app.post("/agents/{name}/load")
         async def load_agent(name: str):
             """Load a specific agent"""
             try:
-                self.state.cli._load_agent_from_file(name)
+                if self.state.agents.resolve(name) != name:
+                    raise ValueError(f"Agent file not found: {name}")
+                agent = await self.state.agents.get(name)
+                if self.state.default_agent:
+                    self.state.agents.unpin(self.state.default_agent)
+                # The default agent backs the single-agent endpoints, keep it warm
+                self.state.agents.pin(name)
+                self.state.default_agent = name
+                self.state.cli.agent = agent
+                logger.info(f"\n✅ Successfully loaded agent: {agent.name}")
                 return {
                     "status": "success",
                     "agent": name
@@ -213,12 +415,16 @@ class ZerePyServer:
                 raise HTTPException(status_code=400, detail="No agent loaded")
 
             try:
+                connection_manager = self.state.cli.agent.connection_manager
                 connections = {}
-                for name, conn in self.state.cli.agent.connection_manager.connections.items():
+                for name, conn in connection_manager.connections.items():
                     connections[name] = {
-                        "configured": conn.is_configured(),
+                        "configured": await asyncio.to_thread(connection_manager.is_connection_configured, name),
                         "is_llm_provider": conn.is_llm_provider
                     }
+                for name, health in connection_manager.health.snapshot().items():
+                    if name in connections:
+                        connections[name]["health"] = health
                 return {"connections": connections}
             except Exception as e:
                 raise HTTPException(status_code=500, detail=str(e))
@@ -275,6 +481,7 @@ class ZerePyServer:
                         status_code=404, detail=f"Connection {name} not found")
 
                 success = connection.configure(**config.params)
+                self.state.cli.agent.connection_manager.health.invalidate(name)
                 if success:
                     return {"status": "success", "message": f"Connection {name} configured successfully"}
                 else:
@@ -297,77 +504,59 @@ class ZerePyServer:
                     raise HTTPException(
                         status_code=404, detail=f"Connection {name} not found")
 
+                connection_manager = self.state.cli.agent.connection_manager
+                configured = await asyncio.to_thread(connection_manager.is_connection_configured, name, True)
                 return {
                     "name": name,
-                    "configured": connection.is_configured(verbose=True),
-                    "is_llm_provider": connection.is_llm_provider
+                    "configured": configured,
+                    "is_llm_provider": connection.is_llm_provider,
+                    "health": connection_manager.health.snapshot().get(name)
                 }
 
             except Exception as e:
                 raise HTTPException(status_code=500, detail=str(e))
 
         @self.app.post("/chat/completions")
-        async def create_chat_completion(request: ChatCompletionRequest):
-            response = self.state.cli.agent.prompt_agent(request.messages)
-            return {
-                "id": f"chatcmpl-{uuid4()}",
-                "object": "chat.completion",
-                "model": request.model,
-                "created": 1677652288,
-                "system_fingerprint": "fp_44709d6fcb",
-                "choices": [{
-                    "index": 0,
-                    "message": {
-                        "role": "assistant",
-                        "content": response,
-                    },
-                    "logprobs": None,
-                    "finish_reason": "stop"
-                }],
-                "usage": {
-                    "prompt_tokens": 9,
-                    "completion_tokens": 12,
-                    "total_tokens": 21,
-                    "completion_tokens_details": {
-                        "reasoning_tokens": 0,
-                        "accepted_prediction_tokens": 0,
-                        "rejected_prediction_tokens": 0
-                    }
-                }
-            }
+        async def create_chat_completion(request: ChatCompletionRequest, http_request: Request):
+            name, agent = await self._route(request.model)
+            prompt = messages_to_prompt(request.messages)
+            if request.stream:
+                gate = await self.state.admission.acquire(name, agent.max_concurrent_requests)
+                meter = UsageMeter()
+                return StreamingResponse(
+                    stream_completion(http_request, request.model, episode_deltas(agent, prompt, meter), meter),
+                    media_type="text/event-stream",
+                    # Runs once the stream is done, also when the client went away
+                    background=BackgroundTask(self.state.admission.release, gate))
+            meter = UsageMeter()
+            async with self.state.admission.admit(name, agent.max_concurrent_requests):
+                with agent.usage_scope("chat-completion", meter):
+                    response = await agent.aprompt_agent(prompt)
+            return completion_response(request.model, response, meter.usage)
 
         @self.app.post("/structured_outputs/completions")
-        async def structured_outputs_completion(request: ChatCompletionRequest):
-            response = self.state.cli.agent.prompt_llm(prompt=request.messages, system_prompt="structured output",
-                                                       response_format=response_format)
-            return {
-                "id": f"chatcmpl-{uuid4()}",
-                "object": "chat.completion",
-                "model": request.model,
-                "created": 1677652288,
-                "system_fingerprint": "fp_44709d6fcb",
-                "choices": [{
-                    "index": 0,
-                    "message": {
-                        "role": "assistant",
-                        "content": response,
-                    },
-                    "logprobs": None,
-                    "finish_reason": "stop"
-                }],
-                "usage": {
-                    "prompt_tokens": 9,
-                    "completion_tokens": 12,
-                    "total_tokens": 21,
-                    "completion_tokens_details": {
-                        "reasoning_tokens": 0,
-                        "accepted_prediction_tokens": 0,
-                        "rejected_prediction_tokens": 0
-                    }
-                }
-            }
-
-
-def create_app():
-    server = ZerePyServer()
+        async def structured_outputs_completion(request: ChatCompletionRequest, http_request: Request):
+            name, agent = await self._route(request.model)
+            prompt = messages_to_prompt(request.messages)
+            if request.stream:
+                gate = await self.state.admission.acquire(name, agent.max_concurrent_requests)
+                meter = UsageMeter()
+                return StreamingResponse(
+                    stream_completion(http_request, request.model,
+                                      text_deltas(agent, prompt, "structured output", meter, response_format,
+                                                  request.temperature),
+                                      meter),
+                    media_type="text/event-stream",
+                    background=BackgroundTask(self.state.admission.release, gate))
+            meter = UsageMeter()
+            async with self.state.admission.admit(name, agent.max_concurrent_requests):
+                with agent.usage_scope("structured-output", meter):
+                    response = await agent.aprompt_llm(prompt=prompt, system_prompt="structured output",
+                                                       response_format=response_format,
+                                                       temperature=request.temperature)
+            return completion_response(request.model, response, meter.usage)
+
+
+def create_app(**state_options):
+    server = ZerePyServer(**state_options)
     return server.app
@@ -1,15 +1,18 @@
 import requests
+from src.http_session import SLOW_TIMEOUT, PooledSession
 from typing import Optional, List, Dict, Any
 
 class ZerePyClient:
     def __init__(self, base_url: str = "http://localhost:8000"):
         self.base_url = base_url.rstrip('/')
+        # Agent actions and chat completions can take longer than the default read timeout
+        self.session = PooledSession(timeout=SLOW_TIMEOUT)
 
     def _make_request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
         """Make HTTP request with error handling"""
         url = f"{self.base_url}/{endpoint.lstrip('/')}"
         try:
-            response = requests.request(method, url, **kwargs)
+            response = self.session.request(method, url, **kwargs)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
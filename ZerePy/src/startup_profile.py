@@ -0,0 +1,45 @@
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Optional
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger("startup_profile")
+
+
+def _default_agent_name() -> str:
+    with open(Path("agents") / "general.json", "r") as file:
+        return json.load(file)["default_agent"]
+
+
+def profile_startup(agent_name: Optional[str] = None) -> None:
+    """Print how long the CLI imports take and how long each connection takes to import and build"""
+    started = time.perf_counter()
+    import src.cli  # noqa: F401
+    cli_import = time.perf_counter() - started
+
+    from src.agent import ZerePyAgent
+    from src.helpers import print_h_bar
+
+    agent_name = agent_name or _default_agent_name()
+    started = time.perf_counter()
+    agent = ZerePyAgent(agent_name)
+    agent_load = time.perf_counter() - started
+    agent.connection_manager.health.stop_refresher()
+
+    # Loading the agent only declares its connections, build them all to see what they would cost
+    connections = agent.connection_manager.profile_startup()
+
+    print_h_bar()
+    logger.info(f"Startup profile for agent '{agent_name}'")
+    logger.info(f"{'import src.cli':<32}{cli_import * 1000:>10.1f} ms")
+    logger.info(f"{'load agent':<32}{agent_load * 1000:>10.1f} ms")
+    print_h_bar()
+    logger.info(f"{'connection':<20}{'import ms':>12}{'construct ms':>14}  status")
+    for entry in sorted(connections, key=lambda e: e["import"] + e["construct"], reverse=True):
+        status = "ok" if entry["built"] else f"failed: {entry['error'] or 'unknown error'}"
+        logger.info(f"{entry['name']:<20}{entry['import'] * 1000:>12.1f}{entry['construct'] * 1000:>14.1f}  {status}")
+    total = sum(entry["import"] + entry["construct"] for entry in connections)
+    logger.info(f"{'total':<20}{total * 1000:>26.1f}")
+    print_h_bar()
@@ -0,0 +1,370 @@
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from src.metrics import REGISTRY
+
+logger = logging.getLogger("state_store")
+
+DEFAULT_STATE_PATH = ".zerepy/state.sqlite"
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_SEEN_RETENTION = 30 * 86400
+
+STATE_FLUSH_SECONDS = REGISTRY.histogram(
+    "zerepy_state_flush_seconds", "Time to write a batch of agent state to the state store")
+STATE_FLUSHED_ROWS = REGISTRY.counter(
+    "zerepy_state_flushed_rows_total", "Rows written to the state store by batch flushes", ["table"])
+
+
+def _encode(value: Any) -> str:
+    def default(obj):
+        if isinstance(obj, (set, frozenset)):
+            return {"__set__": list(obj)}
+        raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+    return json.dumps(value, default=default, separators=(",", ":"))
+
+
+def _decode(text: str) -> Any:
+    def object_hook(obj):
+        if len(obj) == 1 and "__set__" in obj:
+            return set(obj["__set__"])
+        return obj
+
+    return json.loads(text, object_hook=object_hook)
+
+
+# Values that can change without the state dict seeing an assignment
+_MUTABLE = (dict, list, set)
+
+
+class AgentState(dict):
+    """The agent's state dict, loaded from the store at startup.
+
+    Actions keep using it as a plain dict, in-place changes included (list.pop(),
+    set.add()...). A flush only encodes the keys touched since the last one: keys that were
+    assigned or deleted, and dicts, lists and sets that were read, as the reader may have
+    changed them. Code that keeps such a value around and changes it later calls touch().
+    Keys whose JSON encoding changed are written, values that cannot be encoded stay in
+    memory only.
+    """
+
+    def __init__(self, store: "StateStore", scope: str, values: Dict[str, str]):
+        super().__init__()
+        self._store = store
+        self._scope = scope
+        self._written: Dict[str, str] = {}
+        self._dirty: Set[str] = set()
+        self._dirty_lock = threading.Lock()
+        for key, text in values.items():
+            try:
+                super().__setitem__(key, _decode(text))
+                self._written[key] = text
+            except ValueError as e:
+                logger.warning(f"Dropping unreadable state {scope}/{key}: {e}")
+
+    def touch(self, key) -> None:
+        """Write key on the next flush, for values changed in place"""
+        with self._dirty_lock:
+            self._dirty.add(key)
+
+    def _handed_out(self, key, value):
+        if isinstance(value, _MUTABLE):
+            self.touch(key)
+        return value
+
+    def __getitem__(self, key):
+        return self._handed_out(key, super().__getitem__(key))
+
+    def __setitem__(self, key, value) -> None:
+        super().__setitem__(key, value)
+        self.touch(key)
+
+    def __delitem__(self, key) -> None:
+        super().__delitem__(key)
+        self.touch(key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        self.touch(key)
+        return super().pop(key, *default)
+
+    def popitem(self):
+        key, value = super().popitem()
+        self.touch(key)
+        return key, value
+
+    def update(self, *args, **kwargs) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self) -> None:
+        with self._dirty_lock:
+            self._dirty.update(self.keys())
+        super().clear()
+
+    def values(self):
+        return [self._handed_out(key, value) for key, value in super().items()]
+
+    def items(self):
+        return [(key, self._handed_out(key, value)) for key, value in super().items()]
+
+    def changes(self) -> Tuple[Dict[str, str], List[str]]:
+        """(encoded values to write, keys to delete) since the last call"""
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        changed, deleted, retry = {}, [], set()
+        for key in dirty:
+            if not isinstance(key, str):
+                continue
+            if not super().__contains__(key):
+                if self._written.pop(key, None) is not None:
+                    deleted.append(key)
+                continue
+            try:
+                text = _encode(super().__getitem__(key))
+            except RuntimeError:
+                # Mutated by another thread mid-encode, the next flush retries
+                retry.add(key)
+                continue
+            except (TypeError, ValueError) as e:
+                logger.debug(f"Not persisting state {self._scope}/{key}: {e}")
+                continue
+            if self._written.get(key) != text:
+                changed[key] = text
+        self._written.update(changed)
+        if retry:
+            with self._dirty_lock:
+                self._dirty.update(retry)
+        return changed, deleted
+
+    def flush(self) -> None:
+        self._store.flush()
+
+
+class SeenSet:
+    """Set of processed item ids (tweets, messages...) that survives restarts. Lookups are
+    served from memory, additions are written to the store in batches."""
+
+    def __init__(self, store: "StateStore", scope: str, kind: str, items: Set[str]):
+        self._store = store
+        self.scope = scope
+        self.kind = kind
+        self._items = items
+        self._lock = threading.Lock()
+
+    def __contains__(self, item) -> bool:
+        return str(item) in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(list(self._items))
+
+    def add(self, item) -> None:
+        self.update((item,))
+
+    def update(self, items: Iterable) -> None:
+        with self._lock:
+            new = [str(item) for item in items if str(item) not in self._items]
+            self._items.update(new)
+        if new:
+            self._store.mark_seen(self.scope, self.kind, new)
+
+    def filter_unseen(self, items: Iterable, key=None) -> list:
+        """The items not seen yet, key(item) gives an item's id"""
+        return [item for item in items if str(key(item) if key else item) not in self._items]
+
+
+class StateStore:
+    """SQLite store (WAL mode) for agent state, cursors and seen-item sets.
+
+    State and seen items are buffered and written in one transaction every flush_interval
+    seconds, or sooner once batch_size rows are pending. Cursors are written at once:
+    advance_cursor() is a single conditional upsert, so cursors only ever move forward even
+    with several processes sharing the file, and it commits the pending seen items with it.
+    """
+
+    def __init__(self, path: str = DEFAULT_STATE_PATH, batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL, seen_retention: float = DEFAULT_SEEN_RETENTION):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.seen_retention = seen_retention
+        directory = os.path.dirname(path)
+        if directory and path != ":memory:":
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS state (scope TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "updated REAL NOT NULL, PRIMARY KEY (scope, key)) WITHOUT ROWID")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cursors (scope TEXT NOT NULL, name TEXT NOT NULL, value INTEGER NOT NULL, "
+                "updated REAL NOT NULL, PRIMARY KEY (scope, name)) WITHOUT ROWID")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS seen (scope TEXT NOT NULL, kind TEXT NOT NULL, item TEXT NOT NULL, "
+                "ts REAL NOT NULL, PRIMARY KEY (scope, kind, item)) WITHOUT ROWID")
+            if seen_retention:
+                self._db.execute("DELETE FROM seen WHERE ts < ?", (time.time() - seen_retention,))
+        self._states: Dict[str, AgentState] = {}
+        self._seen_sets: Dict[Tuple[str, str], SeenSet] = {}
+        self._pending_seen: List[Tuple[str, str, str, float]] = []
+        self._closed = False
+        self._wake = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    def agent_state(self, scope: str) -> AgentState:
+        """The state dict of an agent, read with one query the first time"""
+        with self._lock:
+            state = self._states.get(scope)
+            if state is None:
+                rows = self._db.execute("SELECT key, value FROM state WHERE scope = ?", (scope,)).fetchall()
+                state = self._states[scope] = AgentState(self, scope, dict(rows))
+                self._start_flusher()
+            return state
+
+    def seen_set(self, scope: str, kind: str) -> SeenSet:
+        with self._lock:
+            seen = self._seen_sets.get((scope, kind))
+            if seen is None:
+                rows = self._db.execute("SELECT item FROM seen WHERE scope = ? AND kind = ?", (scope, kind))
+                seen = self._seen_sets[(scope, kind)] = SeenSet(self, scope, kind, {item for item, in rows})
+            return seen
+
+    def mark_seen(self, scope: str, kind: str, items: Iterable[str]) -> None:
+        now = time.time()
+        with self._lock:
+            self._pending_seen.extend((scope, kind, str(item), now) for item in items)
+            full = len(self._pending_seen) >= self.batch_size
+        self._start_flusher()
+        if full:
+            self._wake.set()
+
+    def get_cursor(self, scope: str, name: str, default: Optional[int] = None) -> Optional[int]:
+        """High-water mark of a feed, e.g. the newest tweet id already handled"""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM cursors WHERE scope = ? AND name = ?", (scope, name)).fetchone()
+        return row[0] if row else default
+
+    def advance_cursor(self, scope: str, name: str, value: Union[int, str]) -> int:
+        """Move a cursor forward to value and return where it now stands. A value at or
+        behind the stored one leaves the cursor alone, ids are compared as integers."""
+        value = int(value)
+        with self._lock, self._db:
+            self._write_seen()
+            self._db.execute(
+                "INSERT INTO cursors (scope, name, value, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (scope, name) DO UPDATE SET value = excluded.value, updated = excluded.updated "
+                "WHERE excluded.value > cursors.value",
+                (scope, name, value, time.time()))
+            return self._db.execute(
+                "SELECT value FROM cursors WHERE scope = ? AND name = ?", (scope, name)).fetchone()[0]
+
+    def _write_seen(self) -> int:
+        pending, self._pending_seen = self._pending_seen, []
+        if pending:
+            self._db.executemany("INSERT OR IGNORE INTO seen (scope, kind, item, ts) VALUES (?, ?, ?, ?)", pending)
+            STATE_FLUSHED_ROWS.inc(len(pending), table="seen")
+        return len(pending)
+
+    def flush(self) -> None:
+        """Write pending seen items and changed state in one transaction"""
+        with self._lock:
+            if self._closed:
+                return
+            started = time.perf_counter()
+            now = time.time()
+            upserts, deletes = [], []
+            for scope, state in self._states.items():
+                changed, deleted = state.changes()
+                upserts.extend((scope, key, text, now) for key, text in changed.items())
+                deletes.extend((scope, key) for key in deleted)
+            if not upserts and not deletes and not self._pending_seen:
+                return
+            with self._db:
+                self._write_seen()
+                if upserts:
+                    self._db.executemany("INSERT OR REPLACE INTO state (scope, key, value, updated) "
+                                         "VALUES (?, ?, ?, ?)", upserts)
+                    STATE_FLUSHED_ROWS.inc(len(upserts), table="state")
+                if deletes:
+                    self._db.executemany("DELETE FROM state WHERE scope = ? AND key = ?", deletes)
+            STATE_FLUSH_SECONDS.observe(time.perf_counter() - started)
+
+    def _start_flusher(self) -> None:
+        if self._flusher is not None or not self.flush_interval:
+            return
+        with self._lock:
+            if self._flusher is not None or self._closed:
+                return
+
+            def flush_loop():
+                while not self._closed:
+                    self._wake.wait(self.flush_interval)
+                    self._wake.clear()
+                    try:
+                        self.flush()
+                    except Exception as e:
+                        logger.error(f"Failed to write agent state to {self.path}: {e}")
+
+            self._flusher = threading.Thread(target=flush_loop, name="state-store", daemon=True)
+            self._flusher.start()
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._closed = True
+            self._wake.set()
+            self._db.close()
+
+
+_stores: Dict[str, StateStore] = {}
+_stores_lock = threading.Lock()
+
+
+def create_state_store(config: Optional[Dict[str, Any]]) -> StateStore:
+    """Store for the "state_store" section of an agent JSON. The store is on by default,
+    {"enabled": false} keeps state in an in-memory database that is gone on exit. Agents
+    using the same path share one store."""
+    config = config if isinstance(config, dict) else {"enabled": config is not False}
+    options = {option: config[option] for option in ("batch_size", "flush_interval", "seen_retention")
+               if option in config}
+    if not config.get("enabled", True):
+        return StateStore(":memory:", **options)
+    path = config.get("path", DEFAULT_STATE_PATH)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = StateStore(path, **options)
+        return store
+
+
+@atexit.register
+def close_state_stores() -> None:
+    """Write what is still buffered, called at exit"""
+    with _stores_lock:
+        stores = list(_stores.values())
+        _stores.clear()
+    for store in stores:
+        try:
+            store.close()
+        except Exception as e:
+            logger.error(f"Failed to close state store {store.path}: {e}")
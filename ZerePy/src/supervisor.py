@@ -0,0 +1,184 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.managers import SyncManager
+from typing import Any, Dict, List, Optional
+
+from src.agent import ZerePyAgent
+from src.helpers import print_h_bar
+
+logger = logging.getLogger("supervisor")
+
+
+class SharedConnectionPool:
+    """Process wide connection cache.
+
+    Connections are keyed by provider name and their JSON config. Credentials are read
+    from the process environment, so within one worker two agents with the same key
+    would build identical clients and can safely share one instance.
+    """
+
+    def __init__(self):
+        self._connections: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(config: Dict[str, Any]) -> str:
+        return json.dumps(config, sort_keys=True, default=str)
+
+    def get_or_create(self, config: Dict[str, Any], connection_class):
+        key = self._key(config)
+        with self._lock:
+            connection = self._connections.get(key)
+            if connection is None:
+                connection = connection_class(config)
+                self._connections[key] = connection
+            else:
+                logger.debug(f"Reusing shared {config['name']} connection")
+            return connection
+
+    def __len__(self) -> int:
+        return len(self._connections)
+
+
+async def _worker_main(worker_id: int, agent_names: List[str], reports, stop_event,
+                       report_interval: float, executor_threads: int) -> None:
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=executor_threads,
+                                                 thread_name_prefix=f"zerepy-worker-{worker_id}"))
+
+    pool = SharedConnectionPool()
+    agents = {}
+    for agent_name in agent_names:
+        try:
+            agents[agent_name] = await loop.run_in_executor(None, ZerePyAgent, agent_name, pool)
+        except Exception as e:
+            logger.error(f"Worker {worker_id} could not load agent {agent_name}: {e}")
+
+    # Connections are built on first use, so the pool is still empty here
+    connection_names = sorted({name for agent in agents.values() for name in agent.connection_manager.connections})
+    logger.info(f"Worker {worker_id} (pid {os.getpid()}) hosting {len(agents)} agents "
+                f"sharing connections: {', '.join(connection_names) or 'none'}")
+
+    tasks = {name: asyncio.create_task(agent.aloop(countdown=False)) for name, agent in agents.items()}
+
+    def report():
+        reports.put({
+            "worker": worker_id,
+            "pid": os.getpid(),
+            "timestamp": time.time(),
+            "agents": {
+                name: dict(agent.runtime_stats(), running=not tasks[name].done())
+                for name, agent in agents.items()
+            },
+        })
+
+    try:
+        while tasks and not all(task.done() for task in tasks.values()):
+            stopped = await loop.run_in_executor(None, stop_event.wait, report_interval)
+            report()
+            if stopped:
+                break
+    finally:
+        for agent in agents.values():
+            agent.stop()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        report()
+
+
+def _run_worker(worker_id: int, agent_names: List[str], reports, stop_event,
+                report_interval: float, executor_threads: int) -> None:
+    """Process pool entry point, hosts a group of agents on one event loop"""
+    # Ctrl+C is handled by the supervisor, which shuts workers down through stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO, format=f"[worker {worker_id}] %(message)s")
+    asyncio.run(_worker_main(worker_id, agent_names, reports, stop_event,
+                             report_interval, executor_threads))
+
+
+class AgentSupervisor:
+    """Runs many agents in a few processes. Agents are spread round robin over
+    `workers` processes, each of which runs all of its agents on one event loop."""
+
+    def __init__(self, agent_names: List[str], workers: Optional[int] = None,
+                 report_interval: float = 30.0, executor_threads: int = 32):
+        if not agent_names:
+            raise ValueError("No agents to supervise")
+        self.agent_names = agent_names
+        self.workers = max(1, min(workers or os.cpu_count() or 1, len(agent_names)))
+        self.report_interval = report_interval
+        self.executor_threads = executor_threads
+        self.latest: Dict[str, Dict[str, Any]] = {}
+
+    def _partition(self) -> List[List[str]]:
+        groups = [[] for _ in range(self.workers)]
+        for index, agent_name in enumerate(self.agent_names):
+            groups[index % self.workers].append(agent_name)
+        return groups
+
+    def _record(self, report: Dict[str, Any]) -> None:
+        for agent_name, stats in report["agents"].items():
+            self.latest[agent_name] = dict(stats, worker=report["worker"], pid=report["pid"])
+
+    def log_report(self) -> None:
+        print_h_bar()
+        logger.info(f"{'agent':<28}{'worker':>7}{'cpu s':>10}{'iters':>8}{'queue':>7}{'in flight':>11}")
+        for agent_name in sorted(self.latest):
+            stats = self.latest[agent_name]
+            logger.info(f"{agent_name:<28}{stats['worker']:>7}{stats['cpu_time']:>10.2f}"
+                        f"{stats['iterations']:>8}{stats['queue_depth']:>7}{stats['in_flight']:>11}")
+        print_h_bar()
+
+    def run(self) -> None:
+        groups = self._partition()
+        logger.info(f"\n🚀 Supervising {len(self.agent_names)} agents on {self.workers} workers")
+
+        manager = SyncManager()
+        manager.start(signal.signal, (signal.SIGINT, signal.SIG_IGN))
+        with manager:
+            reports = manager.Queue()
+            stop_event = manager.Event()
+
+            # Raising KeyboardInterrupt in the middle of a proxy call would desync the
+            # manager connection, so Ctrl+C only raises a local flag and the loop below
+            # forwards it to the workers
+            stopping = threading.Event()
+            previous_handler = signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+            try:
+                with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                    futures = [
+                        executor.submit(_run_worker, worker_id, group, reports, stop_event,
+                                        self.report_interval, self.executor_threads)
+                        for worker_id, group in enumerate(groups)
+                    ]
+                    try:
+                        last_log = time.monotonic()
+                        while not all(future.done() for future in futures):
+                            if stopping.is_set() and not stop_event.is_set():
+                                logger.info("\n🛑 Stopping supervised agents...")
+                                stop_event.set()
+                            try:
+                                self._record(reports.get(timeout=1.0))
+                            except queue.Empty:
+                                continue
+                            if time.monotonic() - last_log >= self.report_interval:
+                                self.log_report()
+                                last_log = time.monotonic()
+                    finally:
+                        stop_event.set()
+                    for future in futures:
+                        try:
+                            future.result()
+                        except Exception as e:
+                            logger.error(f"Worker failed: {e}")
+                while not reports.empty():
+                    self._record(reports.get())
+                self.log_report()
+            finally:
+                signal.signal(signal.SIGINT, previous_handler)
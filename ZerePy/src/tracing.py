@@ -0,0 +1,215 @@
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger("tracing")
+
+# Set to a file path to trace this process and the worker processes it starts. Files
+# ending in .json are written in Chrome trace format, anything else as JSONL.
+TRACE_ENV = "ZEREPY_TRACE"
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    duration: Optional[float] = None
+    status: str = "ok"
+    thread: int = field(default_factory=threading.get_ident)
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "status": self.status,
+            "pid": os.getpid(),
+            "thread": self.thread,
+            "attributes": self.attributes,
+        }
+
+
+class JSONLExporter:
+    """One JSON object per finished span"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", buffering=1)
+
+    def _line(self, span: Span) -> str:
+        return json.dumps(span.to_dict(), default=str)
+
+    def export(self, span: Span) -> None:
+        line = self._line(span)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class ChromeTraceExporter(JSONLExporter):
+    """Chrome trace event format, open the file in chrome://tracing or ui.perfetto.dev.
+
+    The file is a JSON array whose closing bracket is optional in this format, so spans
+    are appended as they finish and the file stays valid while the process runs.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        with self._lock:
+            if self._file.tell() == 0:
+                self._file.write("[\n")
+
+    def _line(self, span: Span) -> str:
+        event = {
+            "name": span.name,
+            "cat": span.name.split(":", 1)[0],
+            "ph": "X",
+            "ts": int(span.start * 1_000_000),
+            "dur": int((span.duration or 0) * 1_000_000),
+            "pid": os.getpid(),
+            "tid": span.thread,
+            "args": dict(span.attributes, trace_id=span.trace_id, span_id=span.span_id,
+                         parent_id=span.parent_id, status=span.status),
+        }
+        return json.dumps(event, default=str) + ","
+
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("trace_span", default=None)
+_exporter = None
+_configured = False
+_config_lock = threading.Lock()
+
+
+def configure_tracing(path: Optional[str], trace_format: Optional[str] = None) -> None:
+    """Export spans to path, None turns tracing off. The format is "jsonl" or "chrome",
+    by default chrome for .json files."""
+    global _exporter, _configured
+    with _config_lock:
+        if _exporter is not None:
+            _exporter.close()
+        _exporter = None
+        if path:
+            trace_format = trace_format or ("chrome" if path.endswith(".json") else "jsonl")
+            _exporter = ChromeTraceExporter(path) if trace_format == "chrome" else JSONLExporter(path)
+            logger.info(f"Tracing to {path} ({trace_format})")
+        _configured = True
+    if path:
+        # HTTP and RPC calls get spans too
+        from src.metrics import instrument_http_clients
+        instrument_http_clients()
+
+
+def tracing_enabled() -> bool:
+    if not _configured:
+        configure_tracing(os.getenv(TRACE_ENV))
+    return _exporter is not None
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def _new_span(name: str, start: float, attributes: Dict[str, Any]) -> Span:
+    parent = _current.get()
+    return Span(
+        name=name,
+        trace_id=parent.trace_id if parent is not None else uuid.uuid4().hex,
+        span_id=uuid.uuid4().hex[:16],
+        parent_id=parent.span_id if parent is not None else None,
+        start=start,
+        attributes=attributes,
+    )
+
+
+def _export(span: Span) -> None:
+    exporter = _exporter
+    if exporter is None:
+        return
+    try:
+        exporter.export(span)
+    except Exception as e:
+        logger.debug(f"Could not export span {span.name}: {e}")
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """Time the block as a child of the current span. Yields None when tracing is off.
+
+    The span is the current one inside the block, also in worker threads started with
+    the caller's context (asyncio.to_thread, aiter_in_thread, the router's hedging pool).
+    """
+    if not tracing_enabled():
+        yield None
+        return
+    current = _new_span(name, time.time(), attributes)
+    started = time.perf_counter()
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        if not isinstance(e, GeneratorExit):
+            current.status = "error"
+            current.attributes["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration = time.perf_counter() - started
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Generators finalized from another context, nothing left to undo there
+            pass
+        _export(current)
+
+
+def record_span(name: str, duration: float, status: str = "ok", **attributes) -> None:
+    """Record a span that ended just now, for work timed elsewhere such as a provider stream"""
+    if not tracing_enabled():
+        return
+    finished = _new_span(name, time.time() - duration, attributes)
+    finished.duration = duration
+    finished.status = status
+    _export(finished)
+
+
+def traced(name: str):
+    """Decorator running a function or coroutine function inside span(name)"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
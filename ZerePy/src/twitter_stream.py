@@ -0,0 +1,119 @@
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from src.background_stream import DEFAULT_QUEUE_SIZE, DEFAULT_WORKERS, BackgroundStream, BackoffPolicy
+from src.http_session import get_async_session
+from src.metrics import REGISTRY
+
+logger = logging.getLogger("twitter_stream")
+
+STREAM_URL = "https://api.twitter.com/2/tweets/search/stream"
+# Twitter sends a keep-alive newline every 20 seconds, silence for longer means a stalled connection
+DEFAULT_STALL_TIMEOUT = 30.0
+
+# Reconnect backoff recommended by Twitter: (first wait, growth, cap). Network errors
+# back off linearly, HTTP errors and rate limits exponentially.
+NETWORK_BACKOFF = (0.25, "linear", 16.0)
+HTTP_BACKOFF = (5.0, "exponential", 320.0)
+RATE_LIMIT_BACKOFF = (60.0, "exponential", 960.0)
+
+STREAM_TWEETS = REGISTRY.counter(
+    "zerepy_twitter_stream_tweets_total", "Tweets received from the filtered stream and their outcome", ["status"])
+STREAM_RECONNECTS = REGISTRY.counter(
+    "zerepy_twitter_stream_reconnects_total", "Filtered stream reconnects by cause", ["reason"])
+STREAM_QUEUE_DEPTH = REGISTRY.gauge(
+    "zerepy_twitter_stream_queue_depth", "Tweets waiting for a stream worker")
+
+
+class StreamHTTPError(Exception):
+    """The stream endpoint answered with an error status"""
+
+    def __init__(self, status: int, body: str):
+        super().__init__(f"Stream connection failed with status {status}: {body}")
+        self.status = status
+
+
+class StreamRuleError(Exception):
+    """The stream's filter rule could not be replaced"""
+
+
+class TwitterStreamConsumer(BackgroundStream):
+    """Keeps a filtered stream open and feeds its tweets to a pool of workers.
+
+    Tweets go into a queue of queue_size. When the workers fall behind, the reader waits
+    for room instead of buffering without limit, which slows reading from the socket.
+    A connection that sends nothing, not even a keep-alive, for stall_timeout seconds is
+    dropped. Every disconnect, and a failure to set the filter rule, is followed by a
+    reconnect after Twitter's recommended backoff.
+    """
+
+    logger = logger
+    label = "Twitter stream"
+    item_label = "tweet"
+    thread_name = "twitter-stream"
+    items_metric = STREAM_TWEETS
+    reconnects_metric = STREAM_RECONNECTS
+    queue_depth_metric = STREAM_QUEUE_DEPTH
+
+    def __init__(self, connection, filter_string: str, handler: Callable[[Dict[str, Any]], Awaitable[Any]],
+                 workers: int = DEFAULT_WORKERS, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 stall_timeout: float = DEFAULT_STALL_TIMEOUT):
+        super().__init__(handler, workers=workers, queue_size=queue_size)
+        self.connection = connection
+        self.filter_string = filter_string
+        self.stall_timeout = stall_timeout
+        self._rule_set = False
+
+    def _set_rule(self) -> None:
+        rules = self.connection._get_rules()
+        self.connection._delete_rules(rules)
+        self.connection._build_rule(self.filter_string)
+
+    async def _connect(self) -> None:
+        # The rule is set as part of the first attempt, so failing to set it is retried too
+        if not self._rule_set:
+            try:
+                await asyncio.to_thread(self._set_rule)
+            except Exception as e:
+                raise StreamRuleError(f"Could not set the stream rule: {e}") from e
+            self._rule_set = True
+        await self._read()
+
+    def _on_disconnect(self, error: Optional[BaseException]) -> Optional[Tuple[str, BackoffPolicy]]:
+        if error is None:
+            return "closed", NETWORK_BACKOFF
+        if isinstance(error, StreamRuleError):
+            logger.error(str(error))
+            return "rules", HTTP_BACKOFF
+        if isinstance(error, StreamHTTPError):
+            logger.error(str(error))
+            return ("rate_limited", RATE_LIMIT_BACKOFF) if error.status == 429 else ("http", HTTP_BACKOFF)
+        if isinstance(error, asyncio.TimeoutError):
+            logger.warning(f"No data from the Twitter stream for {self.stall_timeout}s, reconnecting")
+            return "stalled", NETWORK_BACKOFF
+        logger.warning(f"Twitter stream disconnected: {error}")
+        return "network", NETWORK_BACKOFF
+
+    async def _read(self) -> None:
+        import aiohttp
+
+        bearer_token = self.connection._get_credentials().get("TWITTER_BEARER_TOKEN")
+        headers = {"Authorization": f"Bearer {bearer_token}", "User-Agent": "v2FilteredStreamPython"}
+        # sock_read fails the read once the stream has been silent for stall_timeout
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=self.stall_timeout)
+        async with get_async_session("twitter_stream").get(STREAM_URL, headers=headers, timeout=timeout) as response:
+            if response.status != 200:
+                raise StreamHTTPError(response.status, await response.text())
+            self.connected = True
+            logger.info("Connected to the Twitter stream")
+            async for line in response.content:
+                line = line.strip()
+                if not line:
+                    continue  # keep-alive
+                data = json.loads(line)
+                if "data" not in data:
+                    logger.warning(f"Twitter stream message without data: {data}")
+                    continue
+                await self._enqueue(data["data"])
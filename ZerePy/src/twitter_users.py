@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from src.metrics import REGISTRY
+
+DEFAULT_MAX_USERS = 10000
+DEFAULT_USER_TTL = 3600
+# Ids per users lookup, the API maximum
+LOOKUP_BATCH_SIZE = 100
+
+UNKNOWN_USER = {"name": "Unknown", "username": "Unknown"}
+
+USER_CACHE_LOOKUPS = REGISTRY.counter(
+    "zerepy_twitter_user_cache_total", "Twitter user lookups answered by the user cache or the API", ["result"])
+
+
+class TwitterUserCache:
+    """LRU of Twitter user records (id -> name, username) kept for ttl seconds, shared by
+    every read that needs to know who wrote a tweet"""
+
+    def __init__(self, max_users: int = DEFAULT_MAX_USERS, ttl: float = DEFAULT_USER_TTL):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._users: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            user, stored_at = entry
+            if time.monotonic() - stored_at >= self.ttl:
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+            return user
+
+    def put(self, users: Iterable[Dict[str, Any]]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for user in users:
+                self._users[user["id"]] = ({"name": user.get("name"), "username": user.get("username")}, now)
+                self._users.move_to_end(user["id"])
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def resolve(self, user_ids: Iterable[str],
+                lookup: Callable[[List[str]], List[Dict[str, Any]]]) -> Dict[str, Dict[str, str]]:
+        """Records for user_ids, the ones not cached are fetched with lookup(ids), at most
+        LOOKUP_BATCH_SIZE ids per call"""
+        found, missing = {}, []
+        for user_id in dict.fromkeys(user_id for user_id in user_ids if user_id):
+            user = self.get(user_id)
+            if user is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = user
+        if found:
+            USER_CACHE_LOOKUPS.inc(len(found), result="hit")
+        if missing:
+            USER_CACHE_LOOKUPS.inc(len(missing), result="miss")
+            for start in range(0, len(missing), LOOKUP_BATCH_SIZE):
+                users = lookup(missing[start:start + LOOKUP_BATCH_SIZE])
+                self.put(users)
+                found.update((user["id"], {"name": user.get("name"), "username": user.get("username")})
+                             for user in users)
+        return found
+
+    def clear(self) -> None:
+        with self._lock:
+            self._users.clear()
+
+
+USER_CACHE = TwitterUserCache()
@@ -0,0 +1,293 @@
+import contextvars
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from src.metrics import LLM_CALL_SECONDS, LLM_TOKENS
+from src.tracing import record_span
+
+logger = logging.getLogger("usage")
+
+DEFAULT_LEDGER_PATH = ".zerepy/usage.sqlite"
+# Rough chars per token, only used when a provider does not report usage
+CHARS_PER_TOKEN = 4
+
+
+@dataclass
+class TokenUsage:
+    """Tokens and wall time of one or more LLM calls"""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    latency: float = 0.0
+    calls: int = 0
+    # Set when the provider did not report usage and tokens were estimated from text length
+    estimated: bool = False
+    provider: Optional[str] = None
+    model: Optional[str] = None
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, other: "TokenUsage") -> None:
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.cached_tokens += other.cached_tokens
+        self.latency += other.latency
+        self.calls += other.calls
+        self.estimated = self.estimated or other.estimated
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(asdict(self), latency=round(self.latency, 4), total_tokens=self.total_tokens)
+
+    def to_openai(self) -> Dict[str, Any]:
+        """OpenAI style usage block of a chat completion response"""
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "prompt_tokens_details": {"cached_tokens": self.cached_tokens},
+        }
+
+
+class UsageMeter:
+    """Thread safe running total of TokenUsage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usage = TokenUsage()
+
+    def add(self, usage: TokenUsage) -> None:
+        with self._lock:
+            self._usage.add(usage)
+
+    @property
+    def usage(self) -> TokenUsage:
+        with self._lock:
+            return TokenUsage(**asdict(self._usage))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self.usage.to_dict()
+
+
+@dataclass(frozen=True)
+class _Scope:
+    agent: Optional[str]
+    action: Optional[str]
+    meter: Optional[UsageMeter]
+    ledger: Optional["UsageLedger"]
+
+
+_scopes: contextvars.ContextVar[Tuple[_Scope, ...]] = contextvars.ContextVar("usage_scopes", default=())
+
+
+@contextmanager
+def usage_scope(agent: Optional[str] = None, action: Optional[str] = None, meter: Optional[UsageMeter] = None,
+                ledger: Optional["UsageLedger"] = None):
+    """Attribute LLM calls made inside the block to an agent and action, and add them to meter.
+
+    Scopes nest: every meter of the enclosing scopes sees a call, the innermost agent,
+    action and ledger are the ones recorded. Worker threads see the scope when started
+    with the caller's context (asyncio.to_thread, aiter_in_thread).
+    """
+    token = _scopes.set(_scopes.get() + (_Scope(agent, action, meter, ledger),))
+    try:
+        yield meter
+    finally:
+        try:
+            _scopes.reset(token)
+        except ValueError:
+            # Generators finalized from another context, nothing left to undo there
+            pass
+
+
+def _innermost(scopes: Sequence[_Scope], field: str):
+    for scope in reversed(scopes):
+        value = getattr(scope, field)
+        if value is not None:
+            return value
+    return None
+
+
+def record_usage(usage: TokenUsage) -> None:
+    """Add the usage of one provider call to the active scopes and the ledger"""
+    scopes = _scopes.get()
+    # A meter can be active in more than one enclosing scope, count the call once
+    for meter in {id(scope.meter): scope.meter for scope in scopes if scope.meter is not None}.values():
+        meter.add(usage)
+    ledger = _innermost(scopes, "ledger")
+    if ledger is not None:
+        try:
+            ledger.record(usage, agent=_innermost(scopes, "agent"), action=_innermost(scopes, "action"))
+        except Exception as e:
+            logger.warning(f"Could not write usage to the ledger: {e}")
+
+
+def _int(value) -> int:
+    return int(value) if isinstance(value, (int, float)) else 0
+
+
+class CallUsage:
+    """Usage of one provider call, recorded when the block exits.
+
+    Providers report the counts the API returns. When they do not, or the stream was
+    closed before the final usage chunk, tokens are estimated from the text length.
+    """
+
+    def __init__(self, provider: str, model: Optional[str], *prompt_parts: Optional[str]):
+        self.provider = provider
+        self.model = model
+        self._prompt_chars = sum(len(part) for part in prompt_parts if part)
+        self._completion_chars = 0
+        self._reported: Optional[TokenUsage] = None
+        self._started = None
+
+    def __enter__(self) -> "CallUsage":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        failed = exc_type is not None and not issubclass(exc_type, GeneratorExit)
+        usage = self.usage()
+        LLM_CALL_SECONDS.observe(usage.latency, provider=self.provider, status="error" if failed else "ok")
+        record_span(f"llm:{self.provider}", usage.latency, "error" if failed else "ok", model=self.model,
+                    prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens,
+                    estimated=usage.estimated)
+        if failed and self._reported is None and not self._completion_chars:
+            # Requests that failed before producing anything are not billed
+            return
+        LLM_TOKENS.inc(usage.prompt_tokens, provider=self.provider, kind="prompt")
+        LLM_TOKENS.inc(usage.completion_tokens, provider=self.provider, kind="completion")
+        LLM_TOKENS.inc(usage.cached_tokens, provider=self.provider, kind="cached")
+        record_usage(usage)
+
+    def report(self, prompt_tokens=None, completion_tokens=None, cached_tokens=None) -> None:
+        if prompt_tokens is None and completion_tokens is None:
+            return
+        self._reported = TokenUsage(_int(prompt_tokens), _int(completion_tokens), _int(cached_tokens))
+
+    def report_openai(self, usage) -> None:
+        """Usage object of an OpenAI style (chat) completion"""
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.report(getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None),
+                    getattr(details, "cached_tokens", None) if details is not None else None)
+
+    def track(self, deltas: Iterable[str]) -> Iterator[str]:
+        """Pass deltas through, counting the generated text"""
+        for delta in deltas:
+            self._completion_chars += len(delta)
+            yield delta
+
+    def usage(self) -> TokenUsage:
+        latency = time.perf_counter() - self._started if self._started is not None else 0.0
+        if self._reported is not None:
+            return TokenUsage(self._reported.prompt_tokens, self._reported.completion_tokens,
+                              self._reported.cached_tokens, latency, 1, False, self.provider, self.model)
+        return TokenUsage(-(-self._prompt_chars // CHARS_PER_TOKEN), -(-self._completion_chars // CHARS_PER_TOKEN),
+                          0, latency, 1, True, self.provider, self.model)
+
+
+class UsageLedger:
+    """Append-only SQLite log of every LLM call, queried by agent, provider and action"""
+
+    GROUP_FIELDS = ("agent", "provider", "model", "action")
+
+    def __init__(self, path: str = DEFAULT_LEDGER_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL NOT NULL, agent TEXT, provider TEXT, model TEXT, "
+            "action TEXT, prompt_tokens INTEGER NOT NULL, completion_tokens INTEGER NOT NULL, "
+            "cached_tokens INTEGER NOT NULL, latency REAL NOT NULL, estimated INTEGER NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS usage_ts ON usage (ts)")
+        self._db.commit()
+
+    def record(self, usage: TokenUsage, agent: Optional[str] = None, action: Optional[str] = None) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO usage (ts, agent, provider, model, action, prompt_tokens, completion_tokens, "
+                "cached_tokens, latency, estimated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), agent, usage.provider, usage.model, action, usage.prompt_tokens,
+                 usage.completion_tokens, usage.cached_tokens, usage.latency, int(usage.estimated)),
+            )
+
+    def query(self, agent: Optional[str] = None, provider: Optional[str] = None, action: Optional[str] = None,
+              since: Optional[float] = None, group_by: Sequence[str] = ("agent", "provider", "action")
+              ) -> List[Dict[str, Any]]:
+        """Usage totals per group, e.g. group_by=("action",) to find the most expensive actions"""
+        unknown = [field for field in group_by if field not in self.GROUP_FIELDS]
+        if unknown:
+            raise ValueError(f"Cannot group usage by {', '.join(unknown)}")
+        conditions, params = [], []
+        for field, value in (("agent", agent), ("provider", provider), ("action", action)):
+            if value is not None:
+                conditions.append(f"{field} = ?")
+                params.append(value)
+        if since is not None:
+            conditions.append("ts >= ?")
+            params.append(since)
+        columns = list(group_by)
+        aggregates = ["COUNT(*)", "SUM(prompt_tokens)", "SUM(completion_tokens)", "SUM(cached_tokens)",
+                      "SUM(latency)", "SUM(estimated)"]
+        sql = f"SELECT {', '.join(columns + aggregates)} FROM usage"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if columns:
+            sql += f" GROUP BY {', '.join(columns)}"
+        sql += " ORDER BY SUM(prompt_tokens) + SUM(completion_tokens) DESC"
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        results = []
+        for row in rows:
+            calls, prompt_tokens, completion_tokens, cached_tokens, latency, estimated = row[len(columns):]
+            if not calls:
+                continue
+            results.append(dict(
+                zip(columns, row[:len(columns)]),
+                calls=calls,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                cached_tokens=cached_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+                avg_latency=round(latency / calls, 4),
+                estimated_calls=estimated,
+            ))
+        return results
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_ledgers: Dict[str, UsageLedger] = {}
+_ledgers_lock = threading.Lock()
+
+
+def create_usage_ledger(config: Optional[Dict[str, Any]]) -> Optional[UsageLedger]:
+    """Ledger for the "usage_ledger" section of an agent JSON. The ledger is on by default,
+    {"enabled": false} turns it off. Agents writing to the same path share one ledger."""
+    config = config if isinstance(config, dict) else {"enabled": config is not False}
+    if not config.get("enabled", True):
+        return None
+    path = config.get("path", DEFAULT_LEDGER_PATH)
+    with _ledgers_lock:
+        ledger = _ledgers.get(path)
+        if ledger is None:
+            ledger = _ledgers[path] = UsageLedger(path)
+        return ledger